@@ -1,6 +1,7 @@
 import bpy
 import bmesh
 import math
+import numpy as np
 from mathutils.bvhtree import BVHTree
 from mathutils.geometry import intersect_ray_tri
 
@@ -56,12 +57,75 @@ class BlenderUtils:
         return distances
 
 
+    @staticmethod
+    def mesh_from_arrays(vertices, faces, name="mesh", mesh=None):
+        """
+        Create a mesh from numpy arrays with foreach_set, i.e. one memory copy per attribute instead of from_pydata.
+
+        vertices: (n, 3) coordinates
+        faces: (m, k) vertex indices, or a list of faces with different numbers of vertices
+        mesh: existing mesh whose geometry is replaced, otherwise a new mesh is created
+        """
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+        if isinstance(faces, list) and len({len(i) for i in faces}) > 1:
+            loop_totals = np.array([len(i) for i in faces], dtype=np.int32)
+            vertex_indices = np.concatenate([np.asarray(i, dtype=np.int32) for i in faces])
+        else:
+            faces = np.asarray(faces, dtype=np.int32)
+            faces = faces.reshape(-1, faces.shape[-1] if faces.ndim > 1 else 3)
+            loop_totals = np.full(len(faces), faces.shape[1], dtype=np.int32)
+            vertex_indices = np.ascontiguousarray(faces).ravel()
+        loop_starts = np.zeros(len(loop_totals), dtype=np.int32)
+        np.cumsum(loop_totals[:-1], out=loop_starts[1:])
+
+        if mesh is None:
+            mesh = bpy.data.meshes.new(name)
+        else:
+            mesh.clear_geometry()
+        mesh.vertices.add(len(vertices))
+        mesh.loops.add(len(vertex_indices))
+        mesh.polygons.add(len(loop_totals))
+        mesh.vertices.foreach_set("co", vertices.ravel())
+        mesh.loops.foreach_set("vertex_index", vertex_indices)
+        mesh.polygons.foreach_set("loop_start", loop_starts)
+        # Blender 4 derives loop_total from loop_start, it is read-only there
+        try:
+            mesh.polygons.foreach_set("loop_total", loop_totals)
+        except (AttributeError, TypeError, RuntimeError):
+            pass
+        mesh.update(calc_edges=True)
+        return mesh
+
+    @staticmethod
+    def mesh_to_arrays(mesh, matrix=None):
+        """
+        Read vertices and faces of a mesh with foreach_get. matrix: e.g. obj.matrix_world to get world coordinates.
+
+        Returns the vertices (n, 3) and the faces (m, k) if all faces have k vertices, otherwise a list of arrays.
+        """
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", vertices)
+        vertices = vertices.reshape(-1, 3).astype(float)
+        if matrix is not None:
+            matrix = np.array(matrix, dtype=float)
+            vertices = vertices @ matrix[:3, :3].T + matrix[:3, 3]
+
+        loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+        mesh.loops.foreach_get("vertex_index", vertex_indices)
+        if len(loop_totals) and (loop_totals == loop_totals[0]).all():
+            return vertices, vertex_indices[loop_starts[:, None] + np.arange(loop_totals[0])]
+        if not len(loop_totals):
+            return vertices, np.empty((0, 3), dtype=np.int32)
+        return vertices, [vertex_indices[start:start + total] for start, total in zip(loop_starts, loop_totals)]
+
     @staticmethod
     def add_testmesh(vertices, faces, name="testmesh"):
-        """Quick util function for development. Adds a mesh to the scene"""
-        mesh = bpy.data.meshes.new(name)
-        mesh.from_pydata(vertices, [], faces)
-        mesh.update()
+        """Quick util function for development. Adds a mesh to the scene. vertices and faces may be lists or numpy arrays."""
+        mesh = BlenderUtils.mesh_from_arrays(vertices, faces, name=name)
         obj = bpy.data.objects.new(name, mesh)
         scene = bpy.context.scene
         scene.collection.objects.link(obj)
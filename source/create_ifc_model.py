@@ -1,13 +1,13 @@
 import bpy
-import bmesh
 import json
 import ifcopenshell
 from ifcopenshell.api import run
-import mathutils
 import sys
 import os
 import numpy as np
 import random
+import tempfile
+from pathlib import Path
 import ifcopenshell.api.pset_template
 import ifcopenshell.validate
 
@@ -20,190 +20,303 @@ if dir_path not in sys.path:
 
 from ifcutils import IfcUtils
 from blenderutils import BlenderUtils
-from geotmodelling import interpolate_rbf, create_cuboid, prepare_points_from_connections, prepare_grid_to_mesh, create_fake_topography, create_topography_with_influence
+from tiledmodelling import export_block_model, interpolate_tiled
+from stratigraphy import layer_quantities
+from pipeline import Pipeline, content_hash
+from incremental import update_stack, changed_layers, update_model
+from projecttemplate import ProjectTemplate
+from geotmodelling import interpolate_rbf, create_cuboid, prepare_points_from_connections, prepare_grid_to_mesh, create_fake_topography, create_topography_with_influence, simplify_tin, sample_tin, interpolate_rbf_adaptive, build_stacked_volumes, enforce_conformance
 
 
-# Load project specific data
-with open(parent_path+"/project_data/bh_data.json", encoding="Latin1") as f:
-    bh_data = json.load(f) 
+# THE BUILD IS SPLIT INTO STAGES (see pipeline.py). Each stage gets the results of its input stages and is cached on disk,
+# so e.g. changing only pset values reuses the cached surfaces and volumes. IFC fragments are passed as serialized models
+# together with the ids of the entities used by later stages. Ids are kept by ifcopenshell.file.from_string.
 
+def load_ifc(result):
+    model = ifcopenshell.file.from_string(result["ifc"])
+    return model, {k: model.by_id(v) for k, v in result["ids"].items()}
 
-# Load Data from resources folder
-with open(parent_path+"/resources/farbcode_DIN4023.json", "r", encoding="Latin1") as f:
-    farbcode_DIN4023 = json.load(f)
-with open(parent_path+"/resources/mapping_DIN4023.json", "r", encoding="Latin1") as f:
-    mapping_DIN4023 = json.load(f)
-with open(parent_path+"/resources/mapping_hg_to_materialname.json", "r", encoding="Latin1") as f:
-    mapping_hg_to_materialname = json.load(f)
 
+def load_data(bh_fp, farbcode_fp, mapping_fp, materialname_fp):
+    # Load project specific data
+    with open(bh_fp, encoding="Latin1") as f:
+        bh_data = json.load(f)
 
-# Clear blender model from previous runs
-for i in bpy.data.objects:
-    bpy.data.objects.remove(i, do_unlink=True)
-for i in bpy.data.collections:
-    bpy.data.collections.remove(i, do_unlink=True)
-
-
-
-
-# Create a blank model
-model = ifcopenshell.file(schema="IFC4X3")
-
-# All projects must have one IFC Project element
-project = run("root.create_entity", model, ifc_class="IfcProject", name="Projekt_Fachsektionstage2025")
-project.Description = "Ein akademisches Projekt, das Teil des Beitrags von Johannes Beck zu den Fachsektionstagen Geotechnik 2025 in Würzburg ist"
-
-# Assigning without arguments defaults to metric units
-length_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="LENGTHUNIT") # Note: Default is mm, here meter (without prefix)
-area_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="AREAUNIT")
-money_unit = ifcopenshell.api.unit.add_monetary_unit(model, currency="EUR")
-mass_unit =  ifcopenshell.api.unit.add_si_unit(model, unit_type="MASSUNIT", prefix="KILO")
-angle_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="PLANEANGLEUNIT",) #RADIAN
-
-# Angles in degrees instead of radians.
-val = model.create_entity("IFCPLANEANGLEMEASURE", 1.74532925199433E-2)
-measure_unit = model.create_entity("IFCMEASUREWITHUNIT", UnitComponent=angle_unit, ValueComponent=val)
-dim_exp = model.create_entity("IFCDIMENSIONALEXPONENTS", 0,0,0,0,0,0,0)
-angle_unit_degrees = model.create_entity("IFCCONVERSIONBASEDUNIT", ConversionFactor=measure_unit, Name="DEGREE", UnitType="PLANEANGLEUNIT", Dimensions=dim_exp)
-
-# Mass unit kg_m3
-x1 = model.create_entity("IFCDERIVEDUNITELEMENT",mass_unit,1)
-x2 = model.create_entity("IFCDERIVEDUNITELEMENT",length_unit,-3)
-kg_per_m3 = model.create_entity("IFCDERIVEDUNIT", Elements = [x1,x2], UnitType="MASSDENSITYUNIT", Name="kg_per_m3")
-
-# g for reference.
-val = model.create_entity("IFCMASSMEASURE", 0.001)
-measure_unit = model.create_entity("IFCMEASUREWITHUNIT", UnitComponent=mass_unit, ValueComponent=val)
-dim_exp = model.create_entity("IFCDIMENSIONALEXPONENTS", 0,1,0,0,0,0,0)
-mass_unit_g = model.create_entity("IFCCONVERSIONBASEDUNIT", ConversionFactor=measure_unit, Name="GRAMM", UnitType="MASSUNIT", Dimensions=dim_exp)
-x1 = model.create_entity("IFCDERIVEDUNITELEMENT",mass_unit_g,1)
-x2 = model.create_entity("IFCDERIVEDUNITELEMENT",length_unit,-3)
-g_per_m3 = model.create_entity("IFCDERIVEDUNIT", Elements = [x1,x2], UnitType="MASSDENSITYUNIT", Name="g_per_m3")
-
-
-
-run("unit.assign_unit", model, units=[length_unit, area_unit, money_unit, angle_unit_degrees, kg_per_m3, g_per_m3])
-
-# Create the 3D context - for body representations
-context_3D = run("context.add_context", model, context_type="Model")
-body = run("context.add_context", model, context_type="Model",
-    context_identifier="Body", target_view="MODEL_VIEW", parent=context_3D)
-
-# Create a site, building, and storey. 
-site = run("root.create_entity", model, ifc_class="IfcSite", name="Baustelle_Fachsektionstage")
-building = run("root.create_entity", model, ifc_class="IfcBuilding", name="Bauwerk1")
-#storey = run("root.create_entity", model, ifc_class="IfcBuildingStorey", name="Aufschlussebene")
-#storey2 = run("root.create_entity", model, ifc_class="IfcBuildingStorey", name="Schichtenebene")
-
-
-# Assign according to IFC structure
-run("aggregate.assign_object", file=model, products=[site], relating_object=project)
-run("aggregate.assign_object", file=model, products=[building], relating_object=site)
-#run("aggregate.assign_object", file=model, products = [storey, storey2], relating_object=building)
-
-# Create Geomodel
-baugrundschichtenmodell = run("root.create_entity", model, ifc_class="IfcGeomodel", name="Baugrundschichtenmodell")
-baugrundaufschlussmodell = run("root.create_entity", model, ifc_class="IfcGeomodel", name="Baugrundaufschlussmodell")
-
-#run("aggregate.assign_object", file=model, products=[baugrundschichtenmodell, baugrundaufschlussmodell], relating_object=site)
-run("spatial.assign_container", file=model, products = [baugrundschichtenmodell, baugrundaufschlussmodell], relating_structure=site)
-
-
-
-for i in ["Auffuellung", "Kies", "Sand"]:
-    material = ifcopenshell.api.run("material.add_material", model, name=i)
-    #style = ifcopenshell.api.style.add_style(model)
-    style = run("style.add_style", model)
-    ifcopenshell.api.style.add_surface_style(model,
-        style=style, ifc_class="IfcSurfaceStyleShading", attributes={
-        "SurfaceColour": { 
-            "Name": "{}Style".format(i), 
-            "Red": farbcode_DIN4023[mapping_DIN4023[i]][0]/255, 
-            "Green": farbcode_DIN4023[mapping_DIN4023[i]][1]/255, 
-            "Blue": farbcode_DIN4023[mapping_DIN4023[i]][2]/255,
-            },
-        "Transparency": 0., # 0 is opaque, 1 is transparent
-        })
-    # Note: Material can be assigned to both object and materials. If directly assigned, it is used to overwrite    
-    ifcopenshell.api.run("style.assign_material_style", model, material=material, style=style, context=context_3D)
-
-# Create the profile used to construct boreholes
-profile = model.create_entity("IfcCircleProfileDef", ProfileName="300C", ProfileType="AREA",Radius=0.300) # Note: Watch the choses IFCLENGHTUNIT
-
-
-# Create the boreholes from the dict containing the data
-ifc_bhs = []
-ifc_subelements = []
-for bh_ind, bh_dict in enumerate(bh_data):
-    bh = run("root.create_entity", model, ifc_class="IfcBorehole", name=bh_dict["Name"])
-    transformation = IfcUtils.transform_mat(bh_dict["x"], bh_dict["y"], bh_dict["OK"])
-    #transformation = IfcUtils.transform_mat(0, 0, 0)
-    ifcopenshell.api.geometry.edit_object_placement(model, product=bh, matrix=transformation)    
-    ifc_bhs.append(bh)
-    
-    bh_layer_sublist = []
-    for layer_ind in range(len(bh_dict["Layerdata"]["UKs"])):
-        hg = bh_dict["Layerdata"]["Hauptgruppen"][layer_ind]
-        uk = bh_dict["Layerdata"]["UKs"][layer_ind]
-        # Note: The ifcopenshell.api.root.create entity handles the userdefined predefined type automatically
-        if layer_ind<10:
-            naming_helper = f"00{layer_ind}"
-        elif layer_ind<100:
-            naming_helper = f"0{layer_ind}"
-        elif layer_ind<1000:
-            naming_helper = f"{layer_ind}"
-        else:
-            raise ValueError("Your Borehole shall not have more than 1000 layer elements")
-        
-        layerelement = run("root.create_entity", model, ifc_class="IfcGeotechnicalStratum", name="{0}_{1}".format(bh_dict["Name"], naming_helper), predefined_type="ANSPRACHEBEREICH")
-        
-        if layer_ind == 0:
-            layer_thickness = uk
-        else:
-            layer_thickness = uk - bh_dict["Layerdata"]["UKs"][layer_ind-1]
-         
-        representation = ifcopenshell.api.geometry.add_profile_representation(model, context=body, profile=profile, depth=layer_thickness, 
-        placement_zx_axes = (mathutils.Vector((0.0, 0.0, 1.0)), mathutils.Vector((1.0, 0.0, 0.0))))
-        
-        if layer_ind == 0:
-            transformation = IfcUtils.transform_mat(bh_dict["x"], bh_dict["y"], bh_dict["OK"] - layer_thickness)
-        else:
-            transformation = IfcUtils.transform_mat(bh_dict["x"], bh_dict["y"], bh_dict["OK"] - bh_dict["Layerdata"]["UKs"][layer_ind-1] -layer_thickness)
-        ifcopenshell.api.geometry.edit_object_placement(model, product=layerelement, matrix=transformation)  
-        ifcopenshell.api.geometry.assign_representation(model, product=layerelement, representation=representation)
+    # Load Data from resources folder
+    with open(farbcode_fp, "r", encoding="Latin1") as f:
+        farbcode_DIN4023 = json.load(f)
+    with open(mapping_fp, "r", encoding="Latin1") as f:
+        mapping_DIN4023 = json.load(f)
+    with open(materialname_fp, "r", encoding="Latin1") as f:
+        mapping_hg_to_materialname = json.load(f)
+    return {"bh_data": bh_data, "farbcode_DIN4023": farbcode_DIN4023, "mapping_DIN4023": mapping_DIN4023,
+        "mapping_hg_to_materialname": mapping_hg_to_materialname}
 
-        bh_layer_sublist.append(layerelement)  
-    run("aggregate.assign_object", model, products=bh_layer_sublist, relating_object=bh)
-    ifc_subelements.append(bh_layer_sublist)   
 
-
-#run("aggregate.assign_object", file=model, products = ifc_bhs, relating_object=storey)
-#run("spatial.assign_container", file=model, products = ifc_bhs, relating_structure=storey)
-run("aggregate.assign_object", file=model, products = ifc_bhs, relating_object=baugrundaufschlussmodell)
-        
-# Assign materials by Hauptgruppe. Note: Hauptgruppen have been mapped to material names prior      
-layer_elems = [i for j in ifc_subelements for i in j]
-hgs = []
-for i in bh_data:
-    hgs.extend(i["Layerdata"]["Hauptgruppen"]) 
-for k, v in mapping_hg_to_materialname.items():
-    element_collector = []
-    for object_ind, hg in enumerate(hgs):
-        if hg == k:
-            element_collector.append(layer_elems[object_ind])
-    material = [i for i in model.by_type('IfcMaterial') if i.Name == v][0]   
-    ifcopenshell.api.material.assign_material(model, products=element_collector, material=material)    
+def ifc_header(data):
+    # Units, contexts, site/building, geomodels, DIN 4023 materials with styles and the pset template (see projecttemplate.py).
+    # The serialized template is cloned for the model, which keeps the ids of its entities.
+    template = ProjectTemplate.build(data["farbcode_DIN4023"], data["mapping_DIN4023"])
+    return {"ifc": template.ifc, "ids": template.ids}
 
 
+def borehole_materials(model, data):
+    return {hg: [i for i in model.by_type('IfcMaterial') if i.Name == v][0] for hg, v in data["mapping_hg_to_materialname"].items()}
 
 
+def boreholes(data, ifc_header, build_in_parallel=False, batch_size=50):
+    model, handles = ProjectTemplate(ifc_header["ifc"], ifc_header["ids"]).clone()
+    bh_data = data["bh_data"]
 
+    # Create the boreholes from the dict containing the data. Note: Hauptgruppen have been mapped to material names prior
+    materials = borehole_materials(model, data)
 
+    # With build_in_parallel the boreholes are created in worker processes on copies of the model and merged into a file.
+    # The model is then read from that file. Entities created so far keep their ids, hence the ids stay valid.
+    if build_in_parallel:
+        batches = [bh_data[i:i+batch_size] for i in range(0, len(bh_data), batch_size)]
+        model = IfcUtils.build_parallel(model, IfcUtils.add_boreholes, batches, parent_path+"/project_data/boreholes_merged.ifc",
+            context=handles["body"], profile=handles["profile"], relating_object=handles["baugrundaufschlussmodell"], materials=materials)
+    else:
+        #run("aggregate.assign_object", file=model, products = ifc_bhs, relating_object=storey)
+        #run("spatial.assign_container", file=model, products = ifc_bhs, relating_structure=storey)
+        IfcUtils.add_boreholes(model, bh_data, handles["body"], handles["profile"], relating_object=handles["baugrundaufschlussmodell"], materials=materials)
+    return {"ifc": model.to_string(), "ids": ifc_header["ids"]}
 
 
 # CREATE THE SUBSOIL VOLUMES
 # USING THE STACKED SURFACE APPROACH
 
+def surfaces(data, seed=0, custom_constraints=((0, 100, 3),), min_thickness=0.1, tile_size=512, neighbors=50, previous=None):
+    # previous: result of the last run. The contact surfaces are then only interpolated again near the edited boreholes.
+    bh_data = data["bh_data"]
+    # The noise of the topography is seeded, the cached surfaces are reproducible
+    rng = random.Random(seed)
+
+    # Create the meshes for soil volumes
+    # Set model extents.
+    x_min, x_max = min([i["x"] for i in bh_data])-2, max([i["x"] for i in bh_data])+3
+    y_min, y_max = min([i["y"] for i in bh_data])-2, max([i["y"] for i in bh_data])+3
+    z_min, z_max = min([i["OK"] - i["Layerdata"]["UKs"][-1] for i in bh_data]) - 1,  max([i["OK"] for i in bh_data])+1
+
+    # Topography
+    x_data = [i["x"] for i in bh_data]
+    y_data = [i["y"] for i in bh_data]
+    z_data = [i["OK"] for i in bh_data]
+    xyz_data = list(zip(x_data, y_data, z_data))
+    x_rbf, y_rbf, z_rbf = interpolate_rbf(xyz_data, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
+    vertices, faces = prepare_grid_to_mesh(x_rbf, y_rbf, z_rbf)
+
+    for v_ind, v in enumerate(vertices): # this would be much prettier with perlin noise or something like that
+        if min(BlenderUtils.compute_xy_distances(v, xyz_data)) < 0.1: # keep the points from the boreholes.
+            continue
+        elif v[2]<min(z_data):
+            vertices[v_ind] = [v[0], v[1], min(z_data) + 0.1* rng.random()]
+        else:
+            vertices[v_ind] = [v[0], v[1], v[2] + 0.1* rng.random() - 0.1*rng.random()]
+    z_topo = np.array(vertices)[:, 2].reshape(x_rbf.shape) # grid of the topography, top of the volumes
+
+    # Simplify the 1 m grid to a TIN. The borehole collars are kept exactly, the tolerance stays well below the 0.5 m of check IX
+    tin_vertices, tin_faces = simplify_tin(np.array(vertices, dtype=float), max_error=0.25, fixed_points=np.array(xyz_data, dtype=float))
+    # The top of the volumes is sampled from the exported TIN, so the terrain and the top of the soil body coincide at the grid points
+    z_tin = sample_tin(tin_vertices, x_rbf, y_rbf)
+    z_topo = np.where(np.isnan(z_tin), z_topo, z_tin)
+
+    # Contact points from Fill to all other points.
+    x_data, y_data, z_data = prepare_points_from_connections(bh_data, "A", ["S", "G"])
+    xyz_a = list(zip(x_data, y_data, z_data))
+    # Adaptive mesh of the contact surface for the display in Blender, fine near the boreholes and where it bends
+    mesh_a = interpolate_rbf_adaptive(xyz_a, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
+
+    # Contact points from S to G.
+    x_data, y_data, z_data = prepare_points_from_connections(bh_data, "G", ["S"])
+    xyz_g = list(zip(x_data, y_data, z_data))
+
+    #ADD CUSTOM CONSTRAINTS
+    xyz_g.extend(custom_constraints)
+
+    mesh_g = interpolate_rbf_adaptive(xyz_g, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
+
+    # The contact surfaces are interpolated tile by tile from the neighbors nearest data points (equal to interpolate_rbf
+    # as long as there are fewer data points), so large sites do not need the whole grid in memory at once.
+    # On the same grid, only the grid points whose nearest data points changed are interpolated again (see update_stack).
+    if previous is not None and np.array_equal(previous["x"], x_rbf) and np.array_equal(previous["y"], y_rbf):
+        (z_a, z_g), _ = update_stack(x_rbf, y_rbf, [previous["z_a"], previous["z_g"]], previous["bh_data"], bh_data,
+            [("A", ["S", "G"]), ("G", ["S"], custom_constraints)], neighbors=neighbors)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            tiled = interpolate_tiled([xyz_a, xyz_g], os.path.join(tmp, "contacts.npy"), xmin = x_min, xmax = x_max, ymin = y_min, ymax = y_max,
+                tile_size = tile_size, neighbors = neighbors, processes = 1)
+            z_a, z_g = np.load(tiled["path"])
+
+    # The layers are known by construction (A-G-S from top to bottom), layers pinching out are collapsed.
+    z_base = np.full(x_rbf.shape, z_min - 1.)
+    # The interpolated surfaces may cross each other. Each one truncates the ones below, layers thinner than min_thickness are dropped.
+    surface_stack = enforce_conformance(np.stack([z_topo, z_a, z_g, z_base]), rules=["erode", "erode", "erode", "erode"], min_thickness=min_thickness)
+    # Round to mm as the coordinates of the ifc geometry, so the integrated quantities match it exactly
+    surface_stack = np.round(surface_stack, 3)
+    return {"x": x_rbf, "y": y_rbf, "z_topo": z_topo, "z_a": z_a, "z_g": z_g, "mesh_a": mesh_a, "mesh_g": mesh_g, "stack": surface_stack,
+        "tin_vertices": tin_vertices, "tin_faces": tin_faces, "z_min": z_min, "z_max": z_max, "bh_data": bh_data}
+
+
+def update_surfaces(previous, data, **params):
+    return surfaces(data, previous=previous, **params)
+
+
+def volumes(surfaces, names=("A", "G", "S")):
+    # BUILD THE VOLUMES BETWEEN THE SURFACES. All surfaces share the grid, hence no boolean operations are needed.
+    x_rbf, y_rbf, surface_stack = surfaces["x"], surfaces["y"], surfaces["stack"]
+    # Quantities integrated on the grid, equal to the volume of the meshes.
+    return {"meshes": build_stacked_volumes(x_rbf, y_rbf, surface_stack, names=list(names)),
+        "quantities": layer_quantities(x_rbf, y_rbf, surface_stack, names=list(names)), "x": x_rbf, "y": y_rbf, "stack": surface_stack}
+
+
+def update_volumes(previous, surfaces, names=("A", "G", "S")):
+    # Only the layers whose top or bottom changed are built again. Each layer depends on its clipped top and bottom only.
+    x_rbf, y_rbf, surface_stack = surfaces["x"], surfaces["y"], surfaces["stack"]
+    if not (np.array_equal(previous["x"], x_rbf) and np.array_equal(previous["y"], y_rbf)):
+        return volumes(surfaces, names=names)
+    meshes, quantities = dict(previous["meshes"]), dict(previous["quantities"])
+    clipped = np.minimum.accumulate(surface_stack, axis=0)
+    for name in changed_layers(previous["stack"], surface_stack, list(names)):
+        ind = list(names).index(name)
+        meshes.update(build_stacked_volumes(x_rbf, y_rbf, clipped[ind:ind + 2], names=[name]))
+        quantities.update(layer_quantities(x_rbf, y_rbf, clipped[ind:ind + 2], names=[name]))
+    return {"meshes": meshes, "quantities": quantities, "x": x_rbf, "y": y_rbf, "stack": surface_stack}
+
+
+def geometry(data, boreholes, surfaces, volumes):
+    model, handles = load_ifc(boreholes)
+    body, site, baugrundschichtenmodell = handles["body"], handles["site"], handles["baugrundschichtenmodell"]
+
+    #####################################################################
+    # ADD TOPOGRAPHY TO IFC FILE
+    topograhy = run("root.create_entity", model, ifc_class="IfcGeographicElement", predefined_type="TERRAIN", name="Topography")
+    representation = IfcUtils.add_triangulated_representation(model, context=body, vertices=surfaces["tin_vertices"], faces=surfaces["tin_faces"]) # IfcTriangulatedFaceSet, coordinates rounded to mm
+    ifcopenshell.api.geometry.assign_representation(model, product=topograhy, representation=representation)
+    run("spatial.assign_container", file=model, products = [topograhy], relating_structure=site)
+
+    #####################################################################
+    # ADD SOIL LAYERS TO IFC FILE
+    ifc_volumes = []
+    for name, (vertices, faces) in volumes["meshes"].items():
+        if not len(faces):
+            continue
+        # Create entities
+        vol_element = run("root.create_entity", model, ifc_class="IfcGeotechnicalStratum", predefined_type="SOLID", name=name)
+        # Create their geometries based on the volume meshes
+        # Assign representations
+        # Assign material (Materials with styles have already been created for the boreholes)
+        representation = IfcUtils.add_triangulated_representation(model, context=body, vertices=vertices, faces=faces, closed=True)
+
+        ifcopenshell.api.geometry.assign_representation(model, product=vol_element, representation=representation)
+        run("aggregate.assign_object", model, products=[vol_element], relating_object=baugrundschichtenmodell)
+        #run("spatial.assign_container", file=model, products = [vol_element], relating_structure=site)
+
+        #run("spatial.assign_container", file=model, products = [vol_element], relating_structure=storey2)
+
+        ifc_volumes.append(vol_element)
+
+    # Assign materials by Hauptgruppe. Note: Hauptgruppen have been mapped to material names prior
+    IfcUtils.assign_materials(model, ifc_volumes, [data["mapping_hg_to_materialname"].get(i.Name) for i in ifc_volumes])
+
+    # Set attributes
+    for i in ifc_volumes:
+        i.Description = "A volume representing a subsoil layer."
+    return {"ifc": model.to_string(), "ids": boreholes["ids"], "header": content_hash({k: v for k, v in data.items() if k != "bh_data"}),
+        "bh_data": data["bh_data"], "x": surfaces["x"], "y": surfaces["y"], "stack": surfaces["stack"]}
+
+
+def update_geometry(previous, data, boreholes, surfaces, volumes):
+    # The previous model is updated (see incremental.update_model) if only the boreholes changed: the changed layers are
+    # meshed again, the edited boreholes are created again and the topography is replaced.
+    header = content_hash({k: v for k, v in data.items() if k != "bh_data"})
+    if previous["header"] != header or not (np.array_equal(previous["x"], surfaces["x"]) and np.array_equal(previous["y"], surfaces["y"])):
+        return geometry(data, boreholes, surfaces, volumes)
+    model, handles = load_ifc(previous)
+    update_model(model, handles["body"], surfaces["x"], surfaces["y"], previous["stack"], surfaces["stack"], list(volumes["meshes"]),
+        previous["bh_data"], data["bh_data"], handles["profile"], bh_relating_object=handles["baugrundaufschlussmodell"],
+        materials=borehole_materials(model, data), layer_relating_object=handles["baugrundschichtenmodell"],
+        layer_materials=data["mapping_hg_to_materialname"], meshes=volumes["meshes"])
+
+    topograhy = [i for i in model.by_type("IfcGeographicElement") if i.Name == "Topography"][0]
+    representation = IfcUtils.add_triangulated_representation(model, context=handles["body"], vertices=surfaces["tin_vertices"], faces=surfaces["tin_faces"])
+    IfcUtils.replace_representation(model, topograhy, representation)
+    for i in model.by_type("IfcGeotechnicalStratum"):
+        if i.PredefinedType == "SOLID":
+            i.Description = "A volume representing a subsoil layer."
+    return {"ifc": model.to_string(), "ids": previous["ids"], "header": header,
+        "bh_data": data["bh_data"], "x": surfaces["x"], "y": surfaces["y"], "stack": surfaces["stack"]}
+
+
+def properties(geometry, volumes, solid_stratum_capacity, borehole_common, wichte_feucht=19_000., wichte_unter_auftrieb=(0., 30., 19.8)):
+    model, handles = load_ifc(geometry)
+    kg_per_m3, g_per_m3 = handles["kg_per_m3"], handles["g_per_m3"]
+    ifc_volumes = [i for i in model.by_type("IfcGeotechnicalStratum") if i.PredefinedType=="SOLID"]
+    ifc_bhs = model.by_type("IfcBorehole")
+
+    # Assign properties to the elements in ifc_bhs and ifc_volumnes
+
+    # All psets and qtos are written as tables (IfcUtils.add_property_table). The psets of the soil layers are not shared
+    # as single ones are edited below to showcase the tests. All boreholes share one Pset_BoreholeCommon.
+
+    # Add a Pset for which a standard template is provided. See: https://ifc43-docs.standards.buildingsmart.org/IFC/RELEASE/IFC4x3/HTML/lexical/Pset_SolidStratumCapacity.htm
+    # Other ones are e.g. https://ifc43-docs.standards.buildingsmart.org/IFC/RELEASE/IFC4x3/HTML/lexical/Pset_SolidStratumComposition.htm
+    # Columns and measure types are taken from the template, unknown keys raise a ValueError
+    columns = IfcUtils.template_columns(model, "Pset_SolidStratumCapacity", [k for i in solid_stratum_capacity.values() for k in i])
+    elements = [p for p in ifc_volumes if p.Name in solid_stratum_capacity]
+    IfcUtils.add_property_table(model, elements, "Pset_SolidStratumCapacity", columns,
+        [[solid_stratum_capacity[p.Name].get(i[0]) for i in columns] for p in elements], share=False)
+
+    # Add a QTO for the soil layer elements including the volume. Integrated on the grid, equal to the volume of the meshes.
+    quantities = volumes["quantities"]
+    IfcUtils.add_quantity_table(model, ifc_volumes, "Qto_VolumetricStratumBaseQuantities", [("Volume", "IfcQuantityVolume"), ("PlanArea", "IfcQuantityArea")],
+        [[quantities[elem.Name]["volume"], quantities[elem.Name]["area"]] for elem in ifc_volumes], share=False)
+
+    columns = IfcUtils.template_columns(model, "Pset_BoreholeCommon", borehole_common)
+    IfcUtils.add_property_table(model, ifc_bhs, "Pset_BoreholeCommon", columns, [[borehole_common.get(i[0]) for i in columns]] * len(ifc_bhs))
+
+    # Add custom properties using the custom property template of the project template. The bounded value
+    # WichteUnterAuftrieb is given as (lower, upper, set point).
+    template = handles["pset_template"]
+    columns = [("WichteFeucht", "IfcMassDensityMeasure", g_per_m3), ("IsRelevant", "IfcBoolean", None), ("WichteUnterAuftrieb", "IfcMassDensityMeasure", kg_per_m3)]
+    IfcUtils.add_property_table(model, ifc_volumes, "Fachsektionstage2025", columns,
+        [[wichte_feucht, True, tuple(wichte_unter_auftrieb)]] * len(ifc_volumes), template=template, share=False)
+    return {"ifc": model.to_string(), "ids": geometry["ids"]}
+
+
+pipeline = Pipeline(parent_path+"/project_data/cache")
+pipeline.add("data", load_data, bh_fp=Path(parent_path+"/project_data/bh_data.json"),
+    farbcode_fp=Path(parent_path+"/resources/farbcode_DIN4023.json"), mapping_fp=Path(parent_path+"/resources/mapping_DIN4023.json"),
+    materialname_fp=Path(parent_path+"/resources/mapping_hg_to_materialname.json"))
+pipeline.add("ifc_header", ifc_header, inputs=["data"])
+pipeline.add("boreholes", boreholes, inputs=["data", "ifc_header"], build_in_parallel=False)
+pipeline.add("surfaces", surfaces, inputs=["data"], update=update_surfaces, seed=0, custom_constraints=((0, 100, 3),), min_thickness=0.1, tile_size=512, neighbors=50)
+pipeline.add("volumes", volumes, inputs=["surfaces"], update=update_volumes, names=("A", "G", "S"))
+# Editing bh_data.json updates the surfaces, volumes and geometry of the last run instead of building them again
+pipeline.add("geometry", geometry, inputs=["data", "boreholes", "surfaces", "volumes"], update=update_geometry)
+pipeline.add("properties", properties, inputs=["geometry", "volumes"],
+    solid_stratum_capacity={
+        "S": {"CohesionBehaviour": 0, "FrictionAngle": 32.5, "PoisonsRatio":None},
+        "A": {"CohesionBehaviour": 5, "FrictionAngle": 15, "PoisonsRatio":0.2},
+        "G": {"CohesionBehaviour": 0, "FrictionAngle": 40, "PoisonsRatio":0.2}},
+    borehole_common={"BoreholeState": "INSTALLED", "GroundwaterDepth":None})
+results = pipeline.run()
+print(pipeline.report())
+
+model, handles = load_ifc(results["properties"])
+surface_results, volume_meshes = results["surfaces"], results["volumes"]["meshes"]
+x_rbf, y_rbf, surface_stack = surface_results["x"], surface_results["y"], surface_results["stack"]
+z_min, z_max = surface_results["z_min"], surface_results["z_max"]
+
+
+# SHOW THE SURFACES AND VOLUMES IN BLENDER
+# Clear blender model from previous runs
+for i in bpy.data.objects:
+    bpy.data.objects.remove(i, do_unlink=True)
+for i in bpy.data.collections:
+    bpy.data.collections.remove(i, do_unlink=True)
+
 # Create a collections for structuring the model / surface
 main_coll_name = "GeologicalModelling"
 srf_coll_name, base_coll_name, topo_coll_name, vol_coll_name = "GeologicalSurfaces", "Base", "Topography", "GeologicalVolumes"
@@ -217,300 +330,52 @@ vol_collection = bpy.data.collections.new(vol_coll_name)
 for i in [srf_coll_name, base_coll_name, topo_coll_name, vol_coll_name]:
     bpy.data.collections[main_coll_name].children.link(bpy.data.collections[i])
 
-# Create the meshes for soil volumes
-# Set model extents.
-x_min, x_max = min([i["x"] for i in bh_data])-2, max([i["x"] for i in bh_data])+3
-y_min, y_max = min([i["y"] for i in bh_data])-2, max([i["y"] for i in bh_data])+3
-z_min, z_max = min([i["OK"] - i["Layerdata"]["UKs"][-1] for i in bh_data]) - 1,  max([i["OK"] for i in bh_data])+1
-
-# create base model
-base_v, base_f = create_cuboid(x_min+1, y_min+1, z_min-1, x_max-2, y_max-2, z_max+2) # reduce size so intersection is granted
-base_obj, cuboid_mesh = BlenderUtils.add_testmesh(base_v, base_f, name="Main")
-bpy.data.collections[base_coll_name].objects.link(base_obj)
-for collection in base_obj.users_collection:
-    if collection.name!=base_coll_name:
-        collection.objects.unlink(base_obj)
-
-# Topography
-x_data = [i["x"] for i in bh_data]
-y_data = [i["y"] for i in bh_data]
-z_data = [i["OK"] for i in bh_data]
-xyz_data = list(zip(x_data, y_data, z_data))
-x_rbf, y_rbf, z_rbf = interpolate_rbf(xyz_data, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
-vertices, faces = prepare_grid_to_mesh(x_rbf, y_rbf, z_rbf)             
-
-for v_ind, v in enumerate(vertices): # this would be much prettier with perlin noise or something like that
-    if min(BlenderUtils.compute_xy_distances(v, xyz_data)) < 0.1: # keep the points from the boreholes.
-        continue
-    elif v[2]<min(z_data):
-        vertices[v_ind] = [v[0], v[1], min(z_data) + 0.1* random.random()]
-    else:
-        vertices[v_ind] = [v[0], v[1], v[2] + 0.1* random.random() - 0.1*random.random()]
-
-
-#####################################################################
-# ADD TOPOGRAPHY TO IFC FILE
-topograhy = run("root.create_entity", model, ifc_class="IfcGeographicElement", predefined_type="TERRAIN", name="Topography")
-faces = [list(i) for i in faces]
-vertices = [[float(i[0]),float(i[1]),float(i[2])] for i in vertices] 
-representation = ifcopenshell.api.geometry.add_mesh_representation(model, context=body, vertices=[vertices], faces=[faces]) # Note: Other representations might be suited 
-ifcopenshell.api.geometry.assign_representation(model, product=topograhy, representation=representation)
-run("spatial.assign_container", file=model, products = [topograhy], relating_structure=site)
-
-#####################################################################
-
-topo_obj, topo_mesh = BlenderUtils.add_testmesh(vertices, faces, name="Topo")
+topo_obj, topo_mesh = BlenderUtils.add_testmesh(surface_results["tin_vertices"], surface_results["tin_faces"], name="Topo")
 bpy.data.collections[topo_coll_name].objects.link(topo_obj)
 for collection in topo_obj.users_collection:
     if collection.name!=topo_coll_name:
-        collection.objects.unlink(topo_obj)  
+        collection.objects.unlink(topo_obj)
 
-# Contact points from Fill to all other points.
-x_data, y_data, z_data = prepare_points_from_connections(bh_data, "A", ["S", "G"])    
-xyz_data = list(zip(x_data, y_data, z_data))
-x_rbf, y_rbf, z_rbf = interpolate_rbf(xyz_data, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
-vertices, faces = prepare_grid_to_mesh(x_rbf, y_rbf, z_rbf)             
+vertices, faces = surface_results["mesh_a"]
 srf_a, msh_a = BlenderUtils.add_testmesh(vertices, faces, "A_GS")
 bpy.data.collections[srf_coll_name].objects.link(srf_a)
 for collection in srf_a.users_collection:
     if collection.name!=srf_coll_name:
-        collection.objects.unlink(srf_a)  
+        collection.objects.unlink(srf_a)
 
-# Contact points from S to G.
-x_data, y_data, z_data = prepare_points_from_connections(bh_data, "G", ["S"])    
-xyz_data = list(zip(x_data, y_data, z_data))
-
-#ADD CUSTOM CONSTRAINTS
-xyz_data.append((0,100, 3))
-
-
-x_rbf, y_rbf, z_rbf = interpolate_rbf(xyz_data, xmin = x_min, ymin = y_min, xmax = x_max, ymax = y_max)
-vertices, faces = prepare_grid_to_mesh(x_rbf, y_rbf, z_rbf)             
+vertices, faces = surface_results["mesh_g"]
 srf_b, msh_b = BlenderUtils.add_testmesh(vertices, faces, name="G_S")
 bpy.data.collections[srf_coll_name].objects.link(srf_b)
 for collection in srf_b.users_collection:
     if collection.name!=srf_coll_name:
-        collection.objects.unlink(srf_b)  
-
-
-
-# PERFORM THE CUTTING. KEEP THE SURFACES IN THEIR COLLECETION
+        collection.objects.unlink(srf_b)
 
-# SORT THE SURFACES. Note: They are passed in an ordered list later on. This is just for visualtization 
-# Note: Blender sorts them by alphabetical order by default. Hence, we just add prefixes.
-collection = bpy.data.collections.get(srf_coll_name)
+# SORT THE SURFACES. Note: Blender sorts them by alphabetical order by default. Hence, we just add prefixes.
 srf_b.name = "0_" + srf_b.name
-    
 
-# START WITH THE TOPOLOGY. The part above the topology is dropped.
-m1, m2, org_mesh, org_surface = BlenderUtils.split_with_surface(mesh_name="Main", surface_name="Topo", keep_original_mesh=True, keep_original_surface=True)
+for name, (vertices, faces) in volume_meshes.items():
+    obj, mesh = BlenderUtils.add_testmesh(vertices, faces, name=name)
+    bpy.data.collections[vol_coll_name].objects.link(obj)
+    for collection in obj.users_collection:
+        if collection.name!=vol_coll_name:
+            collection.objects.unlink(obj)
 
-# Sort the results of the intersection in the corresponding collections
-bpy.data.collections[vol_coll_name].objects.link(m1)
-for collection in m1.users_collection:
-    if collection.name!=vol_coll_name:
-        collection.objects.unlink(m1)  
-
-bpy.data.objects.remove(m2, do_unlink=True)
-
-bpy.data.collections[topo_coll_name].objects.link(org_surface)
-for collection in org_surface.users_collection:
-    if collection.name!=topo_coll_name:
-        collection.objects.unlink(org_surface)  
-
-bpy.data.collections[base_coll_name].objects.link(org_mesh)
-for collection in org_mesh.users_collection:
-    if collection.name!=base_coll_name:
-        collection.objects.unlink(org_mesh)
-
-# Hide the main body
-org_mesh.hide_viewport = True
-
-# Cut all volume meshes with the next surfaces. THIS HAS THE BE A CLEAN CUT THROUGH!!
-
-
-for srf in [srf_b, srf_a]:
-    for mesh in bpy.data.collections[vol_coll_name].all_objects:
-        if not BlenderUtils.intersection_check([mesh.name, srf.name]):
-            continue
-
-        m1, m2, org_mesh, org_surface = BlenderUtils.split_with_surface(mesh_name=mesh.name, surface_name=srf.name, keep_original_mesh=False, keep_original_surface=True)
-
-
-        if m1.name not in [i.name for i in bpy.data.collections[vol_coll_name].objects]:
-            bpy.data.collections[vol_coll_name].objects.link(m1)
-            for collection in m1.users_collection:
-                if collection.name!=vol_coll_name:
-                    collection.objects.unlink(m1)
-            
-        if m2.name not in [i.name for i in bpy.data.collections[vol_coll_name].objects]:        
-            bpy.data.collections[vol_coll_name].objects.link(m2)
-            for collection in m1.users_collection:
-                if collection.name!=vol_coll_name:
-                    collection.objects.unlink(m2)  
-
-        if org_surface.name not in [i.name for i in bpy.data.collections[srf_coll_name].objects]:     
-            bpy.data.collections[srf_coll_name].objects.link(org_surface)
-            for collection in org_surface.users_collection:
-                if collection.name!=srf_coll_name:
-                    collection.objects.unlink(org_surface)  
-    
-
-# Lazy identification of subsoil volumes as we know the order to be A-G-S.
-z_max_collector = []
-for m in bpy.data.collections[vol_coll_name].objects:
-    bm = bmesh.new()
-    bm.from_mesh(m.data)
-    zmax = max([i.co.z for i in bm.verts])
-    z_max_collector.append(zmax)
-    bm.free()
-
-names = [i.name for i in bpy.data.collections[vol_coll_name].objects]
-names = [x for _, x in sorted(zip(z_max_collector, names), key=lambda x: x[0], reverse=True)]
-
-layernames = ["A", "G", "S"]
-for name_ind, name in enumerate(names):
-    obj = bpy.data.collections[vol_coll_name].objects[name]
-    obj.name = layernames[name_ind]
-
-
-# FIX THE ORIENTATIONS OF MESH FAXES
-bpy.ops.object.select_all(action='DESELECT')
-for name_ind, name in enumerate(layernames):
-    obj = bpy.data.objects[name]
-    obj.select_set(True)
-for obj in bpy.context.selected_objects:
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.mode_set(mode="EDIT")
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.normals_make_consistent(inside=False)
-    bpy.ops.object.mode_set(mode="OBJECT")
-
-
-# Hide the blender collections. Note: This has to be done after fixing the face orientations.
-bpy.data.collections[topo_coll_name].hide_viewport = True  
-bpy.data.collections[srf_coll_name].hide_viewport = True  
-bpy.data.collections[vol_coll_name].hide_viewport = True  
-
-
-# ADD SOIL LAYERS TO IFC FILE
-ifc_volumes = []
-for obj in bpy.data.collections[vol_coll_name].objects:
-    # Create entities
-    vol_element = run("root.create_entity", model, ifc_class="IfcGeotechnicalStratum", predefined_type="SOLID", name=obj.name)
-    # Create their geometries based on the meshes
-    # Assign representations
-    # Assign material (Materials with styles have already been created for the boreholes)
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    bm.faces.ensure_lookup_table()
-    bm.verts.ensure_lookup_table()
-    vertices, faces = [], []
-    for f in bm.faces:
-        faces.append([v.index for v in f.verts])
-    for v in bm.verts:
-        vertices.append(v.co.to_tuple())
-    vertices = [vertices]
-    faces = [faces]
-    bm.free()
-    #vertices = [[(0.,0.,0.), (0.,2.,0.), (2.,2.,0.), (2.,0.,0.), (1.,1.,1.)]]
-    #faces = [[(0,1,2,3), (0,4,1), (1,4,2), (2,4,3), (3,4,0)]]
-    representation = ifcopenshell.api.geometry.add_mesh_representation(model, context=body, vertices=vertices, faces=faces)
-    
-    ifcopenshell.api.geometry.assign_representation(model, product=vol_element, representation=representation)
-    run("aggregate.assign_object", model, products=[vol_element], relating_object=baugrundschichtenmodell)
-    #run("spatial.assign_container", file=model, products = [vol_element], relating_structure=site)
-    
-    #run("spatial.assign_container", file=model, products = [vol_element], relating_structure=storey2)
-
-
-    # Assign materials by Hauptgruppe. Note: Hauptgruppen have been mapped to material names prior      
-
-    for k, v in mapping_hg_to_materialname.items():
-        element_collector = []
-
-        if obj.name == k:
-            element_collector.append(vol_element)
-            material = [i for i in model.by_type('IfcMaterial') if i.Name == v][0]   
-            ifcopenshell.api.material.assign_material(model, products=element_collector, material=material)    
-            break
-
-    ifc_volumes.append(vol_element)
-
-
-# Set attributes
-for i in ifc_volumes:
-    i.Description = "A volume representing a subsoil layer."
-
-
-# Assign properties to the elements in ifc_bhs and ifc_volumnes
-
-# Add a Pset for which a standard template is provided. See: https://ifc43-docs.standards.buildingsmart.org/IFC/RELEASE/IFC4x3/HTML/lexical/Pset_SolidStratumCapacity.htm
-# Other ones are e.g. https://ifc43-docs.standards.buildingsmart.org/IFC/RELEASE/IFC4x3/HTML/lexical/Pset_SolidStratumComposition.htm
-p = [i for i in ifc_volumes if i.Name=="S"][0]
-Pset_SolidStratumCapacity = ifcopenshell.api.pset.add_pset(model, product=p, name="Pset_SolidStratumCapacity")
-ifcopenshell.api.pset.edit_pset(model, pset=Pset_SolidStratumCapacity, properties={"CohesionBehaviour": 0, "FrictionAngle": 32.5, "PoisonsRatio":None}, should_purge=False)
-
-p = [i for i in ifc_volumes if i.Name=="A"][0]
-Pset_SolidStratumCapacity = ifcopenshell.api.pset.add_pset(model, product=p, name="Pset_SolidStratumCapacity")
-ifcopenshell.api.pset.edit_pset(model, pset=Pset_SolidStratumCapacity, properties={"CohesionBehaviour": 5, "FrictionAngle": 15, "PoisonsRatio":0.2}, should_purge=False)
-
-p = [i for i in ifc_volumes if i.Name=="G"][0]
-Pset_SolidStratumCapacity = ifcopenshell.api.pset.add_pset(model, product=p, name="Pset_SolidStratumCapacity")
-ifcopenshell.api.pset.edit_pset(model, pset=Pset_SolidStratumCapacity, properties={"CohesionBehaviour": 0, "FrictionAngle": 40, "PoisonsRatio":0.2}, should_purge=False)
-
-# Add a QTO for the soil layer elements including the volume.
-settings = ifcopenshell.geom.settings()
-elems = model.by_type("IfcGeotechnicalStratum")
-elems = [i for i in elems if i.PredefinedType=="SOLID"]
-for elem in elems:
-    qto = ifcopenshell.api.pset.add_qto(model, product=elem, name="Qto_VolumetricStratumBaseQuantities")
-    shape = ifcopenshell.geom.create_shape(settings, elem)
-    volume = ifcopenshell.util.shape.get_volume(shape.geometry)
-    ifcopenshell.api.pset.edit_qto(model, qto=qto, properties={"Volume": volume})
-
-for bh in ifc_bhs:
-    Pset_BoreholeCommon = ifcopenshell.api.pset.add_pset(model, product=bh, name="Pset_BoreholeCommon")
-    ifcopenshell.api.pset.edit_pset(model, pset=Pset_BoreholeCommon, properties={"BoreholeState": "INSTALLED", "GroundwaterDepth":None}, should_purge=False)
-
-
-# Add custom properties using a custom property template
-template = ifcopenshell.api.pset_template.add_pset_template(model, name="Fachsektionstage2025_template")
-prop1 = ifcopenshell.api.pset_template.add_prop_template(model, pset_template=template, name="WichteFeucht", description="Feuchtwichte des Bodens", template_type="P_SINGLEVALUE", primary_measure_type="IfcMassDensityMeasure") #kg/m3
-prop1.PrimaryUnit = g_per_m3
-prop1 = ifcopenshell.api.pset_template.add_prop_template(model, pset_template=template, name="WichteUnterAuftrieb", description="Wichte des Bodens unter Auftrieb", template_type="P_BOUNDEDVALUE", primary_measure_type="IfcMassDensityMeasure") #kg/m3
-prop1.PrimaryUnit = kg_per_m3
-prop1.SecondaryUnit = kg_per_m3
-
-#b1 = ifcopenshell.create_entity("IfcPropertySingleValue", Name="LowerBound", NominalValue= model.create_entity("IfcReal", 0))
-#b2 = ifcopenshell.create_entity("IfcPropertySingleValue", Name="UpperBound", NominalValue= model.create_entity("IfcReal", 10.))
-#val = ifcopenshell.create_entity("IfcPropertySingleValue", Name="ActualValue", NominalValue= model.create_entity("IfcReal", 9))
-#boundedval = ifcopenshell.create_entity("IfcPropertyBoundedValue", Name="TestProperty", Description="A bounded Value", LowerBoundValue=b1, UpperBoundValue=b2)
-#boundedval.SetPointValue = val
-#print(dir(boundedval))
-
-
-for p in ifc_volumes:
-    pset = ifcopenshell.api.pset.add_pset(model, product=p, name="Fachsektionstage2025")
-    ifcopenshell.api.pset.edit_pset(model, pset=pset, properties={"WichteFeucht": model.create_entity("IfcMassDensityMeasure", 19_000.), "IsRelevant": True}, pset_template=template) # Note: by setting the properties this way, no units from the template are passed. Yet, the mesasure type is passed
-
-    # Edit the property WichteFeucht
-    prop_wichte_feucht = [i for i in pset.HasProperties if i.Name == "WichteFeucht"][0]
-    prop_wichte_feucht.Unit = g_per_m3
-
-    # Add a bounded value without using the PropertySetTemplate
-    boundedval = model.create_entity("IfcPropertyBoundedValue", Name="WichteUnterAuftrieb",  LowerBoundValue=model.create_entity("IfcMassDensityMeasure", 0.), 
-                                     UpperBoundValue=model.create_entity("IfcMassDensityMeasure", 30.))
-    
-    boundedval.SetPointValue = model.create_entity("IfcMassDensityMeasure", 19.8)    
-    boundedval.Unit = kg_per_m3
-    pset.HasProperties = pset.HasProperties + (boundedval,)
+# Hide the blender collections.
+bpy.data.collections[topo_coll_name].hide_viewport = True
+bpy.data.collections[srf_coll_name].hide_viewport = True
+bpy.data.collections[vol_coll_name].hide_viewport = True
 
 
 # Save file and load the project
+# Merge identical points, directions and placements. Properties are kept separate as some are modified below.
+IfcUtils.compact_model(model)
 fp = parent_path+"/project_data/script_output_4x3.ifc"
 model.write(fp)
 
+# Block model for FE and settlement tools: layer label (1: A, 2: G, 3: S) and soil parameters per 1 m x 1 m x 0.5 m cell
+block_model = export_block_model(surface_stack, parent_path+"/project_data/block_model.npy", zmin=z_min-1, zmax=z_max, dz=0.5,
+    properties=IfcUtils.layer_properties(model, ["A", "G", "S"], ["FrictionAngle", "CohesionBehaviour"]))
+
 # ADD ERRORS / ISSUES to showcase the tests
 incorrect_layerelement = run("root.create_entity", model, ifc_class="IfcGeotechnicalStratum", name="wrong_borehole_name_xy", predefined_type="KEIN_ANSPRACHEBEREICH") # III
 incorrect_layerelement2 = run("root.create_entity", model, ifc_class="IfcGeotechnicalStratum", name="wrong_borehole_name_xy", predefined_type="ANSPRACHEBEREICH")
@@ -526,6 +391,7 @@ print(f"ELEMENT TO MODIFY: {elem}")
 # MODIFY THE UNIT OF THE WICHTE UNTER AUFTRIEB
 psets = model.by_type("IfcPropertySet")
 psets = [i for i in psets if i.Name=="Fachsektionstage2025"]
+final_pset = None
 for pset in psets:
     for rel in pset.DefinesOccurrence:
         for parent_obj in rel.RelatedObjects:
@@ -543,6 +409,7 @@ wichte_unter_auftrieb.Unit = None
 # MODIFY THE VALUE OF THE COHESION AND THE FRICTION ANGLE
 psets = model.by_type("IfcPropertySet")
 psets = [i for i in psets if i.Name=="Pset_SolidStratumCapacity"]
+final_pset = None
 for pset in psets:
     for rel in pset.DefinesOccurrence:
         for parent_obj in rel.RelatedObjects:
@@ -562,6 +429,7 @@ friction_angle.NominalValue = model.create_entity("IfcPlaneAngleMeasure", 40.1)
 qtos = model.by_type("IfcElementQuantity")
 
 qtos = [i for i in qtos if i.Name=="Qto_VolumetricStratumBaseQuantities"]
+final_qto = None
 
 for qto in qtos:
     for rel in pset.DefinesOccurrence:
@@ -593,6 +461,7 @@ for relAssociatesMaterial in elem.HasAssociations:
 
 
 
+IfcUtils.compact_model(model, properties=True)
 fp = parent_path+"/project_data/script_output_4x3_with_errors.ifc"
 model.write(fp)
 
@@ -0,0 +1,167 @@
+import multiprocessing
+import numpy as np
+from geotmodelling import interpolate_rbf, prepare_points_from_connections, enforce_conformance
+
+
+class StreamingStatistics:
+    """Per cell mean and variance of a stream of arrays (Welford). Memory does not depend on the number of arrays."""
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+
+    def add(self, values):
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self._m2)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class P2Quantile:
+    """
+    Per cell estimate of the p-quantile of a stream of arrays with the P² algorithm (Jain and Chlamtac, 1985).
+    Five markers are kept per cell, hence the memory does not depend on the number of arrays.
+    """
+
+    def __init__(self, p, shape):
+        self.p = p
+        self.count = 0
+        self._first = []
+        self.heights = np.zeros((5,) + tuple(shape))
+        self.positions = np.zeros((5,) + tuple(shape))
+        self.desired = np.array([1., 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.])
+        self.increments = np.array([0., p / 2, p, (1 + p) / 2, 1.])
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        self.count += 1
+        if self.count <= 5:
+            self._first.append(values.copy())
+            if self.count == 5:
+                self.heights = np.sort(np.stack(self._first), axis=0)
+                self.positions[:] = np.arange(1., 6.).reshape((5,) + (1,) * values.ndim)
+                self._first = []
+            return
+
+        q, n = self.heights, self.positions
+        # Cell k with q[k] <= x < q[k+1], extreme markers are moved to new minima / maxima
+        k = (values[None] >= q[1:4]).sum(axis=0)
+        q[0] = np.minimum(q[0], values)
+        q[4] = np.maximum(q[4], values)
+        n += np.arange(5).reshape((5,) + (1,) * values.ndim) > k[None]
+        self.desired = self.desired + self.increments
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            move = ((d >= 1) & (n[i+1] - n[i] > 1)) | ((d <= -1) & (n[i-1] - n[i] < -1))
+            if not move.any():
+                continue
+            s = np.sign(d)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                parabolic = q[i] + s / (n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + s) * (q[i+1] - q[i]) / (n[i+1] - n[i])
+                    + (n[i+1] - n[i] - s) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                neighbour_q = np.where(s > 0, q[i+1], q[i-1])
+                neighbour_n = np.where(s > 0, n[i+1], n[i-1])
+                linear = q[i] + s * (neighbour_q - q[i]) / (neighbour_n - n[i])
+            new = np.where((q[i-1] < parabolic) & (parabolic < q[i+1]), parabolic, linear)
+            q[i] = np.where(move, new, q[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def value(self):
+        if self.count < 5:
+            return np.percentile(np.stack(self._first), 100 * self.p, axis=0)
+        return self.heights[2]
+
+
+def realize_surfaces(bh_data, surfaces, grid, sigma, seed, rules=None, min_thickness=0.):
+    """
+    One realization of the surface stack with contact depths perturbed by normally distributed errors.
+
+    surfaces: from top to bottom, either (above, below) as in prepare_points_from_connections or a fixed grid (nx, ny),
+        e.g. the topography or the base
+    grid: (xmin, xmax, ymin, ymax, grid_x, grid_y) as in interpolate_rbf
+    sigma: standard deviation of the contact depths (measurement uncertainty) in m
+    Returns the stack (n_surfaces, nx, ny) after enforce_conformance.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, xmax, ymin, ymax, grid_x, grid_y = grid
+    stack = []
+    for surface in surfaces:
+        if isinstance(surface, np.ndarray):
+            stack.append(surface)
+            continue
+        x_data, y_data, z_data = prepare_points_from_connections(bh_data, *surface)
+        z_data = np.asarray(z_data, dtype=float) + rng.normal(0., sigma, len(z_data))
+        _, _, z_rbf = interpolate_rbf(list(zip(x_data, y_data, z_data)), xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, grid_x=grid_x, grid_y=grid_y)
+        stack.append(z_rbf)
+    return enforce_conformance(np.stack(stack), rules=rules, min_thickness=min_thickness)
+
+
+_ensemble_context = {}
+
+
+def _init_ensemble(bh_data, surfaces, grid, sigma, rules, min_thickness):
+    _ensemble_context.update(bh_data=bh_data, surfaces=surfaces, grid=grid, sigma=sigma, rules=rules, min_thickness=min_thickness)
+
+
+def _realization(seed):
+    c = _ensemble_context
+    return realize_surfaces(c["bh_data"], c["surfaces"], c["grid"], c["sigma"], seed, rules=c["rules"], min_thickness=c["min_thickness"])
+
+
+def surface_ensemble(bh_data, surfaces, xmin, xmax, ymin, ymax, grid_x=1, grid_y=1, sigma=0.1, n_realizations=100,
+        quantiles=(0.1, 0.9), rules=None, min_thickness=0., processes=None, seed=0):
+    """
+    Monte-Carlo ensemble of the surface stack (see realize_surfaces) computed in worker processes.
+
+    The realizations are reduced one by one in the order of their seeds, so the memory does not grow with n_realizations.
+    The seeds are derived from seed per realization, hence the result does not depend on the number of processes.
+    The data is sent to each worker once. processes=1 runs the realizations in this process.
+
+    Returns a dict with "mean", "std" and "quantiles" (p -> array) of the surfaces (n_surfaces, nx, ny)
+    and "presence": probability of each layer being thicker than zero (n_surfaces-1, nx, ny).
+    """
+    grid = (xmin, xmax, ymin, ymax, grid_x, grid_y)
+    seeds = np.random.SeedSequence(seed).spawn(n_realizations)
+    initargs = (bh_data, surfaces, grid, sigma, rules, min_thickness)
+
+    if processes == 1:
+        _init_ensemble(*initargs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=processes, initializer=_init_ensemble, initargs=initargs)
+    try:
+        # The P² estimates depend on the order of the values, hence the realizations are reduced in the order of the seeds
+        stacks = pool.imap(_realization, seeds) if pool is not None else map(_realization, seeds)
+        statistics = presence = None
+        for stack in stacks:
+            if statistics is None:
+                statistics = StreamingStatistics(stack.shape)
+                estimators = {p: P2Quantile(p, stack.shape) for p in quantiles}
+                presence = np.zeros((len(stack) - 1,) + stack.shape[1:], dtype=np.int64)
+            statistics.add(stack)
+            for estimator in estimators.values():
+                estimator.add(stack)
+            presence += stack[:-1] > stack[1:]
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    return {
+        "mean": statistics.mean,
+        "std": statistics.std,
+        "quantiles": {p: estimator.value for p, estimator in estimators.items()},
+        "presence": presence / n_realizations,
+        "n_realizations": n_realizations,
+    }
@@ -1,9 +1,10 @@
 import numpy as np
 from scipy.interpolate import RBFInterpolator, griddata
-import mathutils
+from scipy.spatial import Delaunay, ConvexHull, cKDTree
 import math
 
 def create_fake_topography(xmin, xmax, ymin, ymax, grid_size=1, x_scale=0.1, y_scale=0.1, z_scale = 10):
+    import mathutils # only available in blender. Imported here, so the other functions work in worker processes as well
     # Calculate the number of vertices in the x and y directions
     x_size = xmax - xmin
     y_size = ymax - ymin
@@ -33,6 +34,7 @@ def create_fake_topography(xmin, xmax, ymin, ymax, grid_size=1, x_scale=0.1, y_s
     return vertices, faces
 
 def create_topography_with_influence(xmin, xmax, ymin, ymax, grid_size, z_base, points, influence_radius = 10, z_scale=1):
+    import mathutils # only available in blender
     # Calculate the number of vertices in the x and y directions
     x_size = xmax - xmin
     y_size = ymax - ymin
@@ -149,15 +151,16 @@ def interpolate_rbf(data_xyz, xmin=None, xmax=None, ymin=None, ymax=None, grid_x
     return *xgrid, ygrid
 
 
-def prepare_points_from_connections(bh_data, above, below):
+def prepare_points_from_connections(bh_data, above, below, names=False):
     """
     Find the contact points of a Hauptgruppe above with all Hauptgruppen specified below.
     
     Similar to defining contact points in leapfrog works.
     above-str
     below-[str]
+    names-bool: additionally return the names of the boreholes
     """
-    x_data, y_data, z_data = [], [], []
+    x_data, y_data, z_data, bh_names = [], [], [], []
     for bh in bh_data:
         hgs = bh["Layerdata"]["Hauptgruppen"]
         if above not in hgs:
@@ -173,10 +176,22 @@ def prepare_points_from_connections(bh_data, above, below):
             x_data.append(bh["x"])
             y_data.append(bh["y"])
             z_data.append(bh["OK"]-bh["Layerdata"]["UKs"][ind])
+            bh_names.append(bh["Name"])
     
+    if names:
+        return x_data, y_data, z_data, bh_names
     return x_data, y_data, z_data
 
 
+def changed_boreholes(old_bh_data, new_bh_data):
+    """Compare two versions of the borehole data by name. Returns the names of the added, removed and edited boreholes."""
+    old, new = {i["Name"]: i for i in old_bh_data}, {i["Name"]: i for i in new_bh_data}
+    added = [i for i in new if i not in old]
+    removed = [i for i in old if i not in new]
+    edited = [i for i in new if i in old and new[i] != old[i]]
+    return added, removed, edited
+
+
 def prepare_grid_to_mesh(x_arr, y_arr, z_arr, mode="triangle"):
     """
     Given three 2d arrays containing x, y, and z coordinates
@@ -200,4 +215,358 @@ def prepare_grid_to_mesh(x_arr, y_arr, z_arr, mode="triangle"):
                 faces.append((v1, v3, v4))
             else:
                 faces.append((v1,v2,v3,v4))
-    return vertices, faces
\ No newline at end of file
+    return vertices, faces
+
+def prepare_grid_to_mesh_arrays(x_arr, y_arr, z_arr):
+    """
+    Vectorized variant of prepare_grid_to_mesh (mode="triangle") returning numpy arrays.
+    Vertices (n, 3) and faces (m, 3) have the same order as in prepare_grid_to_mesh.
+    """
+    vertices = np.stack([x_arr.ravel(), y_arr.ravel(), z_arr.ravel()], axis=1).astype(float)
+    rows, cols = x_arr.shape
+    i, j = np.meshgrid(np.arange(rows - 1), np.arange(cols - 1), indexing="ij")
+    v1 = (i * cols + j).ravel()
+    v2 = v1 + cols
+    v3 = v2 + 1
+    v4 = v1 + 1
+    # Two triangles per quad, interleaved as in prepare_grid_to_mesh
+    faces = np.stack([np.stack([v1, v2, v3], axis=1), np.stack([v1, v3, v4], axis=1)], axis=1).reshape(-1, 3)
+    return vertices, faces
+
+
+def _tin_heights(triangulation, z, xy):
+    """Simplex and linearly interpolated height of the points xy in the triangulation with vertex heights z (nan outside)."""
+    simplex = triangulation.find_simplex(xy)
+    inside = simplex >= 0
+    transform = triangulation.transform[simplex[inside]]
+    b = np.einsum("ijk,ik->ij", transform[:, :2], xy[inside] - transform[:, 2])
+    barycentric = np.column_stack([b, 1 - b.sum(axis=1)])
+    heights = np.full(len(xy), np.nan)
+    heights[inside] = (z[triangulation.simplices[simplex[inside]]] * barycentric).sum(axis=1)
+    return simplex, heights
+
+
+def sample_tin(vertices, x_arr, y_arr):
+    """
+    Heights of a TIN from simplify_tin at the points x_arr, y_arr (e.g. the grid of the surface stack), nan outside.
+
+    The TIN is the Delaunay triangulation of its vertices, hence it is triangulated the same way again.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    xy = np.column_stack([np.ravel(x_arr), np.ravel(y_arr)])
+    _, heights = _tin_heights(Delaunay(vertices[:, :2]), vertices[:, 2], xy)
+    return heights.reshape(np.shape(x_arr))
+
+
+def simplify_tin(vertices, max_error, fixed_points=None, max_iterations=100):
+    """
+    Simplify a heightfield mesh (e.g. the topography grid) to a TIN by greedy insertion.
+
+    Starting with the convex hull, the sample with the largest vertical deviation from the current triangulation
+    is inserted per triangle until all samples deviate at most max_error.
+
+    vertices: (n, 3) samples of the heightfield, e.g. from prepare_grid_to_mesh_arrays
+    fixed_points: (k, 3) points that are always part of the TIN with their exact height, e.g. borehole collars
+    Returns vertices (m, 3) and faces (f, 3) as numpy arrays. Faces are oriented counterclockwise (normals upwards).
+    Raises a RuntimeError if max_error is not reached within max_iterations.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    xy, z = vertices[:, :2], vertices[:, 2]
+    fixed = np.empty((0, 3)) if fixed_points is None else np.asarray(fixed_points, dtype=float).reshape(-1, 3)
+    if len(fixed):
+        # Samples at the fixed points are replaced by them
+        distance, _ = cKDTree(fixed[:, :2]).query(xy)
+        xy, z = xy[distance > 1e-9], z[distance > 1e-9]
+
+    selected = np.zeros(len(xy), dtype=bool)
+    selected[ConvexHull(xy).vertices] = True
+    for _ in range(max_iterations):
+        points = np.vstack([fixed, np.column_stack([xy[selected], z[selected]])])
+        triangulation = Delaunay(points[:, :2])
+        simplex, z_tin = _tin_heights(triangulation, points[:, 2], xy)
+
+        # Vertical deviation
+        error = np.abs(z - z_tin)
+        error[simplex < 0] = np.inf
+        error[selected] = 0.
+
+        candidates = np.flatnonzero(error > max_error)
+        if not len(candidates):
+            break
+        # Insert the worst sample of each triangle
+        candidates = candidates[np.argsort(-error[candidates])]
+        _, first = np.unique(simplex[candidates], return_index=True)
+        selected[candidates[first]] = True
+    else:
+        raise RuntimeError(f"simplify_tin did not reach max_error={max_error} within max_iterations={max_iterations}, "
+            f"the largest deviation is {error.max():.3f}")
+
+    faces = triangulation.simplices.copy()
+    a, b, c = (points[faces[:, i], :2] for i in range(3))
+    clockwise = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+    faces[clockwise] = faces[clockwise][:, ::-1]
+    return points, faces
+
+
+def interpolate_rbf_adaptive(data_xyz, xmin=None, xmax=None, ymin=None, ymax=None, min_cell=1, max_cell=32, tolerance=0.05):
+    """
+    Adaptive alternative to interpolate_rbf + prepare_grid_to_mesh.
+
+    A quadtree is refined from cells of about max_cell down to min_cell (on both sides of a cell) where
+    - the surface deviates more than tolerance from the bilinear interpolation of the cell corners (curvature) or
+    - the cell contains data points (keeps borehole-level detail near the data).
+    All leaf corners (including hanging nodes) are triangulated at once, hence the mesh is crack free.
+
+    data_xyz:list -> [xpos of borehole, ypos of borehole, z-value used for interpolation]
+    Returns vertices (n, 3) and faces (m, 3) as numpy arrays.
+    """
+    data_xyz = np.asarray(data_xyz, dtype=float)
+    xmin = xmin if xmin is not None else data_xyz[:, 0].min()
+    xmax = xmax if xmax is not None else data_xyz[:, 0].max()
+    ymin = ymin if ymin is not None else data_xyz[:, 1].min()
+    ymax = ymax if ymax is not None else data_xyz[:, 1].max()
+
+    interpolator = RBFInterpolator(
+        y = data_xyz[:, :2],
+        d = data_xyz[:, 2],
+        neighbors = None, # global system, the same result as neighbors=len(data_xyz) but solved only once
+        smoothing = 0.0,
+        kernel = "cubic",
+        epsilon = None,
+        degree = None
+    )
+
+    # Root cells of about max_cell which cover the extent exactly. They are not larger than the short side of the extent,
+    # so they are nearly square (aspect ratio below 2) and both sides reach min_cell at about the same level.
+    root_cell = min(max_cell, xmax - xmin, ymax - ymin)
+    nx, ny = max(1, int(np.ceil((xmax - xmin) / root_cell))), max(1, int(np.ceil((ymax - ymin) / root_cell)))
+    width, height = (xmax - xmin) / nx, (ymax - ymin) / ny
+    ix, iy = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    cells = np.column_stack([ix.ravel(), iy.ravel()]) # integer cell position on the current level
+
+    leaves = []
+    while len(cells):
+        x0, y0 = xmin + cells[:, 0] * width, ymin + cells[:, 1] * height
+        refine = np.zeros(len(cells), dtype=bool)
+        if width / 2 >= min_cell and height / 2 >= min_cell:
+            # 3x3 samples per cell: corners, edge midpoints and center
+            u = np.array([0, 0.5, 1])
+            sx = x0[:, None, None] + u[None, :, None] * width
+            sy = y0[:, None, None] + u[None, None, :] * height
+            sx, sy = np.broadcast_arrays(sx, sy)
+            f = interpolator(np.column_stack([sx.ravel(), sy.ravel()])).reshape(len(cells), 3, 3)
+            deviation = np.stack([
+                f[:, 1, 1] - 0.25 * (f[:, 0, 0] + f[:, 0, 2] + f[:, 2, 0] + f[:, 2, 2]),
+                f[:, 1, 0] - 0.5 * (f[:, 0, 0] + f[:, 2, 0]),
+                f[:, 1, 2] - 0.5 * (f[:, 0, 2] + f[:, 2, 2]),
+                f[:, 0, 1] - 0.5 * (f[:, 0, 0] + f[:, 0, 2]),
+                f[:, 2, 1] - 0.5 * (f[:, 2, 0] + f[:, 2, 2]),
+            ], axis=1)
+            refine = np.abs(deviation).max(axis=1) > tolerance
+
+            # Cells containing data points
+            data_ix = np.floor((data_xyz[:, 0] - xmin) / width).astype(np.int64)
+            data_iy = np.floor((data_xyz[:, 1] - ymin) / height).astype(np.int64)
+            refine |= np.isin(cells[:, 0] * (nx + 1) + cells[:, 1], data_ix * (nx + 1) + data_iy)
+
+        leaves.append(np.column_stack([x0[~refine], y0[~refine], np.full((~refine).sum(), width), np.full((~refine).sum(), height)]))
+        cells = cells[refine]
+        cells = (2 * cells[:, None, :] + np.array([[0, 0], [1, 0], [0, 1], [1, 1]])[None]).reshape(-1, 2)
+        width, height, nx, ny = width / 2, height / 2, nx * 2, ny * 2
+
+    leaves = np.vstack(leaves)
+    corners = np.concatenate([
+        leaves[:, :2],
+        leaves[:, :2] + leaves[:, [2]] * [1, 0],
+        leaves[:, :2] + leaves[:, [3]] * [0, 1],
+        leaves[:, :2] + leaves[:, 2:],
+    ])
+    # Merge corners shared by neighbouring cells
+    xy = np.unique(np.round(corners, 9), axis=0)
+    faces = Delaunay(xy).simplices
+    vertices = np.column_stack([xy, interpolator(xy)])
+    return vertices, faces
+
+
+def enforce_conformance(stack, rules=None, min_thickness=0.):
+    """
+    Make a stack of surfaces (n_surfaces, nx, ny), ordered from top to bottom, geologically consistent.
+
+    rules: one of "erode" or "onlap" per surface (default "erode").
+        "erode": the surface truncates all surfaces below it, they are lowered onto it where they cross it.
+        "onlap": the surface is raised onto the highest surface below it, e.g. a fill onlapping an older relief.
+        Afterwards, no surface lies above the one before.
+    min_thickness: scalar or one value per layer (n_surfaces-1). Layers thinner than this are removed by raising their
+        bottom surface onto their top, so the layer below takes their place. The top surface (topography) is never changed.
+
+    Returns the new stack. The input is not modified.
+    """
+    stack = np.asarray(stack, dtype=float)
+    rules = rules if rules is not None else ["erode"] * len(stack)
+    onlap = np.array([i == "onlap" for i in rules])
+    if onlap.any():
+        highest_below = np.maximum.accumulate(stack[::-1], axis=0)[::-1]
+        stack = np.where(onlap[:, None, None], highest_below, stack)
+    stack = np.minimum.accumulate(stack, axis=0)
+
+    min_thickness = np.broadcast_to(np.asarray(min_thickness, dtype=float), (len(stack) - 1,))
+    if (min_thickness > 0).any():
+        thickness = stack[:-1] - stack[1:]
+        # Layers without thickness are included, so a removed layer is filled by the next layer present below it
+        removed = thickness < min_thickness[:, None, None]
+        # Index of the surface each surface is moved to: the nearest surface above that is the top of a kept layer
+        index = np.arange(len(stack))[:, None, None] * np.ones(stack.shape[1:], dtype=np.int64)
+        index[1:][removed] = 0
+        index = np.maximum.accumulate(index, axis=0)
+        stack = np.take_along_axis(stack, index, axis=0)
+    return stack
+
+
+def build_stacked_volumes(x_arr, y_arr, stack, names=None, eps=1e-6):
+    """
+    Closed volumes between consecutive surfaces of a stack sharing the same grid (stacked surface approach without booleans).
+
+    x_arr, y_arr: grid (nx, ny) as returned by interpolate_rbf (or a window of read_tile)
+    stack: (n_surfaces, nx, ny) surfaces from top to bottom, e.g. topography, A_GS, G_S, base. Volume k lies between
+        surface k and k+1. A surface above the one before is clipped to it.
+    names: n_surfaces-1 labels of the volumes, e.g. ["A", "G", "S"]. Defaults to the index.
+    eps: where a volume is not thicker than eps, its bottom vertex is welded to the top vertex, so layers pinch out.
+
+    Each volume consists of the top and bottom grid triangulated as in prepare_grid_to_mesh_arrays and the side walls along
+    the grid boundary. Faces are oriented outwards.
+    Returns a dict name -> (vertices (n, 3), faces (m, 3)). Both are empty for volumes without thickness.
+    """
+    stack = np.asarray(stack, dtype=float)
+    names = names if names is not None else list(range(len(stack) - 1))
+    rows, cols = x_arr.shape
+    n = rows * cols
+    _, top_faces = prepare_grid_to_mesh_arrays(x_arr, y_arr, stack[0])
+
+    # Boundary of the grid counterclockwise (interior on the left, as the top faces)
+    boundary = np.concatenate([
+        np.arange(rows - 1) * cols,
+        (rows - 1) * cols + np.arange(cols - 1),
+        (rows - 1) * cols + cols - 1 - np.arange(rows - 1) * cols,
+        cols - 1 - np.arange(cols - 1),
+    ])
+    a, b = boundary, np.roll(boundary, -1)
+
+    volumes = {}
+    top = stack[0]
+    for name, below in zip(names, stack[1:]):
+        bottom = np.minimum(below, top)
+        welded = (top - bottom).ravel() <= eps
+        vertices = np.concatenate([
+            np.stack([x_arr.ravel(), y_arr.ravel(), top.ravel()], axis=1),
+            np.stack([x_arr.ravel(), y_arr.ravel(), bottom.ravel()], axis=1),
+        ])
+        lower = np.where(welded, np.arange(n), np.arange(n) + n)
+        # Triangles without thickness at all corners are dropped on both sides
+        open_faces = ~welded[top_faces].all(axis=1)
+        faces = np.concatenate([
+            top_faces[open_faces],
+            lower[top_faces[open_faces]][:, ::-1],
+            np.stack([b, a, lower[a]], axis=1),
+            np.stack([b, lower[a], lower[b]], axis=1),
+        ])
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+        # Drop unused vertices
+        used, faces = np.unique(faces, return_inverse=True)
+        volumes[name] = (vertices[used], faces.reshape(-1, 3))
+        top = bottom
+    return volumes
+
+
+# Kernels of scipy.interpolate.RBFInterpolator as functions of the scaled distance r = epsilon * |x - y|
+rbf_kernels = {
+    "linear": lambda r: -r,
+    "thin_plate_spline": lambda r: np.where(r > 0, r ** 2 * np.log(np.where(r > 0, r, 1.)), 0.),
+    "cubic": lambda r: r ** 3,
+    "quintic": lambda r: -r ** 5,
+    "multiquadric": lambda r: -np.sqrt(r ** 2 + 1),
+    "inverse_multiquadric": lambda r: 1 / np.sqrt(r ** 2 + 1),
+    "inverse_quadratic": lambda r: 1 / (r ** 2 + 1),
+    "gaussian": lambda r: np.exp(-r ** 2),
+}
+rbf_min_degree = {"multiquadric": 0, "linear": 0, "thin_plate_spline": 1, "cubic": 1, "quintic": 2}
+
+
+def _rbf_systems(points_xy, kernel, epsilon, degree, smoothing):
+    """Augmented RBF systems [[K + smoothing, P], [P.T, 0]] for a batch of point sets (b, k, 2) as in RBFInterpolator."""
+    r = epsilon * np.linalg.norm(points_xy[:, :, None, :] - points_xy[:, None, :, :], axis=-1)
+    k = rbf_kernels[kernel](r) + smoothing * np.eye(points_xy.shape[1])
+    powers = [(i, j) for total in range(degree + 1) for j in range(total + 1) for i in [total - j]]
+    # Monomials of the centered coordinates, the solution does not depend on the shift but the condition does
+    centered = points_xy - points_xy.mean(axis=1, keepdims=True)
+    p = np.stack([centered[..., 0] ** i * centered[..., 1] ** j for i, j in powers], axis=-1).reshape(points_xy.shape[:2] + (len(powers),))
+    m = len(powers)
+    system = np.zeros((len(points_xy), points_xy.shape[1] + m, points_xy.shape[1] + m))
+    system[:, :points_xy.shape[1], :points_xy.shape[1]] = k
+    system[:, :points_xy.shape[1], points_xy.shape[1]:] = p
+    system[:, points_xy.shape[1]:, :points_xy.shape[1]] = p.transpose(0, 2, 1)
+    return system, centered, powers
+
+
+def rbf_loo_residuals(data_xyz, kernel="cubic", smoothing=0., epsilon=1., degree=None, neighbors=None):
+    """
+    Leave-one-out residuals z_i - s_i(x_i), where s_i is the RBFInterpolator fitted without point i (same parameters).
+
+    neighbors=None: closed form of Rippa (1999) for the global system, e_i = c_i / (A^-1)_ii. One factorization for all points.
+    neighbors=k: s_i uses the k nearest points of x_i except i itself, exactly as RBFInterpolator(neighbors=k) without point i.
+        All local systems are solved as one batch.
+
+    data_xyz:list -> [xpos of borehole, ypos of borehole, z-value used for interpolation]
+    Returns the residuals as array.
+    """
+    data_xyz = np.asarray(data_xyz, dtype=float)
+    xy, z = data_xyz[:, :2], data_xyz[:, 2]
+    degree = max(rbf_min_degree.get(kernel, -1), 0) if degree is None else degree
+    n = len(data_xyz)
+
+    if neighbors is None or neighbors >= n - 1:
+        system, _, _ = _rbf_systems(xy[None], kernel, epsilon, degree, smoothing)
+        inverse = np.linalg.inv(system[0])
+        coefficients = inverse[:n, :n] @ z
+        return coefficients / np.diag(inverse)[:n]
+
+    _, index = cKDTree(xy).query(xy, k=neighbors + 1)
+    # Drop the point itself. With duplicates it is not necessarily the first one
+    others = np.array([row[row != i][:neighbors] for i, row in enumerate(index)])
+    system, centered, powers = _rbf_systems(xy[others], kernel, epsilon, degree, smoothing)
+    rhs = np.zeros(system.shape[:2])
+    rhs[:, :neighbors] = z[others]
+    solution = np.linalg.solve(system, rhs[..., None])[..., 0]
+    # Evaluate the local interpolants at the left out points
+    r = epsilon * np.linalg.norm(xy[others] - xy[:, None, :], axis=-1)
+    target = xy - xy[others].mean(axis=1)
+    monomials = np.stack([target[:, 0] ** i * target[:, 1] ** j for i, j in powers], axis=-1)
+    prediction = (rbf_kernels[kernel](r) * solution[:, :neighbors]).sum(axis=1) + (monomials * solution[:, neighbors:]).sum(axis=1)
+    return z - prediction
+
+
+def cross_validate(bh_data, contacts, **kwargs):
+    """
+    Leave-one-out cross validation of the surfaces interpolated from borehole contacts, see rbf_loo_residuals.
+
+    contacts: dict surface name -> (above, below) as in prepare_points_from_connections, e.g. {"A_GS": ("A", ["S", "G"])}
+    kwargs: parameters of the interpolation (kernel, smoothing, epsilon, degree, neighbors)
+
+    Returns a dict with
+    "residuals": list of (surface, borehole, residual),
+    "by_surface" / "by_borehole": name -> {"rmse", "max", "n"}.
+    """
+    residuals = []
+    for surface, (above, below) in contacts.items():
+        x_data, y_data, z_data, bh_names = prepare_points_from_connections(bh_data, above, below, names=True)
+        if len(z_data) < 2:
+            continue
+        errors = rbf_loo_residuals(list(zip(x_data, y_data, z_data)), **kwargs)
+        residuals.extend(zip([surface] * len(errors), bh_names, errors.tolist()))
+
+    def summary(key):
+        grouped = {}
+        for row in residuals:
+            grouped.setdefault(row[key], []).append(row[2])
+        return {k: {"rmse": float(np.sqrt(np.mean(np.square(v)))), "max": float(np.max(np.abs(v))), "n": len(v)} for k, v in grouped.items()}
+
+    return {"residuals": residuals, "by_surface": summary(0), "by_borehole": summary(1)}
@@ -0,0 +1,511 @@
+import re
+import functools
+import math
+from array import array
+import numpy as np
+import ifcopenshell
+
+
+# A statement of the DATA section: "#12=IFCCARTESIANPOINT((0.,0.,0.));"
+entity_head = re.compile(r"\s*#(\d+)\s*=\s*([A-Za-z0-9_]+)\s*\(")
+_file_schema = re.compile(r"FILE_SCHEMA\s*\(\s*\(\s*'([^']+)'", re.IGNORECASE)
+_statement_delimiter = re.compile(r"[';]")
+_token = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+    |(?P<ref>\#\d+)
+    |(?P<enum>\.[A-Za-z0-9_]+\.)
+    |(?P<typed>[A-Za-z][A-Za-z0-9_]*\s*\()
+    |(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    |(?P<binary>"[0-9A-Fa-f]*")
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<null>[$*])
+    |(?P<sep>[,\s]+)
+    """, re.VERBOSE)
+_string_escape = re.compile(r"\\X2\\((?:[0-9A-F]{4})+)\\X0\\|\\X4\\((?:[0-9A-F]{8})+)\\X0\\|\\X\\([0-9A-F]{2})|\\S\\(.)|(\\\\)")
+
+
+def iter_statements(fp):
+    """
+    Yield the raw statements of an ifc-spf file one by one without keeping more than one statement in memory.
+    Statements end at a ";" outside of a string, so a statement may span several lines and a line may hold several statements.
+    Returns tuples (section, statement). section is either "HEADER" or "DATA".
+    """
+    section, parts, in_string = None, [], False
+    with open(fp, "r", encoding="Latin1") as f:
+        for line in f:
+            start = 0
+            for match in _statement_delimiter.finditer(line):
+                # Escaped quotes ('') toggle twice and keep the state
+                if match.group() == "'":
+                    in_string = not in_string
+                    continue
+                if in_string:
+                    continue
+                parts.append(line[start:match.end()])
+                statement, parts, start = "".join(parts).strip(), [], match.end()
+                keyword = statement.upper()
+                if keyword in ("HEADER;", "DATA;"):
+                    section = keyword[:-1]
+                elif keyword == "ENDSEC;":
+                    section = None
+                elif section:
+                    yield section, statement
+            if parts or line[start:].strip():
+                parts.append(line[start:])
+
+
+def decode_string(value):
+    """Decode the ISO 10303-21 escape sequences of a string attribute."""
+    def replace(match):
+        if match.group(1):
+            return "".join(chr(int(match.group(1)[i:i+4], 16)) for i in range(0, len(match.group(1)), 4))
+        if match.group(2):
+            return "".join(chr(int(match.group(2)[i:i+8], 16)) for i in range(0, len(match.group(2)), 8))
+        if match.group(3):
+            return chr(int(match.group(3), 16))
+        if match.group(4):
+            return chr(ord(match.group(4)) + 128)
+        return "\\"
+    return _string_escape.sub(replace, value[1:-1].replace("''", "'"))
+
+
+def parse_arguments(raw):
+    """
+    Parse the argument list of a statement, e.g. "'abc',$,#12,(1.,2.),IFCREAL(3.)" into python values.
+    References are returned as StreamReference, typed values as StreamTypedValue.
+    """
+    stack = [[]]
+    typed_names = [None]
+    for match in _token.finditer(raw):
+        kind, text = match.lastgroup, match.group()
+        if kind == "sep":
+            continue
+        elif kind == "string":
+            stack[-1].append(decode_string(text))
+        elif kind == "ref":
+            stack[-1].append(StreamReference(int(text[1:])))
+        elif kind == "enum":
+            stack[-1].append({".T.": True, ".F.": False, ".U.": "UNKNOWN"}.get(text.upper(), text[1:-1]))
+        elif kind == "number":
+            stack[-1].append(float(text) if any(c in text for c in ".eE") else int(text))
+        elif kind == "binary":
+            stack[-1].append(text[1:-1])
+        elif kind == "null":
+            stack[-1].append(None)
+        elif kind in ("open", "typed"):
+            stack.append([])
+            typed_names.append(text[:-1].strip() if kind == "typed" else None)
+        elif kind == "close":
+            values, typed_name = stack.pop(), typed_names.pop()
+            if typed_name:
+                stack[-1].append(StreamTypedValue(typed_name, values[0] if len(values) == 1 else tuple(values)))
+            else:
+                stack[-1].append(tuple(values))
+    return tuple(stack[0])
+
+
+@functools.lru_cache(maxsize=None)
+def schema_type_name(schema_name, type_name):
+    """Spelling of type_name in the schema, e.g. IfcCartesianPoint for IFCCARTESIANPOINT. Unknown types are kept as is."""
+    try:
+        return ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name).declaration_by_name(type_name).name()
+    except RuntimeError:
+        return type_name
+
+
+@functools.lru_cache(maxsize=None)
+def is_subtype(schema_name, type_name, ifc_class):
+    """True if type_name is ifc_class or one of its subtypes. Types unknown to the schema are never a subtype."""
+    try:
+        declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name).declaration_by_name(type_name)
+    except RuntimeError:
+        return False
+    while declaration is not None:
+        if declaration.name_uc() == ifc_class.upper():
+            return True
+        declaration = declaration.supertype()
+    return False
+
+
+def _checked_schema_name(fp, schema_name):
+    try:
+        ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name)
+    except RuntimeError:
+        raise ValueError(f"The schema {schema_name} of {fp} is unknown to ifcopenshell") from None
+    return schema_name
+
+
+class StreamReference:
+    """Reference (#id) to another entity instance that is resolved lazily."""
+    __slots__ = ("id",)
+
+    def __init__(self, id):
+        self.id = id
+
+    def __repr__(self):
+        return f"#{self.id}"
+
+
+class StreamTypedValue:
+    """Typed value such as IFCREAL(1.). Mirrors the wrappedValue interface of ifcopenshell."""
+    __slots__ = ("_type", "wrappedValue")
+
+    def __init__(self, type, value):
+        self._type = type
+        self.wrappedValue = value
+
+    def is_a(self, ifc_class=None):
+        if ifc_class is None:
+            return self._type
+        return self._type.upper() == ifc_class.upper()
+
+    def __repr__(self):
+        return f"{self._type}({self.wrappedValue!r})"
+
+
+class StreamEntity:
+    """
+    Lightweight entity instance of a StreamingModel. Attributes are accessed by name like for ifcopenshell entities.
+    Inverse attributes are resolved among the materialized entities only.
+    """
+    __slots__ = ("_model", "_id", "_declaration", "_arguments")
+
+    def __init__(self, model, id, declaration, arguments):
+        self._model = model
+        self._id = id
+        self._declaration = declaration
+        self._arguments = arguments
+
+    def id(self):
+        return self._id
+
+    def is_a(self, ifc_class=None):
+        if ifc_class is None:
+            return self._declaration.name()
+        return self._model.is_subtype(self._declaration.name(), ifc_class)
+
+    def __getattr__(self, name):
+        declaration = self._declaration
+        attributes = self._model.attribute_names(declaration)
+        if name in attributes:
+            index = attributes.index(name)
+            if index >= len(self._arguments):
+                return None
+            return self._model.resolve(self._arguments[index])
+        inverse = self._model.inverse_attributes(declaration).get(name)
+        if inverse is not None:
+            return self._model.get_inverse(self, *inverse)
+        raise AttributeError(f"{declaration.name()} has no attribute {name}")
+
+    def __getitem__(self, index):
+        return self._model.resolve(self._arguments[index])
+
+    def __eq__(self, other):
+        return isinstance(other, StreamEntity) and other._id == self._id
+
+    def __hash__(self):
+        return hash(self._id)
+
+    def __repr__(self):
+        return f"#{self._id}={self._declaration.name()}{self._arguments!r}"
+
+
+class StreamingModel:
+    """
+    Low memory view on an ifc-spf file for checks that only need a few entity types.
+
+    The file is scanned once line by line. Only instances of the declared types (including subtypes) are parsed and kept,
+    all other statements - in particular the geometry - are dropped right away. Hence, memory usage depends on the number
+    of declared instances and not on the file size.
+
+    References to instances that are not materialized raise a LookupError, so an incomplete declaration cannot lead to
+    silently wrong check results.
+
+    # Example
+    model = StreamingModel(fp, ["IfcBorehole", "IfcSimpleProperty", "IfcPropertySet"])
+    names = [i.Name for i in model.by_type("IfcBorehole")]
+    """
+
+    def __init__(self, fp, types):
+        self.fp = fp
+        self.entities = {}
+        self.schema = None
+        self.types = []
+        self._by_type = {}
+        self._inverse_index = None
+        self._attribute_names = {}
+        self._inverse_attributes = {}
+        self._load(types)
+
+    def _load(self, types):
+        keep_cache = {}
+        for section, statement in iter_statements(self.fp):
+            if section == "HEADER":
+                match = _file_schema.match(statement)
+                if match:
+                    self.schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(_checked_schema_name(self.fp, match.group(1)))
+                    self.types = [self.schema.declaration_by_name(i).name() for i in types]
+                continue
+            match = entity_head.match(statement)
+            if not match:
+                continue
+            if self.schema is None:
+                raise ValueError(f"{self.fp} has no FILE_SCHEMA in its header")
+            type_name = match.group(2).upper()
+            keep = keep_cache.get(type_name)
+            if keep is None:
+                keep = keep_cache[type_name] = any(self.is_subtype(type_name, i) for i in self.types)
+            if not keep:
+                continue
+            declaration = self.schema.declaration_by_name(type_name)
+            # Strip the closing ");" of the statement
+            arguments = parse_arguments(statement[match.end():-2])
+            entity = StreamEntity(self, int(match.group(1)), declaration, arguments)
+            self.entities[entity.id()] = entity
+            self._by_type.setdefault(declaration.name(), []).append(entity)
+
+    def is_subtype(self, type_name, ifc_class):
+        return is_subtype(self.schema.name(), type_name, ifc_class)
+
+    def _check_declared(self, ifc_class):
+        if not any(self.is_subtype(ifc_class, i) for i in self.types):
+            raise LookupError(f"{ifc_class} is not materialized. Declared types are {self.types}")
+
+    def by_type(self, ifc_class):
+        self._check_declared(ifc_class)
+        return [e for name, entities in self._by_type.items() if self.is_subtype(name, ifc_class) for e in entities]
+
+    def by_id(self, id):
+        if id not in self.entities:
+            raise LookupError(f"#{id} is not materialized. Declare its type to make it accessible")
+        return self.entities[id]
+
+    def attribute_names(self, declaration):
+        name = declaration.name()
+        if name not in self._attribute_names:
+            self._attribute_names[name] = [i.name() for i in declaration.all_attributes()]
+        return self._attribute_names[name]
+
+    def inverse_attributes(self, declaration):
+        name = declaration.name()
+        if name not in self._inverse_attributes:
+            self._inverse_attributes[name] = {
+                i.name(): (i.entity_reference().name(), i.attribute_reference().name())
+                for i in declaration.all_inverse_attributes()
+            }
+        return self._inverse_attributes[name]
+
+    def resolve(self, value):
+        if isinstance(value, StreamReference):
+            return self.by_id(value.id)
+        if isinstance(value, tuple):
+            return tuple(self.resolve(i) for i in value)
+        return value
+
+    def get_inverse(self, entity, ifc_class, attribute_name):
+        """Entities of ifc_class referencing entity through attribute_name. ifc_class has to be declared."""
+        self._check_declared(ifc_class)
+        if self._inverse_index is None:
+            self._inverse_index = {}
+            for source in self.entities.values():
+                for index, argument in enumerate(source._arguments):
+                    for ref in self._iter_references(argument):
+                        self._inverse_index.setdefault(ref, []).append((source, index))
+        result = []
+        for source, index in self._inverse_index.get(entity.id(), []):
+            if source.is_a(ifc_class) and self.attribute_names(source._declaration)[index] == attribute_name:
+                result.append(source)
+        return tuple(result)
+
+    @staticmethod
+    def _iter_references(argument):
+        if isinstance(argument, StreamReference):
+            yield argument.id
+        elif isinstance(argument, tuple):
+            for i in argument:
+                yield from StreamingModel._iter_references(i)
+
+
+_strings = re.compile(r"'(?:[^']|'')*'")
+_references = re.compile(r"#(\d+)")
+
+# Products are attributed to the topmost aggregating product below these containers, e.g. layers to their borehole.
+profile_container_types = ("IfcSpatialElement", "IfcGeomodel")
+
+
+class DistinctCounter:
+    """HyperLogLog estimate of the number of distinct values with constant memory (2**p registers)."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, value):
+        h = hash(value) & 0xFFFFFFFFFFFFFFFF
+        index, rest = h & ((1 << self.p) - 1), h >> self.p
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -i for i in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros) # linear counting for small cardinalities
+        return estimate
+
+
+def profile_file_size(fp):
+    """
+    Attribute the serialized bytes of an ifc-spf file to entity types and to top-level products in a single
+    streaming pass.
+
+    Statements are not kept, per entity only its id, size and type (24 bytes) and per reference its source and target
+    (16 bytes) are stored in compact arrays. Memory hence grows with the number of entities and references, but it is a
+    small fraction of an ifcopenshell.file of the same model. After the pass, ownership is propagated from the products
+    along the references. Entities reached from more than one top-level product (profiles, contexts, ...) count as shared,
+    property sets are attributed via IfcRelDefinesByProperties.
+
+    Returns a dict with
+    - "total_bytes"
+    - "by_type": [(type, count, bytes, duplication_ratio), ...] sorted by bytes. duplication_ratio is the estimated share
+        of instances whose attributes equal those of another instance of the same type (e.g. repeated IfcCartesianPoints)
+    - "by_product": [(name, type, id, count, bytes), ...] sorted by bytes
+    - "shared" and "unowned": (count, bytes)
+
+    Raises a ValueError if the header has no FILE_SCHEMA or the schema is unknown to ifcopenshell.
+    """
+    schema_name = None
+    type_names, type_index = [], {}
+    type_count, type_bytes, type_distinct = [], [], []
+    ids, sizes, types = array("q"), array("q"), array("q")
+    edge_src, edge_dst = array("q"), array("q")
+    products, parents = {}, {}
+    total_bytes = 0
+
+    for section, statement in iter_statements(fp):
+        size = len(statement) + 1 # line break
+        total_bytes += size
+        if section == "HEADER":
+            match = _file_schema.match(statement)
+            if match:
+                schema_name = _checked_schema_name(fp, match.group(1))
+            continue
+        match = entity_head.match(statement)
+        if not match:
+            continue
+        if schema_name is None:
+            raise ValueError(f"{fp} has no FILE_SCHEMA in its header")
+        entity_id, type_name = int(match.group(1)), match.group(2).upper()
+        if type_name not in type_index:
+            type_index[type_name] = len(type_names)
+            type_names.append(type_name)
+            type_count.append(0)
+            type_bytes.append(0)
+            type_distinct.append(DistinctCounter())
+        t = type_index[type_name]
+        raw = statement[match.end():-2]
+        type_count[t] += 1
+        type_bytes[t] += size
+        type_distinct[t].add(raw)
+        ids.append(entity_id)
+        sizes.append(size)
+        types.append(t)
+
+        if is_subtype(schema_name, type_name, "IfcProduct"):
+            arguments = parse_arguments(raw)
+            products[entity_id] = (arguments[2], type_name)
+        elif type_name == "IFCRELAGGREGATES":
+            arguments = parse_arguments(raw)
+            for child in arguments[5]:
+                parents[child.id] = arguments[4].id
+            continue # relationships must not propagate ownership
+        elif type_name == "IFCRELDEFINESBYPROPERTIES":
+            arguments = parse_arguments(raw)
+            definitions = arguments[5] if isinstance(arguments[5], tuple) else (arguments[5],)
+            for related in arguments[4]:
+                for definition in definitions:
+                    edge_src.append(related.id)
+                    edge_dst.append(definition.id)
+            edge_src.append(arguments[4][0].id)
+            edge_dst.append(entity_id)
+            continue
+        elif type_name.startswith("IFCREL"):
+            continue
+        for ref in _references.findall(_strings.sub("", raw)):
+            edge_src.append(entity_id)
+            edge_dst.append(int(ref))
+
+    ids, sizes, types = np.frombuffer(ids, dtype=np.int64), np.frombuffer(sizes, dtype=np.int64), np.frombuffer(types, dtype=np.int64)
+    position = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+    position[ids] = np.arange(len(ids))
+
+    # Top-level owner of each product: walk up the aggregation until a container is reached
+    def top_level(product_id):
+        while product_id in parents and parents[product_id] in products and not any(
+                is_subtype(schema_name, products[parents[product_id]][1], i) for i in profile_container_types):
+            product_id = parents[product_id]
+        return product_id
+
+    unowned, shared = -1, -2
+    owner = np.full(len(ids), unowned, dtype=np.int64)
+    is_product = np.zeros(len(ids), dtype=bool)
+    for product_id in products:
+        owner[position[product_id]] = top_level(product_id)
+        is_product[position[product_id]] = True
+
+    src = position[np.frombuffer(edge_src, dtype=np.int64)]
+    dst = position[np.frombuffer(edge_dst, dtype=np.int64)]
+    keep = (src >= 0) & (dst >= 0)
+    src, dst = src[keep], dst[keep]
+    keep = ~is_product[dst] # ownership does not propagate into other products (e.g. via placements)
+    src, dst = src[keep], dst[keep]
+    while True:
+        labels = owner[src]
+        active = labels != unowned
+        s, d, labels = src[active], dst[active], labels[active]
+        new_owner = owner.copy()
+        first = new_owner[d] == unowned
+        new_owner[d[first]] = labels[first]
+        # Any second, different label makes the entity shared
+        conflict = (new_owner[d] != labels) | (labels == shared)
+        new_owner[d[conflict]] = shared
+        if np.array_equal(new_owner, owner):
+            break
+        owner = new_owner
+
+    by_type = sorted(
+        [(type_names[t], type_count[t], type_bytes[t], 1 - min(type_distinct[t].estimate(), type_count[t]) / type_count[t]) for t in range(len(type_names))],
+        key=lambda x: x[2], reverse=True)
+    by_type = [(schema_type_name(schema_name, i[0]),) + i[1:] for i in by_type]
+
+    owned = owner >= 0
+    product_bytes = np.bincount(owner[owned], weights=sizes[owned]) if owned.any() else np.zeros(0)
+    product_count = np.bincount(owner[owned]) if owned.any() else np.zeros(0, dtype=np.int64)
+    by_product = sorted(
+        [(products[i][0], schema_type_name(schema_name, products[i][1]), int(i), int(product_count[i]), int(product_bytes[i])) for i in np.flatnonzero(product_count)],
+        key=lambda x: x[4], reverse=True)
+
+    return {
+        "total_bytes": total_bytes,
+        "by_type": by_type,
+        "by_product": by_product,
+        "shared": (int((owner == shared).sum()), int(sizes[owner == shared].sum())),
+        "unowned": (int((owner == unowned).sum()), int(sizes[owner == unowned].sum())),
+    }
+
+
+def format_size_profile(profile, top=10):
+    """Human readable summary of profile_file_size, listing the biggest contributors."""
+    mb = 1024 * 1024
+    lines = [f"Dateigröße: {profile['total_bytes'] / mb:.2f} MB", "Größte Entitätstypen (Anzahl, MB, Anteil Duplikate):"]
+    for name, count, size, duplication in profile["by_type"][:top]:
+        lines.append(f"  {name}: {count}, {size / mb:.2f} MB, {duplication:.0%}")
+    lines.append("Größte Produkte (Typ, Anzahl Entitäten, MB):")
+    for name, type_name, _, count, size in profile["by_product"][:top]:
+        lines.append(f"  {name}: {type_name}, {count}, {size / mb:.2f} MB")
+    for key in ("shared", "unowned"):
+        lines.append(f"{key}: {profile[key][0]}, {profile[key][1] / mb:.2f} MB")
+    return "\n".join(lines)
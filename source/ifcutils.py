@@ -1,5 +1,128 @@
+import os
+import re
+import tempfile
+import multiprocessing
 import ifcopenshell
+import ifcopenshell.api
+import ifcopenshell.api.root
+import ifcopenshell.api.geometry
+import ifcopenshell.api.aggregate
+import ifcopenshell.util.element
+import ifcopenshell.util.pset
+import ifcopenshell.guid
 import numpy as np
+from ifcstreaming import iter_statements, entity_head
+
+
+# Entity types merged by IfcUtils.compact_model. Order matters: referenced types first.
+compaction_types = [
+    "IfcCartesianPoint", "IfcDirection", "IfcDimensionalExponents",
+    "IfcAxis2Placement2D", "IfcAxis2Placement3D", "IfcMeasureWithUnit",
+]
+compaction_property_types = ["IfcPropertySingleValue", "IfcPropertyBoundedValue"]
+
+# Relationships fused by IfcUtils.merge_models if several parts relate to the same shared entity.
+# Type -> (index of the relating attribute, index of the related objects)
+merged_relationship_types = {
+    "IFCRELAGGREGATES": (4, 5),
+    "IFCRELASSOCIATESMATERIAL": (5, 4),
+    "IFCRELCONTAINEDINSPATIALSTRUCTURE": (5, 4),
+}
+
+_strings_or_references = re.compile(r"'(?:[^']|'')*'|#(\d+)")
+
+
+def _split_arguments(raw):
+    """Split the argument list of a statement at its top level commas. The arguments are kept as text."""
+    arguments, depth, in_string, start = [], 0, False, 0
+    for ind, char in enumerate(raw):
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            arguments.append(raw[start:ind])
+            start = ind + 1
+    arguments.append(raw[start:])
+    return arguments
+
+
+def _added_related_objects(base_statement, statement):
+    """
+    Related objects a part added to a shared relationship of merged_relationship_types (renumbered statement).
+    None if the statements differ otherwise, or if related objects were removed.
+    """
+    if base_statement is None:
+        return None
+    base_match, match = entity_head.match(base_statement), entity_head.match(statement)
+    type_name = match.group(2).upper()
+    if type_name not in merged_relationship_types or base_match.group(2).upper() != type_name:
+        return None
+    related_index = merged_relationship_types[type_name][1]
+    base_arguments = _split_arguments(base_statement[base_match.end():-2])
+    arguments = _split_arguments(statement[match.end():-2])
+    if len(base_arguments) != len(arguments) or any(a.strip() != b.strip() for ind, (a, b) in enumerate(zip(base_arguments, arguments)) if ind != related_index):
+        return None
+    base_related = [i.strip() for i in base_arguments[related_index].strip()[1:-1].split(",") if i.strip()]
+    related = [i.strip() for i in arguments[related_index].strip()[1:-1].split(",") if i.strip()]
+    base_set = set(base_related)
+    if not base_set <= set(related):
+        return None
+    return [i for i in related if i not in base_set]
+
+
+def _entity_ids(value):
+    """Replace entity instances (also in dicts, lists and tuples) by their ids, so they can be sent to worker processes."""
+    if isinstance(value, ifcopenshell.entity_instance):
+        return ("#", value.id())
+    if isinstance(value, dict):
+        return {k: _entity_ids(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and not (len(value) == 2 and value[0] == "#"):
+        return type(value)(_entity_ids(i) for i in value)
+    return value
+
+
+def _entity_instances(model, value):
+    """Inverse of _entity_ids."""
+    if isinstance(value, tuple) and len(value) == 2 and value[0] == "#":
+        return model.by_id(value[1])
+    if isinstance(value, dict):
+        return {k: _entity_instances(model, v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_entity_instances(model, i) for i in value)
+    return value
+
+
+def _add_definition_table(model, elements, rows, create_definition, share):
+    """
+    Create one property definition per distinct row (share) or per element and relate it with IfcRelDefinesByProperties.
+    Returns the definition per element.
+    """
+    groups = {}
+    for ind, row in enumerate(rows):
+        key = tuple(row) if share else ind
+        groups.setdefault(key, []).append(ind)
+    definitions = [None] * len(elements)
+    for key, indices in groups.items():
+        definition = create_definition(rows[indices[0]])
+        model.create_entity("IfcRelDefinesByProperties", GlobalId=ifcopenshell.guid.new(),
+            RelatedObjects=[elements[i] for i in indices], RelatingPropertyDefinition=definition)
+        for i in indices:
+            definitions[i] = definition
+    return definitions
+
+
+def _build_part(task):
+    """Worker: open the shared base model, add the entities of one batch and write the part to its own file."""
+    base_fp, part_fp, build, batch, arguments = task
+    model = ifcopenshell.open(base_fp)
+    build(model, batch, **_entity_instances(model, arguments))
+    model.write(part_fp)
+    return part_fp
 
 
 class IfcUtils:
@@ -12,4 +135,367 @@ class IfcUtils:
         [0,0,1,z],
         [0,0,0,1]
         ])
-        return mat
\ No newline at end of file
+        return mat
+
+    @staticmethod
+    def compact_model(model, properties=False):
+        """
+        Merge structurally identical leaf entities (points, directions, axis placements, measures with unit) and
+        rewrite all references to the remaining instance. Run it right before model.write.
+
+        With properties=True identical property values are merged as well, so psets share them.
+        Afterwards, editing such a property changes it for every pset. Hence, only use it if the model is not edited anymore.
+
+        Returns a dict with the number of removed entities per type.
+        """
+        def key(value):
+            if isinstance(value, ifcopenshell.entity_instance):
+                if value.id():
+                    return ("#", canonical.get(value.id(), value.id()))
+                return (value.is_a(), key(value.wrappedValue))
+            if isinstance(value, tuple):
+                return tuple(key(i) for i in value)
+            return value
+
+        types = compaction_types + (compaction_property_types if properties else [])
+        canonical, removed = {}, {}
+        for ifc_class in types:
+            seen, duplicates = {}, []
+            for entity in model.by_type(ifc_class, include_subtypes=False):
+                entity_key = key(tuple(entity))
+                if entity_key in seen:
+                    canonical[entity.id()] = seen[entity_key].id()
+                    duplicates.append((entity, seen[entity_key]))
+                else:
+                    seen[entity_key] = entity
+            for duplicate, original in duplicates:
+                for inverse in model.get_inverse(duplicate):
+                    ifcopenshell.util.element.replace_attribute(inverse, duplicate, original)
+            model.batch()
+            for duplicate, _ in duplicates:
+                model.remove(duplicate)
+            model.unbatch()
+            removed[ifc_class] = len(duplicates)
+        return removed
+
+    @staticmethod
+    def add_triangulated_representation(model, context, vertices, faces, precision=0.001, closed=None):
+        """
+        Create a body representation from numpy arrays with a single IfcCartesianPointList3D.
+
+        vertices: (n, 3) coordinates
+        faces: (m, 3) vertex indices (0-based) -> IfcTriangulatedFaceSet.
+            Faces with other or mixed numbers of vertices (list of lists) -> IfcPolygonalFaceSet.
+        precision: coordinates are rounded to multiples of precision and identical vertices are merged.
+            None keeps the coordinates as they are.
+
+        Returns the IfcShapeRepresentation. Assign it with ifcopenshell.api.geometry.assign_representation.
+        """
+        vertices = np.asarray(vertices, dtype=float)
+        is_triangulated = not isinstance(faces, list) or all(len(i) == 3 for i in faces)
+        if is_triangulated:
+            faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if precision:
+            quantized = np.ascontiguousarray(np.round(vertices / precision).astype(np.int64))
+            # Unique on a void view of the rows is much faster than np.unique(..., axis=0)
+            _, index, inverse = np.unique(quantized.view(np.dtype((np.void, 24))).ravel(), return_index=True, return_inverse=True)
+            vertices = quantized[index] * precision
+            inverse = inverse.ravel()
+            # Drop faces that degenerated by merging vertices
+            if is_triangulated:
+                faces = inverse[faces]
+                faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+            else:
+                faces = [list(dict.fromkeys(inverse[i].tolist())) for i in faces]
+                faces = [i for i in faces if len(i) >= 3]
+
+        points = model.create_entity("IfcCartesianPointList3D", CoordList=vertices.tolist())
+        if is_triangulated:
+            item = model.create_entity("IfcTriangulatedFaceSet", Coordinates=points, Closed=closed, CoordIndex=(faces + 1).tolist())
+        else:
+            indexed_faces = [model.create_entity("IfcIndexedPolygonalFace", CoordIndex=[int(j) + 1 for j in i]) for i in faces]
+            item = model.create_entity("IfcPolygonalFaceSet", Coordinates=points, Closed=closed, Faces=indexed_faces)
+        return model.create_entity("IfcShapeRepresentation", ContextOfItems=context, RepresentationIdentifier=context.ContextIdentifier,
+            RepresentationType="Tessellation", Items=[item])
+
+    @staticmethod
+    def layer_properties(model, names, properties, pset_name="Pset_SolidStratumCapacity"):
+        """
+        Property values of the soil layers (IfcGeotechnicalStratum, SOLID) in the order of names, e.g. for export_block_model.
+
+        Returns a dict property name -> array with one value per name. nan where a layer or value is missing.
+        """
+        layers = {i.Name: i for i in model.by_type("IfcGeotechnicalStratum") if i.PredefinedType == "SOLID"}
+        psets = {name: ifcopenshell.util.element.get_psets(layers[name]).get(pset_name, {}) if name in layers else {} for name in names}
+        return {prop: np.array([psets[name].get(prop) if psets[name].get(prop) is not None else np.nan for name in names], dtype=float)
+            for prop in properties}
+
+    @staticmethod
+    def template_columns(model, name, prop_names, template=None):
+        """
+        Columns for add_property_table taken from a property set template: (property name, primary measure type, primary unit).
+
+        prop_names: the properties to write, e.g. the keys of the property dicts. The columns keep the order of the template.
+        template: IfcPropertySetTemplate, defaults to the buildingSMART template name of the schema of model,
+            e.g. Pset_SolidStratumCapacity.
+        Raises a ValueError for names that are not defined by the template, instead of dropping their values.
+        """
+        if template is None:
+            template = ifcopenshell.util.pset.get_template(model.schema).get_by_name(name)
+            if template is None:
+                raise ValueError(f"{name} is not a standard property set of {model.schema}")
+        prop_names = set(prop_names)
+        unknown = prop_names - {i.Name for i in template.HasPropertyTemplates}
+        if unknown:
+            raise ValueError(f"The properties {sorted(unknown)} are not defined by the template of {name}")
+        return [(i.Name, i.PrimaryMeasureType, i.PrimaryUnit) for i in template.HasPropertyTemplates if i.Name in prop_names]
+
+    @staticmethod
+    def add_property_table(model, elements, name, columns, rows, template=None, share=True):
+        """
+        Create the property set name for many elements in one pass, without the per element ifcopenshell.api calls.
+
+        columns: (property name, measure type, unit) per column, e.g. ("FrictionAngle", "IfcPlaneAngleMeasure", None).
+            unit None uses the unit of the project.
+        rows: values per element in the order of columns. None writes the property without a value.
+            A tuple (lower, upper, set_point) writes an IfcPropertyBoundedValue.
+        template: IfcPropertySetTemplate. All created psets are related to it by one IfcRelDefinesByTemplate.
+        share: elements with equal rows share one pset and one IfcRelDefinesByProperties, equal properties are one entity.
+            Use share=False if the psets of single elements are edited later.
+
+        Returns the pset per element.
+        """
+        properties = {}
+
+        def create_property(column, value):
+            prop_name, measure_type, unit = column
+            key = (prop_name, measure_type, unit.id() if unit is not None else None, value)
+            if share and key in properties:
+                return properties[key]
+            if isinstance(value, tuple):
+                lower, upper, set_point = (model.create_entity(measure_type, i) if i is not None else None for i in value)
+                prop = model.create_entity("IfcPropertyBoundedValue", Name=prop_name, LowerBoundValue=lower, UpperBoundValue=upper,
+                    SetPointValue=set_point, Unit=unit)
+            else:
+                prop = model.create_entity("IfcPropertySingleValue", Name=prop_name,
+                    NominalValue=model.create_entity(measure_type, value) if value is not None else None, Unit=unit)
+            properties[key] = prop
+            return prop
+
+        def create_pset(row):
+            return model.create_entity("IfcPropertySet", GlobalId=ifcopenshell.guid.new(), Name=name,
+                HasProperties=[create_property(column, value) for column, value in zip(columns, row)])
+
+        psets = _add_definition_table(model, elements, [tuple(i) for i in rows], create_pset, share)
+        if template is not None and psets:
+            model.create_entity("IfcRelDefinesByTemplate", GlobalId=ifcopenshell.guid.new(),
+                RelatedPropertySets=list({i.id(): i for i in psets}.values()), RelatingTemplate=template)
+        return psets
+
+    @staticmethod
+    def add_quantity_table(model, elements, name, columns, rows, method_of_measurement="BaseQuantities", share=True):
+        """
+        Create the quantity set name (IfcElementQuantity) for many elements in one pass, see add_property_table.
+
+        columns: (quantity name, quantity class) per column, e.g. ("Volume", "IfcQuantityVolume"). None omits the quantity.
+        Returns the quantity set per element.
+        """
+        def create_qto(row):
+            # Name, Description, Unit and the value are the first attributes of all simple quantities
+            quantities = [model.create_entity(quantity_class, quantity_name, None, None, value)
+                for (quantity_name, quantity_class), value in zip(columns, row) if value is not None]
+            return model.create_entity("IfcElementQuantity", GlobalId=ifcopenshell.guid.new(), Name=name,
+                MethodOfMeasurement=method_of_measurement, Quantities=quantities)
+
+        return _add_definition_table(model, elements, [tuple(i) for i in rows], create_qto, share)
+
+    @staticmethod
+    def assign_materials(model, elements, material_names):
+        """
+        Associate each element with the material named in material_names (None skips the element) by one
+        IfcRelAssociatesMaterial per material. The materials are looked up once by name.
+        """
+        materials = {i.Name: i for i in model.by_type("IfcMaterial")}
+        groups = {}
+        for element, material_name in zip(elements, material_names):
+            if material_name is not None:
+                groups.setdefault(material_name, []).append(element)
+        return [model.create_entity("IfcRelAssociatesMaterial", GlobalId=ifcopenshell.guid.new(),
+            RelatedObjects=related, RelatingMaterial=materials[material_name]) for material_name, related in groups.items()]
+
+    @staticmethod
+    def add_boreholes(model, bh_data, context, profile, relating_object=None, materials=None):
+        """
+        Create the boreholes (IfcBorehole) and their layers (IfcGeotechnicalStratum, ANSPRACHEBEREICH) from bh_data,
+        see project_data/bh_data.json.
+
+        relating_object: the boreholes are aggregated to it, e.g. the Baugrundaufschlussmodell
+        materials: dict Hauptgruppe -> IfcMaterial assigned to the layers
+
+        Returns the boreholes and a list of layer elements per borehole.
+        """
+        ifc_bhs = []
+        ifc_subelements = []
+        for bh_dict in bh_data:
+            bh = ifcopenshell.api.root.create_entity(model, ifc_class="IfcBorehole", name=bh_dict["Name"])
+            transformation = IfcUtils.transform_mat(bh_dict["x"], bh_dict["y"], bh_dict["OK"])
+            ifcopenshell.api.geometry.edit_object_placement(model, product=bh, matrix=transformation)
+            ifc_bhs.append(bh)
+
+            bh_layer_sublist = []
+            uks = bh_dict["Layerdata"]["UKs"]
+            for layer_ind in range(len(uks)):
+                if layer_ind >= 1000:
+                    raise ValueError("Your Borehole shall not have more than 1000 layer elements")
+                # Note: The ifcopenshell.api.root.create entity handles the userdefined predefined type automatically
+                layerelement = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeotechnicalStratum",
+                    name="{0}_{1:03d}".format(bh_dict["Name"], layer_ind), predefined_type="ANSPRACHEBEREICH")
+
+                top = uks[layer_ind-1] if layer_ind else 0
+                layer_thickness = uks[layer_ind] - top
+                representation = ifcopenshell.api.geometry.add_profile_representation(model, context=context, profile=profile, depth=layer_thickness,
+                    placement_zx_axes=((0.0, 0.0, 1.0), (1.0, 0.0, 0.0)))
+
+                transformation = IfcUtils.transform_mat(bh_dict["x"], bh_dict["y"], bh_dict["OK"] - top - layer_thickness)
+                ifcopenshell.api.geometry.edit_object_placement(model, product=layerelement, matrix=transformation)
+                ifcopenshell.api.geometry.assign_representation(model, product=layerelement, representation=representation)
+                bh_layer_sublist.append(layerelement)
+            ifcopenshell.api.aggregate.assign_object(model, products=bh_layer_sublist, relating_object=bh)
+            ifc_subelements.append(bh_layer_sublist)
+
+        if relating_object is not None and ifc_bhs:
+            ifcopenshell.api.aggregate.assign_object(model, products=ifc_bhs, relating_object=relating_object)
+
+        # Assign materials by Hauptgruppe, one association per material
+        if materials:
+            material_names = {hg: material.Name for hg, material in materials.items()}
+            IfcUtils.assign_materials(model, [layer for layers in ifc_subelements for layer in layers],
+                [material_names.get(hg) for bh_dict in bh_data for hg in bh_dict["Layerdata"]["Hauptgruppen"]])
+        return ifc_bhs, ifc_subelements
+
+    @staticmethod
+    def remove_boreholes(model, names):
+        """
+        Remove the boreholes (IfcBorehole) with the given names together with their layers. Entities (IfcBorehole) may
+        be passed instead of names, e.g. to remove an old version while a new one of the same name exists.
+        Returns the number of removed boreholes.
+        """
+        entities = [i for i in names if isinstance(i, ifcopenshell.entity_instance)]
+        names = {i for i in names if not isinstance(i, ifcopenshell.entity_instance)}
+        boreholes = entities + [i for i in model.by_type("IfcBorehole") if i.Name in names and i not in entities]
+        for bh in boreholes:
+            for layer in ifcopenshell.util.element.get_parts(bh) or []:
+                ifcopenshell.api.root.remove_product(model, product=layer)
+            ifcopenshell.api.root.remove_product(model, product=bh)
+        return len(boreholes)
+
+    @staticmethod
+    def replace_representation(model, product, representation):
+        """
+        Replace the representations of product in the context of representation, e.g. the body of a re-meshed volume.
+        representation None only removes them.
+        """
+        context = representation.ContextOfItems if representation is not None else None
+        if product.Representation is not None:
+            for old in list(product.Representation.Representations):
+                if context is None or old.ContextOfItems == context:
+                    ifcopenshell.api.geometry.unassign_representation(model, product=product, representation=old)
+                    ifcopenshell.api.geometry.remove_representation(model, representation=old)
+        if representation is not None:
+            ifcopenshell.api.geometry.assign_representation(model, product=product, representation=representation)
+
+    @staticmethod
+    def build_parallel(model, build, batches, fp, processes=None, **arguments):
+        """
+        Build parts of a model in worker processes and merge them into the file fp (see merge_models).
+
+        build: module level function build(model, batch, **arguments) adding the entities of one batch, e.g. IfcUtils.add_boreholes
+        batches: e.g. the borehole data split into chunks, or the tiles of a volume model
+        arguments: passed to build. Entities of model (also in lists and dicts) are passed by their id and resolved in the
+            worker's copy of model. build must only add entities and relationships, shared entities must not be edited
+            except for adding related objects to shared relationships (see merge_models).
+
+        Each worker reads the serialized model, so shared entities (project, units, contexts, materials, ...) keep their ids.
+        Returns the merged model. Entities of model have the same ids in it, use merged.by_id(entity.id()).
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            base_fp = os.path.join(tmp, "base.ifc")
+            model.write(base_fp)
+            arguments = _entity_ids(arguments)
+            tasks = [(base_fp, os.path.join(tmp, f"part_{ind}.ifc"), build, batch, arguments) for ind, batch in enumerate(batches)]
+            with multiprocessing.Pool(processes=processes) as pool:
+                part_fps = pool.map(_build_part, tasks)
+            IfcUtils.merge_models(base_fp, part_fps, fp)
+        return ifcopenshell.open(fp)
+
+    @staticmethod
+    def merge_models(base_fp, part_fps, fp):
+        """
+        Merge ifc-spf files that were built from the same base file into fp on text level, without loading them as models.
+
+        Statements of the base are written once. The statements of each part with an id below the largest base id are the
+        shared entities. They have to equal the base statement (including the GlobalId), otherwise a ValueError is raised.
+        Shared relationships of merged_relationship_types are the exception: a part may add related objects to them,
+        e.g. ifcopenshell.api.aggregate.assign_object extends an existing IfcRelAggregates. The related objects are united.
+        All other ids of a part are shifted behind the ids written so far. Relationships of several parts relating to the same
+        shared entity (see merged_relationship_types) are fused into one.
+        """
+        header, shared = [], {}
+        for section, statement in iter_statements(base_fp):
+            if section == "HEADER":
+                header.append(statement)
+            else:
+                shared[int(entity_head.match(statement).group(1))] = statement
+        shared_max = max(shared, default=0)
+        next_id = shared_max + 1
+        fused, extended = {}, {}
+
+        with open(fp, "w", encoding="Latin1") as f:
+            f.write("ISO-10303-21;\nHEADER;\n" + "\n".join(header) + "\nENDSEC;\nDATA;\n")
+            for part_fp in part_fps:
+                offset = next_id - shared_max - 1
+                def renumber(match):
+                    if match.group(1) is None or int(match.group(1)) <= shared_max:
+                        return match.group()
+                    return f"#{int(match.group(1)) + offset}"
+                for section, statement in iter_statements(part_fp):
+                    if section != "DATA":
+                        continue
+                    match = entity_head.match(statement)
+                    entity_id = int(match.group(1))
+                    if entity_id <= shared_max:
+                        if shared.get(entity_id) != statement:
+                            added = _added_related_objects(shared.get(entity_id), _strings_or_references.sub(renumber, statement))
+                            if added is None:
+                                raise ValueError(f"#{entity_id} of {part_fp} differs from the base model. Parts must not edit shared entities")
+                            extended.setdefault(entity_id, []).extend(added)
+                        continue
+                    statement = _strings_or_references.sub(renumber, statement)
+                    match = entity_head.match(statement)
+                    next_id = max(next_id, entity_id + offset + 1)
+                    type_name = match.group(2).upper()
+                    if type_name in merged_relationship_types:
+                        relating_index, related_index = merged_relationship_types[type_name]
+                        arguments = _split_arguments(statement[match.end():-2])
+                        relating = arguments[relating_index]
+                        if relating.startswith("#") and int(relating[1:]) <= shared_max:
+                            key = (type_name, relating)
+                            if key not in fused:
+                                fused[key] = (match.group(1), arguments, [])
+                            fused[key][2].extend(arguments[related_index][1:-1].split(","))
+                            continue
+                    f.write(statement + "\n")
+            # Shared statements are written last, relationships extended by the parts with all related objects
+            for entity_id, statement in shared.items():
+                if entity_id in extended:
+                    match = entity_head.match(statement)
+                    related_index = merged_relationship_types[match.group(2).upper()][1]
+                    arguments = _split_arguments(statement[match.end():-2])
+                    arguments[related_index] = "(" + ",".join(arguments[related_index][1:-1].split(",") + extended[entity_id]) + ")"
+                    statement = statement[:match.end()] + ",".join(arguments) + ");"
+                f.write(statement + "\n")
+            for (type_name, _), (entity_id, arguments, related) in fused.items():
+                related_index = merged_relationship_types[type_name][1]
+                arguments[related_index] = "(" + ",".join(related) + ")"
+                f.write(f"#{entity_id}={type_name}(" + ",".join(arguments) + ");\n")
+            f.write("ENDSEC;\nEND-ISO-10303-21;\n")
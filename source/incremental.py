@@ -0,0 +1,126 @@
+import numpy as np
+import ifcopenshell.api.root
+import ifcopenshell.api.pset
+import ifcopenshell.api.geometry
+import ifcopenshell.api.aggregate
+import ifcopenshell.api.spatial
+import ifcopenshell.util.element
+from geotmodelling import prepare_points_from_connections, changed_boreholes, build_stacked_volumes
+from tiledmodelling import update_surface
+from stratigraphy import layer_quantities
+from ifcutils import IfcUtils
+
+
+def update_stack(x_arr, y_arr, raw_stack, old_bh_data, new_bh_data, surfaces, neighbors=50):
+    """
+    Update the interpolated surfaces after boreholes were added, removed or edited (see update_surface).
+
+    raw_stack: (n_surfaces, nx, ny) surfaces as interpolated with neighbors nearest points, before enforce_conformance
+    surfaces: from top to bottom, either (above, below) as in prepare_points_from_connections, (above, below, constraints)
+        with additional data points (x, y, z) that do not change, or a fixed grid (nx, ny), e.g. the topography or the base.
+        Fixed grids are taken as they are.
+    Returns the updated raw stack and the mask (n_surfaces, nx, ny) of the grid points that changed.
+    Apply enforce_conformance to the result as for the full model.
+    """
+    stack = np.array(raw_stack, dtype=float)
+    mask = np.zeros(stack.shape, dtype=bool)
+    for ind, surface in enumerate(surfaces):
+        if isinstance(surface, np.ndarray):
+            mask[ind] = surface != stack[ind]
+            stack[ind] = surface
+            continue
+        constraints = np.asarray(surface[2] if len(surface) > 2 else [], dtype=float).reshape(-1, 3)
+        old_xyz = np.concatenate([np.column_stack(prepare_points_from_connections(old_bh_data, *surface[:2])).reshape(-1, 3), constraints])
+        new_xyz = np.concatenate([np.column_stack(prepare_points_from_connections(new_bh_data, *surface[:2])).reshape(-1, 3), constraints])
+        stack[ind], mask[ind] = update_surface(x_arr, y_arr, stack[ind], old_xyz, new_xyz, neighbors=neighbors)
+    return stack, mask
+
+
+def changed_layers(old_stack, new_stack, names, eps=1e-6):
+    """Names of the layers whose top or bottom changed by more than eps anywhere. Surfaces are clipped as in build_stacked_volumes."""
+    old_stack = np.minimum.accumulate(np.asarray(old_stack, dtype=float), axis=0)
+    new_stack = np.minimum.accumulate(np.asarray(new_stack, dtype=float), axis=0)
+    changed = (np.abs(new_stack - old_stack) > eps).reshape(len(new_stack), -1).any(axis=1)
+    return [name for ind, name in enumerate(names) if changed[ind] or changed[ind + 1]]
+
+
+def update_model(model, context, x_arr, y_arr, old_stack, new_stack, names, old_bh_data, new_bh_data, profile,
+        bh_relating_object=None, materials=None, layer_relating_object=None, layer_materials=None, meshes=None,
+        qto_name="Qto_VolumetricStratumBaseQuantities"):
+    """
+    Update a model created by create_ifc_model.py in place instead of creating it again.
+
+    old_stack, new_stack: conformed surface stacks (n_surfaces, nx, ny) before and after the change, see update_stack
+    names: layer names as in build_stacked_volumes, e.g. ["A", "G", "S"]
+    meshes: the volumes of new_stack as returned by build_stacked_volumes. Built for the changed layers if not given.
+    Only the soil layers (IfcGeotechnicalStratum, SOLID) whose top or bottom changed are meshed again. Their body
+    representation is replaced and the Volume and PlanArea of qto_name are updated. Layers without thickness are
+    removed, layers gaining thickness are created, aggregated to layer_relating_object (default: the aggregate of the
+    other layers) and associated with the material named layer_materials[name]. They get qto_name if the other layers
+    have it, further psets have to be added by the caller.
+    Removed and edited boreholes are deleted, added and edited ones are created again (see IfcUtils.add_boreholes).
+    Edited boreholes keep their psets, added ones get the psets shared by all previous boreholes. Both are aggregated
+    to bh_relating_object (default: the aggregate of the previous boreholes) or contained in the spatial structure of
+    the previous boreholes.
+
+    Returns the names of the updated, created and removed layers and the added, removed and edited boreholes.
+    """
+    layers = {i.Name: i for i in model.by_type("IfcGeotechnicalStratum") if i.PredefinedType == "SOLID"}
+    changed = changed_layers(old_stack, new_stack, names)
+    clipped = np.minimum.accumulate(np.asarray(new_stack, dtype=float), axis=0)
+    has_qto = any(qto_name in ifcopenshell.util.element.get_psets(i, qtos_only=True) for i in layers.values())
+    if layer_relating_object is None and layers:
+        layer_relating_object = ifcopenshell.util.element.get_aggregate(next(iter(layers.values())))
+    updated, created, removed_layers = [], [], []
+    for name in changed:
+        ind = names.index(name)
+        vertices, faces = meshes[name] if meshes is not None else build_stacked_volumes(x_arr, y_arr, clipped[ind:ind + 2], names=[name])[name]
+        if not len(faces):
+            if name in layers:
+                ifcopenshell.api.root.remove_product(model, product=layers.pop(name))
+                removed_layers.append(name)
+            continue
+        representation = IfcUtils.add_triangulated_representation(model, context=context, vertices=vertices, faces=faces, closed=True)
+        quantities = layer_quantities(x_arr, y_arr, clipped[ind:ind + 2], names=[name])[name]
+        if name in layers:
+            IfcUtils.replace_representation(model, layers[name], representation)
+            qto = ifcopenshell.util.element.get_psets(layers[name], qtos_only=True).get(qto_name)
+            if qto is not None:
+                ifcopenshell.api.pset.edit_qto(model, qto=model.by_id(qto["id"]), properties={"Volume": quantities["volume"], "PlanArea": quantities["area"]})
+            updated.append(name)
+            continue
+        layer = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeotechnicalStratum", predefined_type="SOLID", name=name)
+        ifcopenshell.api.geometry.assign_representation(model, product=layer, representation=representation)
+        if layer_relating_object is not None:
+            ifcopenshell.api.aggregate.assign_object(model, products=[layer], relating_object=layer_relating_object)
+        if layer_materials is not None:
+            IfcUtils.assign_materials(model, [layer], [layer_materials.get(name)])
+        if has_qto:
+            IfcUtils.add_quantity_table(model, [layer], qto_name, [("Volume", "IfcQuantityVolume"), ("PlanArea", "IfcQuantityArea")],
+                [[quantities["volume"], quantities["area"]]], share=False)
+        layers[name] = layer
+        created.append(name)
+
+    added, removed, edited = changed_boreholes(old_bh_data, new_bh_data)
+    old_boreholes = model.by_type("IfcBorehole")
+    psets = {i.Name: [rel.RelatingPropertyDefinition for rel in i.IsDefinedBy if rel.is_a("IfcRelDefinesByProperties")] for i in old_boreholes}
+    shared = [pset for pset in next(iter(psets.values()), []) if all(pset in i for i in psets.values())]
+    container = None
+    if old_boreholes:
+        if bh_relating_object is None:
+            bh_relating_object = ifcopenshell.util.element.get_aggregate(old_boreholes[0])
+        if bh_relating_object is None:
+            container = ifcopenshell.util.element.get_container(old_boreholes[0])
+
+    # The new versions are created before the old ones are removed, so psets used by both are kept
+    recreated = set(added + edited)
+    new_boreholes, _ = IfcUtils.add_boreholes(model, [i for i in new_bh_data if i["Name"] in recreated], context, profile,
+        relating_object=bh_relating_object, materials=materials)
+    if container is not None and new_boreholes:
+        ifcopenshell.api.spatial.assign_container(model, products=new_boreholes, relating_structure=container)
+    for bh in new_boreholes:
+        for pset in psets.get(bh.Name, shared):
+            ifcopenshell.api.pset.assign_pset(model, products=[bh], pset=pset)
+    obsolete = set(removed + edited)
+    IfcUtils.remove_boreholes(model, [i for i in old_boreholes if i.Name in obsolete])
+    return {"layers": updated, "created": created, "removed_layers": removed_layers, "added": added, "removed": removed, "edited": edited}
@@ -0,0 +1,132 @@
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.spatial import cKDTree
+
+
+def spherical(h, nugget, sill, range_):
+    h = np.minimum(h / range_, 1.)
+    return nugget + (sill - nugget) * (1.5 * h - 0.5 * h ** 3)
+
+
+def exponential(h, nugget, sill, range_):
+    return nugget + (sill - nugget) * (1. - np.exp(-3. * h / range_))
+
+
+def gaussian(h, nugget, sill, range_):
+    return nugget + (sill - nugget) * (1. - np.exp(-3. * (h / range_) ** 2))
+
+
+# Variogram models (nugget, sill, practical range_)
+variogram_models = {"spherical": spherical, "exponential": exponential, "gaussian": gaussian}
+
+
+def experimental_variogram(data_xyz, n_lags=15, max_lag=None):
+    """
+    Binned experimental semivariogram. The point pairs closer than max_lag are found with a KD-tree range query.
+
+    max_lag defaults to half of the diagonal of the bounding box of the data.
+    Returns the mean distance, the semivariance and the number of pairs per lag (empty lags are dropped).
+    """
+    data_xyz = np.asarray(data_xyz, dtype=float).reshape(-1, 3)
+    if len(data_xyz) < 2:
+        raise ValueError(f"The experimental variogram needs at least 2 data points, got {len(data_xyz)}")
+    xy, z = data_xyz[:, :2], data_xyz[:, 2]
+    if max_lag is None:
+        max_lag = 0.5 * np.hypot(*(xy.max(axis=0) - xy.min(axis=0)))
+    pairs = cKDTree(xy).query_pairs(r=max_lag, output_type="ndarray")
+    distance = np.hypot(*(xy[pairs[:, 0]] - xy[pairs[:, 1]]).T)
+    semivariance = 0.5 * (z[pairs[:, 0]] - z[pairs[:, 1]]) ** 2
+    lag = np.minimum((distance / max_lag * n_lags).astype(np.int64), n_lags - 1)
+    counts = np.bincount(lag, minlength=n_lags)
+    used = counts > 0
+    return (np.bincount(lag, weights=distance, minlength=n_lags)[used] / counts[used],
+        np.bincount(lag, weights=semivariance, minlength=n_lags)[used] / counts[used],
+        counts[used])
+
+
+def fit_variogram(lags, semivariance, counts, model="spherical"):
+    """
+    Fit a variogram model to the experimental variogram, weighted by the number of pairs. Returns (nugget, sill, range_).
+    With less than 3 lags the initial guess is returned. Raises a ValueError for an empty variogram (no point pairs)
+    and a RuntimeError if the fit does not converge, pass the params to OrdinaryKriging then.
+    """
+    if len(lags) == 0:
+        raise ValueError("The experimental variogram is empty, no point pairs are closer than max_lag")
+    function = variogram_models[model]
+    initial = (0., max(semivariance.max(), 1e-12), max(lags.max() / 2, 1e-12))
+    upper = (semivariance.max() * 2 + 1e-12, semivariance.max() * 2 + 1e-12, lags.max() * 10 + 1e-12)
+    if len(lags) < 3:
+        return initial
+    try:
+        params, _ = curve_fit(function, lags, semivariance, p0=initial, sigma=1 / np.sqrt(counts), bounds=((0., 0., 1e-12), upper))
+    except RuntimeError as error:
+        raise RuntimeError(f"The {model} variogram did not converge for {len(lags)} lags (initial guess {initial}). "
+            "Pass params=(nugget, sill, range_) instead") from error
+    return tuple(params)
+
+
+class OrdinaryKriging:
+    """
+    Ordinary kriging with local neighbourhoods.
+
+    The variogram is fitted to the experimental variogram of the data unless params (nugget, sill, range_) are given.
+    Each estimate uses the neighbors nearest data points. The local systems of a block of target points are inverted as
+    one batch, once per distinct neighbourhood, so thousands of contact points and large grids can be handled.
+
+    # Example
+    kriging = OrdinaryKriging(xyz_data)
+    x_grid, y_grid, z_grid, variance = kriging.grid(xmin=x_min, ymin=y_min, xmax=x_max, ymax=y_max)
+    """
+
+    def __init__(self, data_xyz, model="spherical", params=None, neighbors=16, n_lags=15, max_lag=None):
+        data_xyz = np.asarray(data_xyz, dtype=float)
+        self.xy, self.z = data_xyz[:, :2], data_xyz[:, 2]
+        self.model = model
+        self.neighbors = min(neighbors, len(data_xyz))
+        if params is None:
+            self.variogram = experimental_variogram(data_xyz, n_lags=n_lags, max_lag=max_lag)
+            params = fit_variogram(*self.variogram, model=model)
+        self.params = tuple(params)
+        self.tree = cKDTree(self.xy)
+
+    def gamma(self, h):
+        """Variogram with gamma(0) = 0, the nugget applies to distances larger than zero only."""
+        return np.where(h > 0, variogram_models[self.model](h, *self.params), 0.)
+
+    def predict(self, points_xy, block_size=4096):
+        """Estimate and kriging variance at points_xy (n, 2)."""
+        points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+        k = self.neighbors
+        estimate, variance = np.empty(len(points_xy)), np.empty(len(points_xy))
+        for start in range(0, len(points_xy), block_size):
+            block = points_xy[start:start + block_size]
+            _, index = self.tree.query(block, k=k)
+            index = np.sort(index.reshape(len(block), k), axis=1)
+            # Neighbouring target points mostly share their neighbourhood. Its system is inverted once.
+            neighbourhoods, which = np.unique(index, axis=0, return_inverse=True)
+            which = which.ravel()
+            neighbours = self.xy[neighbourhoods]
+            system = np.ones((len(neighbourhoods), k + 1, k + 1))
+            system[:, :k, :k] = self.gamma(np.linalg.norm(neighbours[:, :, None] - neighbours[:, None], axis=-1))
+            system[:, k, k] = 0.
+            # The pseudo inverse also covers singular systems, e.g. duplicate points
+            try:
+                inverse = np.linalg.inv(system)
+            except np.linalg.LinAlgError:
+                inverse = np.linalg.pinv(system)
+            rhs = np.ones((len(block), k + 1))
+            rhs[:, :k] = self.gamma(np.linalg.norm(self.xy[index] - block[:, None], axis=-1))
+            solution = np.einsum("nij,nj->ni", inverse[which], rhs)
+            estimate[start:start + len(block)] = (solution[:, :k] * self.z[index]).sum(axis=1)
+            variance[start:start + len(block)] = (solution * rhs).sum(axis=1)
+        return estimate, np.maximum(variance, 0.)
+
+    def grid(self, xmin=None, xmax=None, ymin=None, ymax=None, grid_x=1, grid_y=1, block_size=4096):
+        """Estimate on the grid np.mgrid[xmin:xmax:grid_x, ymin:ymax:grid_y] as in interpolate_rbf. Returns x, y, z and the variance grid."""
+        xmin = xmin if xmin is not None else self.xy[:, 0].min()
+        xmax = xmax if xmax is not None else self.xy[:, 0].max()
+        ymin = ymin if ymin is not None else self.xy[:, 1].min()
+        ymax = ymax if ymax is not None else self.xy[:, 1].max()
+        xgrid = np.mgrid[xmin:xmax:grid_x, ymin:ymax:grid_y]
+        estimate, variance = self.predict(xgrid.reshape(2, -1).T, block_size=block_size)
+        return *xgrid, estimate.reshape(xgrid.shape[1:]), variance.reshape(xgrid.shape[1:])
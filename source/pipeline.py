@@ -0,0 +1,193 @@
+import hashlib
+import importlib.util
+import inspect
+import marshal
+import os
+import pickle
+import time
+from pathlib import Path
+import numpy as np
+
+
+def _function_source(function):
+    """Source of a function, or its byte code if the source is not available (e.g. a Blender text block)."""
+    try:
+        return inspect.getsource(function).encode()
+    except (OSError, TypeError):
+        return marshal.dumps(function.__code__)
+
+
+def _update(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(b"ndarray" + str((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else pickle.dumps(value))
+    elif isinstance(value, Path):
+        # Files are hashed by their content, so editing e.g. bh_data.json invalidates the stages reading it
+        digest.update(b"file" + str(value).encode())
+        with open(value, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    elif isinstance(value, dict):
+        digest.update(b"dict%d" % len(value))
+        for key in sorted(value, key=repr):
+            _update(digest, key)
+            _update(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(type(value).__name__.encode() + b"%d" % len(value))
+        for i in value:
+            _update(digest, i)
+    elif value is None or isinstance(value, (str, bytes, bool, int, float, np.generic)):
+        digest.update(type(value).__name__.encode() + repr(value).encode())
+    elif callable(value):
+        digest.update(b"function" + _function_source(value))
+    else:
+        digest.update(pickle.dumps(value))
+
+
+# Modules called by the stages of create_ifc_model.py. Their source is part of every cache key.
+default_modules = ("geotmodelling", "blenderutils", "ifcutils", "ifcstreaming", "qualityutils", "stratigraphy", "tiledmodelling", "projecttemplate",
+    "incremental")
+
+
+def modules_hash(modules):
+    """Hash of the source files of the modules (by name). Modules that cannot be found are hashed by their name."""
+    files = []
+    for name in modules:
+        spec = importlib.util.find_spec(name)
+        files.append(Path(spec.origin) if spec is not None and spec.origin and os.path.isfile(spec.origin) else name)
+    return content_hash(files)
+
+
+def content_hash(value):
+    """sha256 of nested dicts, lists and tuples of numpy arrays, strings, numbers and files (pathlib.Path)."""
+    digest = hashlib.sha256()
+    _update(digest, value)
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    Named stages with explicit inputs and outputs, cached on disk.
+
+    A stage is a function receiving the results of its input stages as keyword arguments named after them, plus its
+    parameters. It is added after its inputs, so the stages form a DAG in the order they were added.
+    The cache key of a stage is the hash of the content of its inputs, its parameters, the source of its function and
+    the source of the modules (default_modules), so editing e.g. enforce_conformance invalidates the cached results.
+    If a stage runs again but returns the same result, the stages depending on it are still loaded from the cache.
+    Code outside of modules is not part of the key. Pass the reserved parameter version=... to add() when it changes,
+    it is hashed but not passed to the function.
+    Results have to be picklable, e.g. numpy arrays or IFC models serialized with model.to_string().
+
+    A stage may have an update function. If only its inputs changed since its last run (same function, update function,
+    parameters and modules), update(previous, **inputs, **params) is called with the previous result instead of the
+    function, e.g. to re-mesh only the layers touched by edited boreholes. It has to return what the function would
+    return for the new inputs. Results needed to compare the inputs (e.g. the previous borehole data) have to be part of
+    the result. It may call the function itself if an update is not possible.
+
+    # Example
+    pipeline = Pipeline(parent_path + "/project_data/cache")
+    pipeline.add("surfaces", surfaces, inputs=["data"], seed=0)
+    pipeline.add("volumes", volumes, inputs=["surfaces"], update=update_volumes)
+    results = pipeline.run()
+    print(pipeline.report())
+    """
+
+    def __init__(self, cache_dir, enabled=True, modules=default_modules):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.modules = tuple(modules)
+        self.stages = {}
+        self.stats = []
+
+    def add(self, name, function, inputs=(), update=None, **params):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} exists already")
+        unknown = [i for i in inputs if i not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage {name}: the input stages {unknown} have to be added first")
+        self.stages[name] = (function, tuple(inputs), params, update)
+
+    def stage(self, inputs=(), name=None, update=None, **params):
+        """Decorator adding the function as stage, named after the function by default."""
+        def decorator(function):
+            self.add(name or function.__name__, function, inputs=inputs, update=update, **params)
+            return function
+        return decorator
+
+    def _required(self, targets):
+        required, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in required:
+                required.add(name)
+                todo.extend(self.stages[name][1])
+        return required
+
+    def run(self, targets=None):
+        """Run the stages needed for targets (default: all). Returns a dict stage name -> result."""
+        required = self._required(targets if targets is not None else list(self.stages))
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        results, hashes = {}, {}
+        self.stats = []
+        code_hash = modules_hash(self.modules)
+        for name, (function, inputs, params, update) in self.stages.items():
+            if name not in required:
+                continue
+            start = time.perf_counter()
+            # Everything but the inputs. The pointer file names the key of the last result, which can be updated.
+            base = content_hash([name, _function_source(function), _function_source(update) if update else None, code_hash, params])
+            key = content_hash([base, [hashes[i] for i in inputs]])
+            fp = os.path.join(self.cache_dir, f"{name}_{key[:24]}.pkl")
+            latest_fp = os.path.join(self.cache_dir, f"{name}_{base[:24]}.latest")
+            hit = self.enabled and os.path.exists(fp)
+            updated = False
+            if hit:
+                with open(fp, "rb") as f:
+                    results[name], hashes[name] = pickle.load(f)
+            else:
+                arguments = {k: v for k, v in params.items() if k != "version"}
+                previous = self._latest(latest_fp) if update is not None and self.enabled else None
+                if previous is not None:
+                    results[name] = update(previous, **{i: results[i] for i in inputs}, **arguments)
+                    updated = True
+                else:
+                    results[name] = function(**{i: results[i] for i in inputs}, **arguments)
+                hashes[name] = content_hash(results[name])
+                if self.enabled:
+                    # Written to a temporary file first, an interrupted run must not leave a broken cache entry
+                    with open(fp + ".tmp", "wb") as f:
+                        pickle.dump((results[name], hashes[name]), f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(fp + ".tmp", fp)
+            if self.enabled and update is not None:
+                with open(latest_fp, "w") as f:
+                    f.write(os.path.basename(fp))
+            self.stats.append({"stage": name, "seconds": time.perf_counter() - start, "hit": hit, "updated": updated, "key": key})
+        return results
+
+    def _latest(self, latest_fp):
+        """The last result of a stage (see update in add), None if there is none."""
+        if not os.path.exists(latest_fp):
+            return None
+        with open(latest_fp) as f:
+            fp = os.path.join(self.cache_dir, f.read().strip())
+        if not os.path.exists(fp):
+            return None
+        with open(fp, "rb") as f:
+            return pickle.load(f)[0]
+
+    def report(self):
+        """Runtime and cache hit of each stage of the last run and the hit rate."""
+        lines = [f"{'stage':<20}{'seconds':>10}  cache"]
+        lines += [f"{i['stage']:<20}{i['seconds']:>10.3f}  {'hit' if i['hit'] else 'update' if i['updated'] else 'miss'}" for i in self.stats]
+        hits = sum(i["hit"] for i in self.stats)
+        lines.append(f"{'total':<20}{sum(i['seconds'] for i in self.stats):>10.3f}  {hits}/{len(self.stats)} hits "
+            f"({hits / max(len(self.stats), 1):.0%})")
+        return "\n".join(lines)
+
+    def clear(self):
+        """Remove all cached results."""
+        if os.path.isdir(self.cache_dir):
+            for i in os.listdir(self.cache_dir):
+                if i.endswith((".pkl", ".latest")):
+                    os.remove(os.path.join(self.cache_dir, i))
@@ -0,0 +1,157 @@
+import json
+import os
+import ifcopenshell
+import ifcopenshell.guid
+import ifcopenshell.api
+import ifcopenshell.api.root
+import ifcopenshell.api.unit
+import ifcopenshell.api.context
+import ifcopenshell.api.aggregate
+import ifcopenshell.api.spatial
+import ifcopenshell.api.material
+import ifcopenshell.api.style
+import ifcopenshell.api.pset_template
+
+
+class ProjectTemplate:
+    """
+    Project header shared by all models: units (incl. DEGREE, kg_per_m3 and g_per_m3), contexts, site and building,
+    the geomodels, the DIN 4023 materials with their surface styles, the borehole profile and the pset template
+    Fachsektionstage2025_template.
+
+    It is built once with the ifcopenshell.api and kept serialized. clone() parses it into a new model, which is much
+    faster than building it again, e.g. when many project models are generated in a batch.
+
+    # Example
+    template = ProjectTemplate.from_resources(parent_path+"/resources")
+    model, handles = template.clone(name="Projekt_Fachsektionstage2025")
+    IfcUtils.add_boreholes(model, bh_data, handles["body"], handles["profile"], relating_object=handles["baugrundaufschlussmodell"])
+    """
+
+    def __init__(self, ifc, ids):
+        """ifc: the serialized model (model.to_string()), ids: dict handle name -> entity id"""
+        self.ifc = ifc
+        self.ids = dict(ids)
+
+    @classmethod
+    def build(cls, farbcode_DIN4023, mapping_DIN4023, materials=("Auffuellung", "Kies", "Sand"), name="Projekt_Fachsektionstage2025",
+            description="Ein akademisches Projekt, das Teil des Beitrags von Johannes Beck zu den Fachsektionstagen Geotechnik 2025 in Würzburg ist"):
+        model = ifcopenshell.file(schema="IFC4X3")
+
+        # All projects must have one IFC Project element
+        project = ifcopenshell.api.root.create_entity(model, ifc_class="IfcProject", name=name)
+        project.Description = description
+
+        # Assigning without arguments defaults to metric units
+        length_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="LENGTHUNIT") # Note: Default is mm, here meter (without prefix)
+        area_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="AREAUNIT")
+        money_unit = ifcopenshell.api.unit.add_monetary_unit(model, currency="EUR")
+        mass_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="MASSUNIT", prefix="KILO")
+        angle_unit = ifcopenshell.api.unit.add_si_unit(model, unit_type="PLANEANGLEUNIT") # RADIAN
+
+        # Angles in degrees instead of radians.
+        val = model.create_entity("IFCPLANEANGLEMEASURE", 1.74532925199433E-2)
+        measure_unit = model.create_entity("IFCMEASUREWITHUNIT", UnitComponent=angle_unit, ValueComponent=val)
+        dim_exp = model.create_entity("IFCDIMENSIONALEXPONENTS", 0, 0, 0, 0, 0, 0, 0)
+        angle_unit_degrees = model.create_entity("IFCCONVERSIONBASEDUNIT", ConversionFactor=measure_unit, Name="DEGREE", UnitType="PLANEANGLEUNIT", Dimensions=dim_exp)
+
+        # Mass unit kg_m3
+        x1 = model.create_entity("IFCDERIVEDUNITELEMENT", mass_unit, 1)
+        x2 = model.create_entity("IFCDERIVEDUNITELEMENT", length_unit, -3)
+        kg_per_m3 = model.create_entity("IFCDERIVEDUNIT", Elements=[x1, x2], UnitType="MASSDENSITYUNIT", Name="kg_per_m3")
+
+        # g for reference.
+        val = model.create_entity("IFCMASSMEASURE", 0.001)
+        measure_unit = model.create_entity("IFCMEASUREWITHUNIT", UnitComponent=mass_unit, ValueComponent=val)
+        dim_exp = model.create_entity("IFCDIMENSIONALEXPONENTS", 0, 1, 0, 0, 0, 0, 0)
+        mass_unit_g = model.create_entity("IFCCONVERSIONBASEDUNIT", ConversionFactor=measure_unit, Name="GRAMM", UnitType="MASSUNIT", Dimensions=dim_exp)
+        x1 = model.create_entity("IFCDERIVEDUNITELEMENT", mass_unit_g, 1)
+        x2 = model.create_entity("IFCDERIVEDUNITELEMENT", length_unit, -3)
+        g_per_m3 = model.create_entity("IFCDERIVEDUNIT", Elements=[x1, x2], UnitType="MASSDENSITYUNIT", Name="g_per_m3")
+
+        ifcopenshell.api.unit.assign_unit(model, units=[length_unit, area_unit, money_unit, angle_unit_degrees, kg_per_m3, g_per_m3])
+
+        # Create the 3D context - for body representations
+        context_3D = ifcopenshell.api.context.add_context(model, context_type="Model")
+        body = ifcopenshell.api.context.add_context(model, context_type="Model", context_identifier="Body", target_view="MODEL_VIEW", parent=context_3D)
+
+        # Create a site and building according to IFC structure
+        site = ifcopenshell.api.root.create_entity(model, ifc_class="IfcSite", name="Baustelle_Fachsektionstage")
+        building = ifcopenshell.api.root.create_entity(model, ifc_class="IfcBuilding", name="Bauwerk1")
+        ifcopenshell.api.aggregate.assign_object(model, products=[site], relating_object=project)
+        ifcopenshell.api.aggregate.assign_object(model, products=[building], relating_object=site)
+
+        # Create Geomodel
+        baugrundschichtenmodell = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeomodel", name="Baugrundschichtenmodell")
+        baugrundaufschlussmodell = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeomodel", name="Baugrundaufschlussmodell")
+        ifcopenshell.api.spatial.assign_container(model, products=[baugrundschichtenmodell, baugrundaufschlussmodell], relating_structure=site)
+
+        for i in materials:
+            material = ifcopenshell.api.material.add_material(model, name=i)
+            style = ifcopenshell.api.style.add_style(model)
+            colour = farbcode_DIN4023[mapping_DIN4023[i]]
+            ifcopenshell.api.style.add_surface_style(model, style=style, ifc_class="IfcSurfaceStyleShading", attributes={
+                "SurfaceColour": {"Name": "{}Style".format(i), "Red": colour[0]/255, "Green": colour[1]/255, "Blue": colour[2]/255},
+                "Transparency": 0., # 0 is opaque, 1 is transparent
+                })
+            # Note: Material can be assigned to both object and materials. If directly assigned, it is used to overwrite
+            ifcopenshell.api.style.assign_material_style(model, material=material, style=style, context=context_3D)
+
+        # Create the profile used to construct boreholes
+        profile = model.create_entity("IfcCircleProfileDef", ProfileName="300C", ProfileType="AREA", Radius=0.300) # Note: Watch the choses IFCLENGHTUNIT
+
+        # Add custom properties using a custom property template
+        pset_template = ifcopenshell.api.pset_template.add_pset_template(model, name="Fachsektionstage2025_template")
+        prop = ifcopenshell.api.pset_template.add_prop_template(model, pset_template=pset_template, name="WichteFeucht", description="Feuchtwichte des Bodens",
+            template_type="P_SINGLEVALUE", primary_measure_type="IfcMassDensityMeasure") #kg/m3
+        prop.PrimaryUnit = g_per_m3
+        prop = ifcopenshell.api.pset_template.add_prop_template(model, pset_template=pset_template, name="WichteUnterAuftrieb", description="Wichte des Bodens unter Auftrieb",
+            template_type="P_BOUNDEDVALUE", primary_measure_type="IfcMassDensityMeasure") #kg/m3
+        prop.PrimaryUnit = kg_per_m3
+        prop.SecondaryUnit = kg_per_m3
+
+        handles = {"project": project, "context_3D": context_3D, "body": body, "site": site, "building": building,
+            "baugrundschichtenmodell": baugrundschichtenmodell, "baugrundaufschlussmodell": baugrundaufschlussmodell,
+            "profile": profile, "kg_per_m3": kg_per_m3, "g_per_m3": g_per_m3, "pset_template": pset_template}
+        return cls(model.to_string(), {k: v.id() for k, v in handles.items()})
+
+    @classmethod
+    def from_resources(cls, resources_dir, **kwargs):
+        """Build the template from farbcode_DIN4023.json and mapping_DIN4023.json in the resources folder."""
+        with open(os.path.join(resources_dir, "farbcode_DIN4023.json"), "r", encoding="Latin1") as f:
+            farbcode_DIN4023 = json.load(f)
+        with open(os.path.join(resources_dir, "mapping_DIN4023.json"), "r", encoding="Latin1") as f:
+            mapping_DIN4023 = json.load(f)
+        return cls.build(farbcode_DIN4023, mapping_DIN4023, **kwargs)
+
+    def save(self, fp):
+        """Write the template as ifc file with the ids of the handles in fp + ".json"."""
+        with open(fp, "w", encoding="utf-8") as f:
+            f.write(self.ifc)
+        with open(fp + ".json", "w") as f:
+            json.dump(self.ids, f)
+
+    @classmethod
+    def load(cls, fp):
+        with open(fp, "r", encoding="utf-8") as f:
+            ifc = f.read()
+        with open(fp + ".json") as f:
+            ids = json.load(f)
+        return cls(ifc, ids)
+
+    def clone(self, name=None, description=None, new_guids=True):
+        """
+        New model from the template. Returns the model and the dict of handles (project, body, site, profile, ...).
+
+        new_guids: assign new GlobalIds, so the models of a batch do not share the ids of their project, site, ...
+        """
+        model = ifcopenshell.file.from_string(self.ifc)
+        if new_guids:
+            for element in model.by_type("IfcRoot"):
+                element.GlobalId = ifcopenshell.guid.new()
+        handles = {k: model.by_id(v) for k, v in self.ids.items()}
+        if name is not None:
+            handles["project"].Name = name
+        if description is not None:
+            handles["project"].Description = description
+        return model, handles
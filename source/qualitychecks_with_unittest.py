@@ -2,22 +2,56 @@ import unittest
 from collections import Counter
 import os
 import re
+import sys
 import ifcopenshell
 from ifcopenshell.api import run
 import ifcopenshell.util.element
 import ifcopenshell.util.selector
 import numpy as np
-from scipy.spatial import Delaunay
 from scipy.interpolate import griddata, LinearNDInterpolator
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 parent_path = os.path.dirname(dir_path)
+if dir_path not in sys.path:
+    sys.path.append(dir_path)
+
+from ifcstreaming import StreamingModel, profile_file_size, format_size_profile
+from qualityutils import analyse_borehole_spacing, UnitResolver, MaterialStyleResolver, load_colours_DIN4023, tessellated_volume
+
 fp = parent_path+"/project_data/script_output_4x3_with_errors.ifc" 
 #fp = parent_path+"/project_data/script_output_4x3.ifc" # Hinweis: Abstand der Bohrungen ist nicht korrekt
-model = ifcopenshell.open(fp)
 
+# Streaming-Modus (Umgebungsvariable QA_STREAMING=1) für große, geometrielastige Modelle:
+# Es werden nur die Entitätstypen eingelesen, die die folgenden Prüfungen deklarieren. Alle anderen Prüfungen werden übersprungen.
+streaming = os.environ.get("QA_STREAMING", "0") == "1"
+streaming_types = {
+    "test_namingconvention_ifcborehole": ["IfcBorehole"], # IV
+    "test_uniquenames_ifcbores": ["IfcBorehole"], # V
+    "test_bounds_cohesion": ["IfcSimpleProperty", "IfcPropertySet"], # X
+    "test_unit_": ["IfcSimpleProperty", "IfcUnitAssignment", "IfcNamedUnit", "IfcDerivedUnit", "IfcDerivedUnitElement", "IfcMeasureWithUnit", "IfcMonetaryUnit"], # XIII
+    "test_nominal_values_in_bounds": ["IfcPropertyBoundedValue"], # XV
+}
+
+# Bohrraster (VII): Kategorie nach DIN EN 1997-2 Anlage B3 je Bereich. spacing_zones: [(Polygon als xy-Liste, Kategorie)]
+spacing_category = "grossflaechige_bauwerke"
+spacing_zones = []
+
+if streaming:
+    model = StreamingModel(fp, sorted({i for types in streaming_types.values() for i in types}))
+else:
+    model = ifcopenshell.open(fp)
+
+# Einheitenkontext des Modells, einmalig aufgebaut
+units = UnitResolver(model)
 
-class TestBoreholes(unittest.TestCase):
+
+class QualityCheck(unittest.TestCase):
+    def setUp(self):
+        if streaming and self._testMethodName not in streaming_types:
+            self.skipTest("Im Streaming-Modus nicht verfügbar")
+
+
+class TestBoreholes(QualityCheck):
     def test_ifcborehole_has_pset_ifcboreholecommon(self):
         """I.	Jedes Objekt der Klasse IfcBorehole verfügt über das PropertySet IfcBoreholeCommon."""
         elems = model.by_type("IfcBorehole")
@@ -102,9 +136,7 @@ class TestBoreholes(unittest.TestCase):
         # Linienbauwerke: Abstand zwischen 20 m und 200 m
         # Sonderbauwerke: zwei bis sechs Aufschlüsse je Fundament
         # Staudämme und Wehre: Abstand zwiscehn 25 m und 75 m in maßgebenden Schnitten
-        def less_first(a, b):
-            return [a,b] if a < b else [b,a]
-
+        # Die Kategorie je Bereich wird über spacing_zones / spacing_category festgelegt, siehe qualityutils.spacing_DIN_EN_1997_2
         elems =model.by_type("IfcBorehole")
 
         ansatzpunkte, bh_names = [], []
@@ -137,25 +169,11 @@ class TestBoreholes(unittest.TestCase):
             ansatzpunkte.append(ansatzpunkt)
             bh_names.append(i.Name)
 
-        ansatzpunkte_3d = np.array([[i[0], i[1], i[2]] for i in ansatzpunkte]) 
-        ansatzpunkte =np.array([[i[0], i[1]] for i in ansatzpunkte]) # nur xy-Koordinaten
-        triangulation = Delaunay(ansatzpunkte)
+        result = analyse_borehole_spacing(np.array([[i[0], i[1]] for i in ansatzpunkte]), zones=spacing_zones, default_category=spacing_category) # nur xy-Koordinaten
 
-        edges, lengths = [], []
-        for triangle in triangulation.simplices:
-            for e1, e2 in [[0,1],[1,2],[2,0]]: # for all edges of triangle
-                edges.append(less_first(triangle[e1],triangle[e2]))
-        array_of_edges = np.unique(edges, axis=0)
-
-        for p1,p2 in array_of_edges:
-            x1, y1 = triangulation.points[p1]
-            x2, y2 = triangulation.points[p2]
-            lengths.append((x1-x2)**2 + (y1-y2)**2)
-        array_of_lengths = np.sqrt(np.array(lengths))
-
-        for i in array_of_lengths:
-            with self.subTest(i=i):
-                self.assertLess(float(i), 60)
+        for (p1, p2), length, max_spacing in zip(result["edges"], result["lengths"], result["max_spacing"]):
+            with self.subTest(edge=(bh_names[p1], bh_names[p2])):
+                self.assertLess(float(length), float(max_spacing))
 
 
     def test_ansprachebereich_geometry(self):
@@ -240,7 +258,7 @@ class TestBoreholes(unittest.TestCase):
                 self.assertLessEqual(delta, 0.5)
 
 
-class TestSolidStratum(unittest.TestCase):   
+class TestSolidStratum(QualityCheck):   
     def test_bounds_cohesion(self):
         """X.	Werte für die CohesionBehaviour im Propertyset Pset_SolidStratumCapacity liegen im Intervall zwischen 0 und 1000 kN/m²."""
         elems = model.by_type("IfcSimpleProperty")
@@ -257,6 +275,7 @@ class TestSolidStratum(unittest.TestCase):
         """XI.	Wird ein Reibungswinkel für ein Element mit dem Material „Sand“ angegeben, so liegt er zwischen 27,5° und 37,5°."""
         elems = [i for i in model.by_type("IfcSimpleProperty") if i.Name == "FrictionAngle"]
         elems = [i for i in elems if any([j for j in i.PartOfPset if j.Name=="Pset_SolidStratumCapacity"])]
+        sand_elems = []
         for elem in elems:
             is_related_to_a_sand = False
             for pset in elem.PartOfPset:
@@ -265,27 +284,20 @@ class TestSolidStratum(unittest.TestCase):
                         for association in parent_obj.HasAssociations:
                             if association.RelatingMaterial.Name=="Sand":
                                 is_related_to_a_sand = True
-            if not is_related_to_a_sand:
-                continue
-            with self.subTest(elem=elem):
-                val = elem.NominalValue.wrappedValue
-                is_degrees = False
-                if elem.Unit == None:
-                    # get the unit for PLANEANGLEUNIT
-                    global_unit_assignments = model.by_type("IfcUnitAssignment")
-                    for i in global_unit_assignments:
-                        for j in i.Units:
-                            if hasattr(j, "UnitType"):
-                                if j.UnitType=="PLANEANGLEUNIT":
-                                    if "DEGREE" in j.Name.upper():
-                                        is_degrees = True
-                else:
-                    if "DEGREE" in elem.Unit.Name.upper():
-                        is_degrees = True
+            if is_related_to_a_sand:
+                sand_elems.append(elem)
 
-                self.assertGreaterEqual(val, 27.5)
-                self.assertLessEqual(val, 37.5)
-                self.assertTrue(is_degrees)
+        # Vergleich in Grad. Die Toleranz gleicht den gekürzten Umrechnungsfaktor der Einheit DEGREE aus.
+        values = np.rad2deg(units.normalized(sand_elems))
+        for elem, val in zip(sand_elems, values):
+            with self.subTest(elem=elem):
+                unit = units.unit_of(elem)
+                self.assertIsNotNone(unit, f"Die Einheit von {elem} ist nicht eindeutig bestimmbar")
+                self.assertFalse(np.isnan(val), f"Die Einheit von {elem} ist nicht eindeutig bestimmbar")
+                self.assertGreaterEqual(val, 27.5 - 1e-6)
+                self.assertLessEqual(val, 37.5 + 1e-6)
+                # Der Reibungswinkel ist in Grad anzugeben, d. h. der Umrechnungsfaktor in rad ist pi/180
+                self.assertAlmostEqual(units.factor(unit), np.pi / 180, msg=f"Die Einheit von {elem} ist nicht Grad")
 
 
     def test_material_color_DIN4023(self):
@@ -293,21 +305,15 @@ class TestSolidStratum(unittest.TestCase):
         elems = model.by_type("IfcGeotechnicalStratum")
         elems = [i for i in elems if i.PredefinedType=="SOLID"]
 
-        colors_DIN4023 = {"Kies":  (219, 171, 6), "Sand": (198, 84, 47), "Auffuellung": (127, 127, 127)}
+        colors_DIN4023 = load_colours_DIN4023(parent_path+"/resources")
+        styles = MaterialStyleResolver()
 
-        for elem in elems:
-            for relAssociatesMaterial in elem.HasAssociations:
+        # Jedes Material wird einmal geprüft, das Ergebnis gilt für alle zugeordneten Elemente
+        for mat, assignments in styles.elements_by_material(elems).items():
+            deviating_colors = [rgb for rgb in styles.surface_colours(mat) if rgb != colors_DIN4023.get(mat.Name)]
+            for elem, relAssociatesMaterial in assignments:
                 with self.subTest(relAssociatesMaterial=relAssociatesMaterial):
-                    mat = relAssociatesMaterial.RelatingMaterial
-                    representations = mat.HasRepresentation
-                    for representation in representations:
-                        for style_rep in representation.Representations:
-                            for i in style_rep.Items:
-                                for style in i.Styles:
-                                    for style2 in style.Styles:
-                                        color= style2.SurfaceColour
-                                        rgb = (int(round(255*color.Red,0)), int(round(255*color.Green,0)), int(round(255*color.Blue,0)))
-                                        self.assertEqual(rgb, colors_DIN4023[mat.Name], f"Zugewiesenes Material {mat.Name} zu {elem} über {relAssociatesMaterial} hat eine andere SurfaceColor als erwartet")                                        
+                    self.assertEqual(deviating_colors, [], f"Zugewiesenes Material {mat.Name} zu {elem} über {relAssociatesMaterial} hat eine andere SurfaceColor als erwartet")
         
 
     def test_unit_(self):
@@ -315,27 +321,20 @@ class TestSolidStratum(unittest.TestCase):
         elems = model.by_type("IfcSimpleProperty")
         elems = [i for i in elems if any(j in i.Name for j in ["WichteUnterAuftrieb"])]
         
-        for elem in elems:
+        factors = units.factors(elems)
+        for elem, factor in zip(elems, factors):
             with self.subTest(elem=elem):
-                unit = elem.Unit
-                self.assertEqual(unit.is_a(), "IfcDerivedUnit")
-                self.assertEqual(unit.UnitType, "MASSDENSITYUNIT")
-              
-                for derivedunitelem in unit.Elements:
-                    derivedunitelem_unit = derivedunitelem.Unit
-                    if derivedunitelem_unit.UnitType == "LENGTHUNIT":
-                        self.assertEqual(derivedunitelem.Exponent, -3)
-                        self.assertEqual(derivedunitelem_unit.is_a(), "IfcSIUnit")
-                        self.assertIsNone(derivedunitelem_unit.Prefix)
-                    elif derivedunitelem_unit.UnitType == "MASSUNIT":
-                        self.assertEqual(derivedunitelem.Exponent, 1)
-                        self.assertEqual(derivedunitelem_unit.is_a(), "IfcSIUnit")
-                        self.assertEqual(derivedunitelem_unit.Prefix, "KILO")
+                unit = units.unit_of(elem)
+                self.assertIsNotNone(unit, f"Die Einheit von {elem} ist nicht eindeutig bestimmbar")
+                self.assertEqual(units.unit_type(unit), "MASSDENSITYUNIT")
+                self.assertAlmostEqual(factor, 1.0, msg="Umrechnungsfaktor in kg/m³") # kg/m³ ist die SI-Einheit der Dichte
 
 
     def test_volume(self):
         """XIV.	Das Volumen im Qto_VolumetricStratumBaseQuantities entspricht dem Volumen, das durch die geometrische Repräsentation beschrieben wird."""
         settings = ifcopenshell.geom.settings()
+        length_unit = units.project_unit("LENGTHUNIT")
+        length_factor = units.factor(length_unit) if length_unit is not None else 1.
         volume_qto = None
         elems = model.by_type("IfcGeotechnicalStratum")
         elems = [i for i in elems if i.PredefinedType=="SOLID"]
@@ -349,12 +348,15 @@ class TestSolidStratum(unittest.TestCase):
                         volume_qto = qto["Volume"]
                 if not volume_qto:
                     continue
-                shape = ifcopenshell.geom.create_shape(settings, elem)
-                volume_calc = ifcopenshell.util.shape.get_volume(shape.geometry)
+                # Closed triangulated bodies are integrated directly, other geometry with the geometry kernel
+                volume_calc = tessellated_volume(elem, length_factor)
+                if volume_calc is None:
+                    shape = ifcopenshell.geom.create_shape(settings, elem)
+                    volume_calc = ifcopenshell.util.shape.get_volume(shape.geometry)
                 self.assertLessEqual(abs(volume_qto - volume_calc), 0.01)
 
 
-class TestIFCGeneral(unittest.TestCase):   
+class TestIFCGeneral(QualityCheck):   
     def test_nominal_values_in_bounds(self):
         """XV.	Die Nominalwerte sämtlicher Eigenschaften mit Grenzwerten müssen innerhalb dieser Grenzen liegen"""
         elems = model.by_type("IfcPropertyBoundedValue")
@@ -368,8 +370,11 @@ class TestIFCGeneral(unittest.TestCase):
         """XVI.	Die Dateigröße darf 10 MB nicht überschreiten."""
         # Global variable fp contains the filepath to the ifc path to be checked
         file_size = os.stat(fp).st_size
-        file_size_mb = file_size / (1023 * 1024)
-        self.assertLess(file_size_mb, 10)
+        file_size_mb = file_size / (1024 * 1024)
+        msg = None
+        if file_size_mb >= 10: # Aufschlüsselung nach Entitätstypen und Produkten nur im Fehlerfall, ein Durchlauf durch die Datei
+            msg = format_size_profile(profile_file_size(fp))
+        self.assertLess(file_size_mb, 10, msg)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,282 @@
+import json
+import numpy as np
+from scipy.spatial import Delaunay
+
+
+# Maximum borehole spacings in m according to DIN EN 1997-2 Anlage B.3 (upper end of the recommended ranges,
+# denser grids are fine). Sonderbauwerke (two to six boreholes per foundation) are not distance based and hence not listed.
+spacing_DIN_EN_1997_2 = {
+    "hoch_und_industriebauten": 40.,
+    "grossflaechige_bauwerke": 60.,
+    "linienbauwerke": 200.,
+    "staudaemme_und_wehre": 75.,
+}
+
+
+def delaunay_edges(points_xy):
+    """
+    Unique edges of the delaunay triangulation of points_xy (n, 2) and their lengths.
+    Collinear points (e.g. boreholes along a Linienbauwerk) have no triangulation, they are connected to their
+    neighbours along the line instead.
+    Returns edges (m, 2) with edges[:, 0] < edges[:, 1] and lengths (m,).
+    """
+    points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+    n = len(points_xy)
+    centered = points_xy - points_xy.mean(axis=0) if n else points_xy
+    if n < 3 or np.linalg.matrix_rank(centered) < 2:
+        direction = np.linalg.svd(centered, full_matrices=False)[2][0] if n else np.zeros(2)
+        order = np.argsort(centered @ direction, kind="stable")
+        edges = np.sort(np.stack([order[:-1], order[1:]], axis=1), axis=1).astype(np.int64)
+        edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+    else:
+        simplices = Delaunay(points_xy).simplices.astype(np.int64)
+        edges = np.sort(simplices[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+        # Unique on a single integer key is much faster than np.unique(..., axis=0)
+        keys = np.unique(edges[:, 0] * n + edges[:, 1])
+        edges = np.stack([keys // n, keys % n], axis=1)
+    lengths = np.hypot(*(points_xy[edges[:, 0]] - points_xy[edges[:, 1]]).T)
+    return edges, lengths
+
+
+def points_in_polygon(points_xy, polygon_xy):
+    """Vectorized even-odd test. Returns a boolean mask for points_xy (n, 2) lying inside polygon_xy (m, 2)."""
+    x, y = np.asarray(points_xy, dtype=float).T
+    polygon_xy = np.asarray(polygon_xy, dtype=float)
+    inside = np.zeros(len(x), dtype=bool)
+    x1, y1 = polygon_xy.T
+    x2, y2 = np.roll(polygon_xy, -1, axis=0).T
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        crosses = (ay > y) != (by > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def analyse_borehole_spacing(points_xy, zones=None, default_category="grossflaechige_bauwerke", spacings=spacing_DIN_EN_1997_2):
+    """
+    Check the borehole grid (Bohrraster) with the edges of the delaunay triangulation of the borehole locations.
+
+    points_xy: (n, 2) borehole locations
+    zones: list of (polygon_xy, category). Each edge gets the category of the first zone containing its midpoint,
+        edges outside of all zones get default_category.
+    spacings: dict category -> maximum spacing. Edges have to be shorter, denser grids are fine.
+
+    Returns a dict with the edge results ("edges", "lengths", "category", "max_spacing", "ok") and the
+    per-borehole coverage statistics ("neighbours", "nearest", "longest", "ok_borehole").
+    """
+    points_xy = np.asarray(points_xy, dtype=float)
+    zones = zones if zones else []
+    categories = [default_category] + [i[1] for i in zones]
+    max_spacing_by_category = np.array([spacings[i] for i in categories], dtype=float)
+
+    edges, lengths = delaunay_edges(points_xy)
+    midpoints = 0.5 * (points_xy[edges[:, 0]] + points_xy[edges[:, 1]])
+    category_index = np.zeros(len(edges), dtype=np.int64)
+    for zone_ind in range(len(zones), 0, -1): # reversed, so the first matching zone wins
+        category_index[points_in_polygon(midpoints, zones[zone_ind - 1][0])] = zone_ind
+    max_spacing = max_spacing_by_category[category_index]
+    ok = lengths < max_spacing
+
+    n = len(points_xy)
+    both_ends = edges.T.ravel()
+    neighbours = np.bincount(both_ends, minlength=n)
+    nearest = np.full(n, np.inf)
+    longest = np.zeros(n)
+    np.minimum.at(nearest, both_ends, np.tile(lengths, 2))
+    np.maximum.at(longest, both_ends, np.tile(lengths, 2))
+    violations = np.bincount(both_ends, weights=np.tile(~ok, 2), minlength=n)
+
+    return {
+        "edges": edges,
+        "lengths": lengths,
+        "category": np.array(categories, dtype=object)[category_index],
+        "max_spacing": max_spacing,
+        "ok": ok,
+        "neighbours": neighbours,
+        "nearest": nearest,
+        "longest": longest,
+        "ok_borehole": violations == 0,
+    }
+
+
+si_prefixes = {
+    None: 1., "EXA": 1e18, "PETA": 1e15, "TERA": 1e12, "GIGA": 1e9, "MEGA": 1e6, "KILO": 1e3, "HECTO": 1e2, "DECA": 1e1,
+    "DECI": 1e-1, "CENTI": 1e-2, "MILLI": 1e-3, "MICRO": 1e-6, "NANO": 1e-9, "PICO": 1e-12, "FEMTO": 1e-15, "ATTO": 1e-18,
+}
+
+# Unit type used for a value if no unit is given explicitly, see IfcUnitAssignment
+measure_unit_types = {i.upper(): v for i, v in {
+    "IfcLengthMeasure": "LENGTHUNIT", "IfcPositiveLengthMeasure": "LENGTHUNIT", "IfcNonNegativeLengthMeasure": "LENGTHUNIT",
+    "IfcAreaMeasure": "AREAUNIT", "IfcVolumeMeasure": "VOLUMEUNIT", "IfcMassMeasure": "MASSUNIT",
+    "IfcPlaneAngleMeasure": "PLANEANGLEUNIT", "IfcPositivePlaneAngleMeasure": "PLANEANGLEUNIT",
+    "IfcPressureMeasure": "PRESSUREUNIT", "IfcMassDensityMeasure": "MASSDENSITYUNIT", "IfcForceMeasure": "FORCEUNIT",
+    "IfcModulusOfElasticityMeasure": "MODULUSOFELASTICITYUNIT", "IfcThermodynamicTemperatureMeasure": "THERMODYNAMICTEMPERATUREUNIT",
+    "IfcTimeMeasure": "TIMEUNIT",
+}.items()}
+quantity_unit_types = {i.upper(): v for i, v in {
+    "IfcQuantityLength": "LENGTHUNIT", "IfcQuantityArea": "AREAUNIT", "IfcQuantityVolume": "VOLUMEUNIT",
+    "IfcQuantityWeight": "MASSUNIT", "IfcQuantityTime": "TIMEUNIT",
+}.items()}
+
+
+class UnitResolver:
+    """
+    Resolves the units of properties and quantities of a model to conversion factors into SI base units.
+
+    The unit context (IfcUnitAssignment) is read once, factors are memoized by the id of the unit entity.
+    Values of many properties can then be converted and compared as numpy arrays, e.g.
+    np.rad2deg(UnitResolver(model).normalized(props)) for angles regardless of the unit they are given in.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._factors = {}
+        self.project_units = {}
+        for assignment in model.by_type("IfcUnitAssignment"):
+            for unit in assignment.Units:
+                self.project_units.setdefault(self.unit_type(unit), []).append(unit)
+
+    @staticmethod
+    def unit_type(unit):
+        if unit.is_a("IfcMonetaryUnit"):
+            return "MONETARYUNIT"
+        return unit.UnitType
+
+    def project_unit(self, unit_type):
+        """Unit assigned to the project for unit_type. None if there is none or if it is ambiguous."""
+        units = self.project_units.get(unit_type, [])
+        return units[0] if len(units) == 1 else None
+
+    def factor(self, unit):
+        """Factor converting a value given in unit into SI base units (kg for masses, radian for angles)."""
+        if unit.id() not in self._factors:
+            if unit.is_a("IfcSIUnit"):
+                exponent = 3 if unit.Name.startswith("CUBIC") else 2 if unit.Name.startswith("SQUARE") else 1
+                factor = si_prefixes[unit.Prefix] ** exponent
+                if unit.Name == "GRAM":
+                    factor *= 1e-3
+            elif unit.is_a("IfcConversionBasedUnit"):
+                conversion = unit.ConversionFactor
+                factor = conversion.ValueComponent.wrappedValue * self.factor(conversion.UnitComponent)
+            elif unit.is_a("IfcDerivedUnit"):
+                factor = float(np.prod([self.factor(i.Unit) ** i.Exponent for i in unit.Elements]))
+            else: # monetary and context dependent units are not converted
+                factor = 1.
+            self._factors[unit.id()] = factor
+        return self._factors[unit.id()]
+
+    @staticmethod
+    def value_of(prop):
+        """Raw value of an IfcPropertySingleValue, IfcPropertyBoundedValue (SetPointValue) or physical quantity."""
+        if prop.is_a("IfcPropertySingleValue"):
+            value = prop.NominalValue
+        elif prop.is_a("IfcPropertyBoundedValue"):
+            value = prop.SetPointValue
+        else:
+            return float(prop[3])
+        return None if value is None else value.wrappedValue
+
+    def unit_of(self, prop):
+        """Explicit unit of prop or the project unit matching its measure type. None if it cannot be determined."""
+        if prop.Unit is not None:
+            return prop.Unit
+        if prop.is_a("IfcPhysicalSimpleQuantity"):
+            unit_type = quantity_unit_types.get(prop.is_a().upper())
+        else:
+            value = prop.NominalValue if prop.is_a("IfcPropertySingleValue") else prop.SetPointValue
+            unit_type = measure_unit_types.get(value.is_a().upper()) if value is not None else None
+        return self.project_unit(unit_type) if unit_type else None
+
+    def factors(self, props):
+        """Conversion factors into SI base units. nan where the unit cannot be determined."""
+        units = [self.unit_of(i) for i in props]
+        return np.array([self.factor(i) if i is not None else np.nan for i in units], dtype=float)
+
+    def values(self, props):
+        return np.array([self.value_of(i) for i in props], dtype=float)
+
+    def normalized(self, props):
+        """Values of props in SI base units as numpy array."""
+        return self.values(props) * self.factors(props)
+
+
+def load_colours_DIN4023(resources_path):
+    """Expected colours (r, g, b) per material name from the resource files farbcode_DIN4023.json and mapping_DIN4023.json."""
+    with open(resources_path+"/farbcode_DIN4023.json", "r", encoding="Latin1") as f:
+        farbcode_DIN4023 = json.load(f)
+    with open(resources_path+"/mapping_DIN4023.json", "r", encoding="Latin1") as f:
+        mapping_DIN4023 = json.load(f)
+    return {material: tuple(farbcode_DIN4023[colour]) for material, colour in mapping_DIN4023.items()}
+
+
+class MaterialStyleResolver:
+    """
+    Resolves the surface colours of materials. As many elements share few materials, the style graph
+    (HasRepresentation -> Representations -> Items -> Styles -> Styles -> SurfaceColour) is walked once per material.
+    """
+
+    def __init__(self):
+        self._colours = {}
+
+    def surface_colours(self, material):
+        """Surface colours of the material styles as rgb tuples of integers between 0 and 255."""
+        if material.id() not in self._colours:
+            colours = []
+            for representation in material.HasRepresentation:
+                for style_rep in representation.Representations:
+                    for item in style_rep.Items:
+                        for style in item.Styles:
+                            for style2 in style.Styles:
+                                colour = style2.SurfaceColour
+                                colours.append((int(round(255*colour.Red, 0)), int(round(255*colour.Green, 0)), int(round(255*colour.Blue, 0))))
+            self._colours[material.id()] = colours
+        return self._colours[material.id()]
+
+    @staticmethod
+    def elements_by_material(elements):
+        """Group elements by their associated IfcMaterial. Returns {material: [(element, IfcRelAssociatesMaterial), ...]}."""
+        grouped = {}
+        for elem in elements:
+            for rel in elem.HasAssociations:
+                if rel.is_a("IfcRelAssociatesMaterial") and rel.RelatingMaterial.is_a("IfcMaterial"):
+                    grouped.setdefault(rel.RelatingMaterial, []).append((elem, rel))
+        return grouped
+
+
+def mesh_volume(vertices, faces):
+    """
+    Signed volume enclosed by a closed triangle mesh: vertices (n, 3), faces (m, 3).
+    It is positive if the faces are oriented outwards (counter-clockwise seen from outside) and negative if inwards.
+    For open or inconsistently oriented meshes the result is meaningless.
+    """
+    corners = np.asarray(vertices, dtype=float)[np.asarray(faces, dtype=np.int64)]
+    return np.einsum("ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])).sum() / 6.
+
+
+def tessellated_volume(element, length_factor=1.):
+    """
+    Volume of the body of element computed from its IfcTriangulatedFaceSets without a geometry kernel.
+    Placements are rigid, hence they are not applied. length_factor converts the project length unit into m.
+    Returns None if the body contains other items, face sets not marked as Closed or with a negative signed volume
+    (faces oriented inwards). Use ifcopenshell.geom then.
+    """
+    if element.Representation is None:
+        return None
+    volume, found = 0., False
+    for representation in element.Representation.Representations:
+        if representation.RepresentationIdentifier != "Body":
+            continue
+        for item in representation.Items:
+            # Closed is optional, unknown closure is not trusted
+            if not item.is_a("IfcTriangulatedFaceSet") or item.Closed is not True:
+                return None
+            faces = np.array(item.CoordIndex, dtype=np.int64) - 1
+            if item.PnIndex:
+                faces = np.array(item.PnIndex, dtype=np.int64)[faces] - 1
+            item_volume = mesh_volume(item.Coordinates.CoordList, faces)
+            if item_volume < 0:
+                return None
+            volume += item_volume
+            found = True
+    return volume * length_factor ** 3 if found else None
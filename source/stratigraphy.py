@@ -0,0 +1,236 @@
+import multiprocessing
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class StratumQuery:
+    """
+    Point queries against a stack of layer surfaces on a regular grid (e.g. from interpolate_rbf and enforce_conformance).
+
+    Each surface is kept as a flat array, so the corners of the cells are gathered with np.take on contiguous memory.
+
+    # Example
+    query = StratumQuery(x_rbf, y_rbf, surface_stack, names=["A", "G", "S"], materials=mapping_hg_to_materialname)
+    result = query.query(pile_x, pile_y, pile_z)
+    result["material"] # e.g. "Kies" per point
+    """
+
+    def __init__(self, x_arr, y_arr, stack, names=None, materials=None):
+        """
+        x_arr, y_arr: grid (nx, ny) with x along axis 0 (np.mgrid)
+        stack: (n_surfaces, nx, ny) from top to bottom. Layer i lies between surface i and i+1.
+        names: one name per layer, e.g. the Hauptgruppen ["A", "G", "S"]
+        materials: dict name -> material name, e.g. mapping_hg_to_materialname.json
+        """
+        stack = np.asarray(stack, dtype=float)
+        self.n_surfaces, self.nx, self.ny = stack.shape
+        self.surfaces = np.ascontiguousarray(stack.reshape(self.n_surfaces, -1))
+        self.xmin, self.ymin = float(x_arr[0, 0]), float(y_arr[0, 0])
+        self.grid_x = float(x_arr[1, 0] - x_arr[0, 0]) if self.nx > 1 else 1.
+        self.grid_y = float(y_arr[0, 1] - y_arr[0, 0]) if self.ny > 1 else 1.
+        names = list(names) if names is not None else [str(i) for i in range(self.n_surfaces - 1)]
+        materials = materials or {}
+        # The last entry is used for points outside of all layers (label -1)
+        self.names = np.array(names + [""])
+        self.materials = np.array([materials.get(i, "") for i in names] + [""])
+
+    def surfaces_at(self, x, y):
+        """Bilinear interpolation of all surfaces at the points. Returns (n_surfaces, n_points), nan outside of the grid."""
+        x, y = np.asarray(x, dtype=float).ravel(), np.asarray(y, dtype=float).ravel()
+        fx, fy = (x - self.xmin) / self.grid_x, (y - self.ymin) / self.grid_y
+        i = np.clip(np.floor(fx).astype(np.int64), 0, max(self.nx - 2, 0))
+        j = np.clip(np.floor(fy).astype(np.int64), 0, max(self.ny - 2, 0))
+        tx, ty = fx - i, fy - j
+        k00 = i * self.ny + j
+        k10 = k00 + (self.ny if self.nx > 1 else 0)
+        k01, k11 = k00 + (1 if self.ny > 1 else 0), k10 + (1 if self.ny > 1 else 0)
+        values = np.empty((self.n_surfaces, len(x)))
+        for surface, out in zip(self.surfaces, values):
+            lower, upper = surface.take(k00), surface.take(k01)
+            lower += (surface.take(k10) - lower) * tx
+            upper += (surface.take(k11) - upper) * tx
+            lower += (upper - lower) * ty
+            out[:] = lower
+        values[:, (fx < 0) | (fx > self.nx - 1) | (fy < 0) | (fy > self.ny - 1)] = np.nan
+        return values
+
+    def query(self, x, y, z, chunk_size=65536):
+        """
+        Layer of each point (x, y, z).
+
+        Returns a dict of arrays with one entry per point:
+        "label": layer index (-1 above the top, below the bottom or outside of the grid), "name", "material",
+        "depth": depth below the top surface (terrain), "to_top" / "to_bottom": vertical distance to the top / bottom of the layer.
+        The points are processed in chunks of chunk_size, so the intermediate arrays stay in the cache.
+        """
+        x, y, z = (np.asarray(i, dtype=float).ravel() for i in (x, y, z))
+        label = np.empty(len(z), dtype=np.int64)
+        depth, to_top, to_bottom = np.empty(len(z)), np.empty(len(z)), np.empty(len(z))
+        for start in range(0, len(z), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            zc = z[chunk]
+            surfaces = self.surfaces_at(x[chunk], y[chunk])
+            # Number of surfaces above or at the point: 0 above the top, n_surfaces below the bottom
+            count = np.zeros(len(zc), dtype=np.int64)
+            for surface in surfaces:
+                count += surface >= zc
+            label_c = count - 1
+            label_c[(count == 0) | (count == self.n_surfaces) | np.isnan(surfaces[0])] = -1
+
+            inside = label_c >= 0
+            columns = np.arange(len(zc))
+            label[chunk] = label_c
+            depth[chunk] = surfaces[0] - zc
+            to_top[chunk] = np.where(inside, surfaces[np.maximum(label_c, 0), columns], np.nan) - zc
+            to_bottom[chunk] = zc - np.where(inside, surfaces[np.maximum(label_c, 0) + 1, columns], np.nan)
+        return {
+            "label": label,
+            "name": self.names[label],
+            "material": self.materials[label],
+            "depth": depth,
+            "to_top": to_top,
+            "to_bottom": to_bottom,
+        }
+
+
+def layer_quantities(x_arr, y_arr, stack, names=None, eps=1e-6):
+    """
+    Quantities of the layers between consecutive surfaces on a regular grid, integrated without tessellating solids.
+
+    The thickness is integrated with the prism formula on the triangles of prepare_grid_to_mesh_arrays (diagonal v1-v3),
+    hence the volumes equal the ones of the meshes of build_stacked_volumes for the same stack.
+    A surface above the one before is clipped to it as in build_stacked_volumes.
+
+    Returns a dict name -> {"isopach": thickness grid (nx, ny), "volume", "area": plan area where the layer is present,
+    "mean_thickness": volume / area, "max_thickness"}.
+    """
+    stack = np.minimum.accumulate(np.asarray(stack, dtype=float), axis=0)
+    names = names if names is not None else list(range(len(stack) - 1))
+    grid_x, grid_y = x_arr[1, 0] - x_arr[0, 0], y_arr[0, 1] - y_arr[0, 0]
+    triangle_area = 0.5 * abs(grid_x * grid_y)
+
+    quantities = {}
+    for name, top, bottom in zip(names, stack[:-1], stack[1:]):
+        t = top - bottom
+        t1, t2, t3, t4 = t[:-1, :-1], t[1:, :-1], t[1:, 1:], t[:-1, 1:]
+        volume = triangle_area / 3. * (2 * t1 + t2 + 2 * t3 + t4).sum()
+        # Triangles with thickness at one of the corners at least (the footprint of the mesh)
+        present = (np.maximum(np.maximum(t1, t2), t3) > eps).sum() + (np.maximum(np.maximum(t1, t3), t4) > eps).sum()
+        area = triangle_area * present
+        quantities[name] = {
+            "isopach": t,
+            "volume": float(volume),
+            "area": float(area),
+            "mean_thickness": float(volume / area) if area else 0.,
+            "max_thickness": float(t.max()),
+        }
+    return quantities
+
+
+def _stations(polyline_xy, spacing):
+    """Sample points along the polyline every spacing and at its vertices. Returns chainage, x, y and the vertex chainages."""
+    polyline_xy = np.asarray(polyline_xy, dtype=float)
+    vertex_chainage = np.concatenate([[0.], np.cumsum(np.hypot(*np.diff(polyline_xy, axis=0).T))])
+    chainage = np.union1d(np.arange(0., vertex_chainage[-1], spacing), vertex_chainage)
+    return chainage, np.interp(chainage, vertex_chainage, polyline_xy[:, 0]), np.interp(chainage, vertex_chainage, polyline_xy[:, 1]), vertex_chainage
+
+
+def project_to_polyline(points_xy, polyline_xy):
+    """
+    Project points (n, 2) onto the polyline (m, 2).
+    Returns chainage, signed offset (positive left of the polyline) and the distance of the points to the polyline.
+    """
+    points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+    polyline_xy = np.asarray(polyline_xy, dtype=float)
+    start, direction = polyline_xy[:-1], np.diff(polyline_xy, axis=0)
+    length_sq = (direction ** 2).sum(axis=1)
+    relative = points_xy[:, None, :] - start[None]
+    t = np.clip((relative * direction[None]).sum(axis=2) / np.where(length_sq > 0, length_sq, 1.), 0., 1.)
+    distance = np.hypot(*(relative - t[..., None] * direction[None]).transpose(2, 0, 1))
+    segment = distance.argmin(axis=1)
+    rows = np.arange(len(points_xy))
+    vertex_chainage = np.concatenate([[0.], np.cumsum(np.sqrt(length_sq))])
+    chainage = vertex_chainage[segment] + t[rows, segment] * np.sqrt(length_sq[segment])
+    side = np.sign(direction[segment, 0] * relative[rows, segment, 1] - direction[segment, 1] * relative[rows, segment, 0])
+    return chainage, np.where(side < 0, -1., 1.) * distance[rows, segment], distance[rows, segment]
+
+
+def cross_section(query, polyline_xy, spacing=1., bh_data=None, corridor=5., bh_tree=None, eps=1e-6):
+    """
+    Geological section along a polyline from the surface stack of a StratumQuery.
+
+    spacing: distance of the sample points along the polyline (the vertices are always sampled)
+    bh_data: boreholes (see project_data/bh_data.json). Boreholes closer than corridor to the polyline are projected
+        onto the section with their Ansprachebereiche.
+    bh_tree: cKDTree of the borehole locations. Pass it when generating many sections for the same boreholes.
+
+    Returns a dict with
+    "chainage", "x", "y", "surfaces" (n_surfaces, n_samples),
+    "polygons": layer name -> list of polygons (k, 2) in (chainage, z). Layers pinching out are split into several polygons.
+    "boreholes": list of dicts with "name", "chainage", "offset" and "layers" [(Hauptgruppe, z_top, z_bottom), ...]
+    """
+    chainage, x, y, _ = _stations(polyline_xy, spacing)
+    surfaces = query.surfaces_at(x, y)
+    valid = ~np.isnan(surfaces).any(axis=0)
+
+    polygons = {}
+    for layer_ind, name in enumerate(query.names[:-1].tolist()):
+        top, bottom = surfaces[layer_ind], surfaces[layer_ind + 1]
+        thick = np.zeros(len(chainage), dtype=bool)
+        thick[valid] = top[valid] - bottom[valid] > eps
+        edges = np.diff(np.concatenate([[0], thick.astype(np.int8), [0]]))
+        polygons[name] = []
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            # Include the neighbouring samples where the layer pinches out
+            start = start - 1 if start > 0 and valid[start - 1] else start
+            end = end + 1 if end < len(chainage) and valid[end] else end
+            index = np.arange(start, end)
+            polygons[name].append(np.concatenate([
+                np.stack([chainage[index], top[index]], axis=1),
+                np.stack([chainage[index[::-1]], bottom[index[::-1]]], axis=1),
+            ]))
+
+    boreholes = []
+    if bh_data:
+        bh_xy = np.array([[i["x"], i["y"]] for i in bh_data], dtype=float)
+        bh_tree = bh_tree if bh_tree is not None else cKDTree(bh_xy)
+        # Every point within the corridor is within this radius of a sample point
+        candidates = sorted(set(i for j in bh_tree.query_ball_point(np.stack([x, y], axis=1), r=np.hypot(corridor, spacing / 2)) for i in j))
+        if candidates:
+            bh_chainage, offset, distance = project_to_polyline(bh_xy[candidates], polyline_xy)
+            for bh_ind, c, o, d in zip(candidates, bh_chainage, offset, distance):
+                if d > corridor:
+                    continue
+                bh_dict = bh_data[bh_ind]
+                uks = [0.] + list(bh_dict["Layerdata"]["UKs"])
+                layers = [(hg, bh_dict["OK"] - uks[i], bh_dict["OK"] - uks[i+1]) for i, hg in enumerate(bh_dict["Layerdata"]["Hauptgruppen"])]
+                boreholes.append({"name": bh_dict["Name"], "chainage": c, "offset": o, "layers": layers})
+            boreholes.sort(key=lambda i: i["chainage"])
+
+    return {"chainage": chainage, "x": x, "y": y, "surfaces": surfaces, "polygons": polygons, "boreholes": boreholes}
+
+
+_section_context = {}
+
+
+def _init_sections(query, bh_data, bh_tree):
+    _section_context.update(query=query, bh_data=bh_data, bh_tree=bh_tree)
+
+
+def _cross_section_worker(task):
+    polyline_xy, kwargs = task
+    return cross_section(_section_context["query"], polyline_xy, bh_data=_section_context["bh_data"], bh_tree=_section_context["bh_tree"], **kwargs)
+
+
+def cross_sections(query, polylines, bh_data=None, processes=None, **kwargs):
+    """
+    Generate many sections (see cross_section) in worker processes. The query and the borehole index are sent
+    to each worker once. Returns the sections in the order of polylines.
+    """
+    bh_tree = cKDTree(np.array([[i["x"], i["y"]] for i in bh_data], dtype=float)) if bh_data else None
+    tasks = [(polyline_xy, kwargs) for polyline_xy in polylines]
+    if processes == 1:
+        _init_sections(query, bh_data, bh_tree)
+        return [_cross_section_worker(i) for i in tasks]
+    with multiprocessing.Pool(processes=processes, initializer=_init_sections, initargs=(query, bh_data, bh_tree)) as pool:
+        return pool.map(_cross_section_worker, tasks)
@@ -0,0 +1,220 @@
+import multiprocessing
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.spatial import cKDTree
+from geotmodelling import enforce_conformance, build_stacked_volumes
+
+
+def make_tiles(shape, tile_size, overlap=1):
+    """
+    Partition a grid of shape (nx, ny) into tiles of tile_size x tile_size grid points, each extended by overlap grid
+    points towards its upper neighbours. Adjacent tiles share overlap grid lines, e.g. the seam vertices of their volumes.
+    Returns a list of index ranges (i0, i1, j0, j1) including the overlap. The cores (without the overlap) do not overlap.
+    """
+    nx, ny = shape
+    return [(i0, min(i0 + tile_size + overlap, nx), j0, min(j0 + tile_size + overlap, ny))
+        for i0 in range(0, nx, tile_size) for j0 in range(0, ny, tile_size)]
+
+
+def _interpolator(data_xyz, neighbors):
+    return RBFInterpolator(
+        y = data_xyz[:, :2],
+        d = data_xyz[:, 2],
+        neighbors = min(neighbors, len(data_xyz)),
+        smoothing = 0.0,
+        kernel = "cubic",
+        epsilon = None,
+        degree = None
+    )
+
+
+_tile_context = {}
+
+
+def _init_tiles(surfaces, neighbors, grid, volumes):
+    _tile_context.update(interpolators=[_interpolator(i, neighbors) for i in surfaces], grid=grid, volumes=volumes)
+
+
+def _interpolate_tile(task):
+    """
+    Worker: interpolate all surfaces on the grid points of one tile and write the core of the tile to the memory mapped
+    stack. With volumes, the tile (including its overlap) is conformed and its volumes are written to tile_path.
+    """
+    path, tile, tile_path = task
+    xmin, ymin, grid_x, grid_y, tile_size = _tile_context["grid"]
+    i0, i1, j0, j1 = tile
+    x, y = np.meshgrid(xmin + np.arange(i0, i1) * grid_x, ymin + np.arange(j0, j1) * grid_y, indexing="ij")
+    points = np.column_stack([x.ravel(), y.ravel()])
+    tile_stack = np.stack([interpolator(points).reshape(x.shape) for interpolator in _tile_context["interpolators"]])
+
+    # Only the core is written, so the workers never write the same grid points
+    stack = np.load(path, mmap_mode="r+")
+    ci, cj = min(tile_size, i1 - i0), min(tile_size, j1 - j0)
+    stack[:, i0:i0 + ci, j0:j0 + cj] = tile_stack[:, :ci, :cj]
+    stack.flush()
+    del stack
+
+    volumes = _tile_context["volumes"]
+    if volumes is not None:
+        conformed = enforce_conformance(tile_stack, rules=volumes["rules"], min_thickness=volumes["min_thickness"])
+        meshes = build_stacked_volumes(x, y, conformed, names=volumes["names"])
+        np.savez(tile_path, **{f"{name}_{i}": array for name, mesh in meshes.items() for i, array in zip(("vertices", "faces"), mesh)})
+    return tile
+
+
+def interpolate_tiled(surfaces, path, xmin, xmax, ymin, ymax, grid_x=1, grid_y=1, tile_size=512, overlap=1, neighbors=50,
+        names=None, rules=None, min_thickness=0., processes=None, dtype=np.float64):
+    """
+    Interpolate a stack of surfaces tile by tile in worker processes into a disk backed array (.npy, memory mapped).
+
+    surfaces: list of data_xyz (see interpolate_rbf), one per surface from top to bottom
+    path: file the stack of shape (n_surfaces, nx, ny) is written to. The grid equals np.mgrid[xmin:xmax:grid_x, ymin:ymax:grid_y].
+    names: labels of the volumes between the surfaces, e.g. ["A", "G", "S"]. If given, each worker also conforms its tile
+        (see enforce_conformance with rules and min_thickness) and writes its volumes (see build_stacked_volumes) to
+        path[:-4] + "_tile_<i0>_<j0>.npz" with the arrays "<name>_vertices" and "<name>_faces".
+    processes: number of worker processes, 1 runs the tiles in this process.
+
+    The interpolation uses the neighbors nearest data points of each grid point only. Its result therefore does not
+    depend on the tile layout, the overlapping tiles agree on their seams and the volumes of adjacent tiles share the
+    vertices of the overlap. The data is sent to each worker once. Peak memory per worker depends on the tile size,
+    not on the site size.
+
+    Returns a dict describing the grid ("path", "xmin", "ymin", "grid_x", "grid_y", "shape", "tiles", "volumes"), see read_tile.
+    "volumes" maps each tile to the file of its volumes (empty without names).
+    """
+    nx, ny = len(np.arange(xmin, xmax, grid_x)), len(np.arange(ymin, ymax, grid_y))
+    surfaces = [np.asarray(i, dtype=float).reshape(-1, 3) for i in surfaces]
+    stack = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(len(surfaces), nx, ny))
+    del stack
+
+    tiles = make_tiles((nx, ny), tile_size, overlap=overlap)
+    base = path[:-4] if path.endswith(".npy") else path
+    tile_paths = {tile: f"{base}_tile_{tile[0]}_{tile[2]}.npz" for tile in tiles} if names is not None else {}
+    volumes = {"names": list(names), "rules": rules, "min_thickness": min_thickness} if names is not None else None
+    initargs = (surfaces, neighbors, (xmin, ymin, grid_x, grid_y, tile_size), volumes)
+    tasks = [(path, tile, tile_paths.get(tile)) for tile in tiles]
+    if processes == 1:
+        _init_tiles(*initargs)
+        for task in tasks:
+            _interpolate_tile(task)
+    else:
+        with multiprocessing.Pool(processes=processes, initializer=_init_tiles, initargs=initargs) as pool:
+            for _ in pool.imap_unordered(_interpolate_tile, tasks):
+                pass
+
+    return {"path": path, "xmin": xmin, "ymin": ymin, "grid_x": grid_x, "grid_y": grid_y, "shape": (len(surfaces), nx, ny),
+        "tiles": tiles, "volumes": tile_paths}
+
+
+def read_tile_volumes(tiled, tile):
+    """Volumes of one tile written by interpolate_tiled with names. Returns a dict name -> (vertices, faces) as build_stacked_volumes."""
+    with np.load(tiled["volumes"][tile]) as arrays:
+        names = [i[:-len("_vertices")] for i in arrays.files if i.endswith("_vertices")]
+        return {name: (arrays[name + "_vertices"], arrays[name + "_faces"]) for name in names}
+
+
+def update_surface(x_arr, y_arr, z_arr, old_xyz, new_xyz, neighbors=50, coarse_step=8):
+    """
+    Update a surface interpolated with the neighbors nearest data points (see interpolate_tiled) after data points were
+    added, removed or edited. Only grid points whose neighbourhood changed are interpolated again.
+
+    A grid point is affected if a changed data point (old or new version) lies within the distance to its k-th nearest
+    data point before or after the change. All other grid points keep their value, which is exactly the value a full
+    interpolation of new_xyz would give. Surfaces interpolated globally (interpolate_rbf) change everywhere instead.
+
+    Returns the updated grid and the mask of the grid points that were interpolated again.
+    """
+    old_xyz = np.asarray(old_xyz, dtype=float).reshape(-1, 3)
+    new_xyz = np.asarray(new_xyz, dtype=float).reshape(-1, 3)
+    old_rows, new_rows = set(map(tuple, old_xyz)), set(map(tuple, new_xyz))
+    changed = np.array([i for i in old_rows ^ new_rows], dtype=float).reshape(-1, 3)
+    z_arr = np.array(z_arr, dtype=float)
+    mask = np.zeros(z_arr.shape, dtype=bool)
+    if not len(changed) or not len(new_xyz):
+        return z_arr, mask
+
+    def kth_distance(points):
+        radius = np.zeros(len(points))
+        for data in (old_xyz, new_xyz):
+            if len(data):
+                k = min(neighbors, len(data))
+                distance, _ = cKDTree(data[:, :2]).query(points, k=k)
+                radius = np.maximum(radius, distance.reshape(len(points), k)[:, -1])
+        return radius
+
+    points = np.column_stack([np.ravel(x_arr), np.ravel(y_arr)])
+    distance_changed, _ = cKDTree(changed[:, :2]).query(points)
+    # The distance to the k-th neighbour changes at most by the distance moved (1-Lipschitz). An upper bound from a
+    # coarse grid restricts the exact neighbour queries to the candidates.
+    nx, ny = z_arr.shape
+    ci, cj = np.unique(np.append(np.arange(0, nx, coarse_step), nx - 1)), np.unique(np.append(np.arange(0, ny, coarse_step), ny - 1))
+    coarse_radius = kth_distance(np.column_stack([x_arr[np.ix_(ci, cj)].ravel(), y_arr[np.ix_(ci, cj)].ravel()])).reshape(len(ci), len(cj))
+    pi = np.abs(np.arange(nx)[:, None] - ci[None]).argmin(axis=1)
+    pj = np.abs(np.arange(ny)[:, None] - cj[None]).argmin(axis=1)
+    bound = coarse_radius[np.ix_(pi, pj)] + np.hypot(x_arr - x_arr[np.ix_(ci[pi], cj[pj])], y_arr - y_arr[np.ix_(ci[pi], cj[pj])])
+    candidates = np.flatnonzero(distance_changed <= bound.ravel() * (1 + 1e-9))
+    mask.ravel()[candidates] = distance_changed[candidates] <= kth_distance(points[candidates]) * (1 + 1e-9)
+
+    z_arr.ravel()[mask.ravel()] = _interpolator(new_xyz, neighbors)(points[mask.ravel()])
+    return z_arr, mask
+
+
+def read_tile(tiled, tile):
+    """
+    Read the grid coordinates and the surface stack of one tile (including its overlap) from the result of interpolate_tiled.
+    Returns x, y (tile shape) and the stack (n_surfaces, *tile shape) as arrays in memory.
+    """
+    i0, i1, j0, j1 = tile
+    stack = np.load(tiled["path"], mmap_mode="r")
+    x, y = np.meshgrid(tiled["xmin"] + np.arange(i0, i1) * tiled["grid_x"], tiled["ymin"] + np.arange(j0, j1) * tiled["grid_y"], indexing="ij")
+    return x, y, np.array(stack[:, i0:i1, j0:j1])
+
+
+def export_block_model(stack, path, zmin, zmax, dz=1., properties=None, chunk_size=64):
+    """
+    Rasterize a stack of surfaces into a block model of stratum labels, written chunk by chunk to a memory mapped .npy file.
+
+    stack: (n_surfaces, nx, ny) from top to bottom, e.g. after enforce_conformance. A memory mapped stack works as well,
+        e.g. np.load(tiled["path"], mmap_mode="r") for the result of interpolate_tiled.
+    path: file of the label volume (nx, ny, nz) as uint8. The horizontal resolution is the one of the grid,
+        the cell centers in z are zmin + (k + 0.5) * dz.
+        Label 0 is outside of the model (above the top or below the bottom surface), label i is the layer between surface i-1 and i.
+    properties: dict name -> value per layer, e.g. {"FrictionAngle": [15, 40, 32.5]} (see IfcUtils.layer_properties).
+        Each property is written to its own float32 volume next to path (nan outside of the model).
+    chunk_size: number of grid rows rasterized at once. Bounds the memory used.
+
+    Returns a dict with "path", "shape", "zmin", "dz" and "properties" (name -> path).
+    """
+    n_surfaces, nx, ny = stack.shape
+    if n_surfaces > 255:
+        raise ValueError("The block model supports at most 254 layers")
+    nz = int(np.ceil((zmax - zmin) / dz))
+    z = zmin + (np.arange(nz) + 0.5) * dz
+    labels = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(nx, ny, nz))
+
+    properties = properties or {}
+    property_paths, property_volumes, lookups = {}, {}, {}
+    for name, values in properties.items():
+        property_paths[name] = path[:-4] + f"_{name}.npy" if path.endswith(".npy") else path + f"_{name}.npy"
+        property_volumes[name] = np.lib.format.open_memmap(property_paths[name], mode="w+", dtype=np.float32, shape=(nx, ny, nz))
+        lookups[name] = np.concatenate([[np.nan], np.asarray(values, dtype=np.float32)]).astype(np.float32)
+
+    for i0 in range(0, nx, chunk_size):
+        i1 = min(i0 + chunk_size, nx)
+        surfaces = np.asarray(stack[:, i0:i1])
+        # Number of cell centers below or at each surface
+        below = np.searchsorted(z, surfaces.ravel(), side="right").reshape(surfaces.shape)
+        # Count of surfaces above each cell center: 0 above the top, n_surfaces below the bottom
+        count = np.zeros((i1 - i0, ny, nz), dtype=np.uint8)
+        levels = np.arange(nz, dtype=np.int64)
+        for surface_below in below:
+            count += levels < surface_below[..., None]
+        count[count == n_surfaces] = 0
+        labels[i0:i1] = count
+        for name, volume in property_volumes.items():
+            volume[i0:i1] = lookups[name][count]
+
+    labels.flush()
+    for volume in property_volumes.values():
+        volume.flush()
+    return {"path": path, "shape": (nx, ny, nz), "zmin": zmin, "dz": dz, "properties": property_paths}
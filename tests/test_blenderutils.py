@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+# BlenderUtils runs inside Blender (or with the bpy package installed), the tests are skipped elsewhere
+try:
+    import bpy
+    from blenderutils import BlenderUtils
+except ImportError:
+    bpy = None
+
+
+@unittest.skipIf(bpy is None, "bpy is only available in Blender")
+class TestMeshArrays(unittest.TestCase):
+    def setUp(self):
+        self.meshes = []
+
+    def tearDown(self):
+        for mesh in self.meshes:
+            bpy.data.meshes.remove(mesh)
+
+    def new_mesh(self, vertices, faces, **kwargs):
+        mesh = BlenderUtils.mesh_from_arrays(vertices, faces, **kwargs)
+        if mesh not in self.meshes:
+            self.meshes.append(mesh)
+        return mesh
+
+    def test_triangles(self):
+        x, y = np.mgrid[0:4:1., 0:3:1.]
+        vertices = np.stack([x.ravel(), y.ravel(), (x * y).ravel()], axis=1)
+        faces = np.array([[0, 3, 4], [0, 4, 1], [1, 4, 5], [1, 5, 2]])
+        mesh = self.new_mesh(vertices, faces, name="triangles")
+        self.assertEqual(len(mesh.polygons), 4)
+        result_vertices, result_faces = BlenderUtils.mesh_to_arrays(mesh)
+        self.assertTrue(np.allclose(result_vertices, vertices))
+        self.assertTrue((result_faces == faces).all())
+        # Same result as from_pydata
+        reference = bpy.data.meshes.new("reference")
+        self.meshes.append(reference)
+        reference.from_pydata(vertices.tolist(), [], faces.tolist())
+        self.assertTrue((BlenderUtils.mesh_to_arrays(reference)[1] == faces).all())
+
+    def test_mixed_faces_and_matrix(self):
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [2, 0, 0]], dtype=float)
+        faces = [[0, 1, 2, 3], [1, 4, 2]]
+        mesh = self.new_mesh(vertices, faces)
+        matrix = np.eye(4)
+        matrix[:3, 3] = [10., 20., 30.]
+        result_vertices, result_faces = BlenderUtils.mesh_to_arrays(mesh, matrix=matrix)
+        self.assertTrue(np.allclose(result_vertices, vertices + [10., 20., 30.]))
+        self.assertEqual([i.tolist() for i in result_faces], faces)
+
+    def test_replace_geometry(self):
+        mesh = self.new_mesh(np.eye(3), [[0, 1, 2]])
+        self.new_mesh(np.zeros((4, 3)) + np.arange(4)[:, None], [[0, 1, 2], [0, 2, 3]], mesh=mesh)
+        vertices, faces = BlenderUtils.mesh_to_arrays(mesh)
+        self.assertEqual(vertices.shape, (4, 3))
+        self.assertEqual(faces.shape, (2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
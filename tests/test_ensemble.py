@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from ensemble import P2Quantile, realize_surfaces, surface_ensemble
+
+
+class TestP2Quantile(unittest.TestCase):
+    def test_matches_quantile(self):
+        rng = np.random.default_rng(0)
+        samples = rng.normal(loc=np.arange(12.).reshape(3, 4), scale=2., size=(5000, 3, 4))
+        for p in (0.1, 0.5, 0.9):
+            estimator = P2Quantile(p, (3, 4))
+            for i in samples:
+                estimator.add(i)
+            self.assertEqual(estimator.count, 5000)
+            np.testing.assert_allclose(estimator.value, np.quantile(samples, p, axis=0), atol=0.15)
+
+    def test_few_values(self):
+        values = np.array([[3., 1.], [1., 2.], [2., 3.]])
+        estimator = P2Quantile(0.5, (2,))
+        for i in values:
+            estimator.add(i)
+        # Exact percentile before the markers are initialised
+        np.testing.assert_allclose(estimator.value, np.percentile(values, 50, axis=0))
+
+    def test_monotonic_stream(self):
+        estimator = P2Quantile(0.5, ())
+        for i in range(1, 1002):
+            estimator.add(float(i))
+        self.assertAlmostEqual(float(estimator.value), 501., delta=5.)
+
+
+class TestSurfaceEnsemble(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.bh_data = [{"Name": f"bh_{i:03d}", "x": x, "y": y, "OK": 100., "Layerdata": {"UKs": [2. + 0.05 * x, 6., 10.], "Hauptgruppen": ["A", "G", "S"]}}
+            for i, (x, y) in enumerate(rng.uniform(0, 20, size=(8, 2)))]
+        # interpolate_rbf takes a minimum of 0 as not given
+        self.x, self.y = np.mgrid[1:20:1, 1:20:1]
+        self.surfaces = [np.full(self.x.shape, 100.), ("A", ["G", "S"]), ("G", ["S"]), np.full(self.x.shape, 85.)]
+        self.extent = dict(xmin=1, xmax=20, ymin=1, ymax=20)
+
+    def test_without_noise(self):
+        stack = realize_surfaces(self.bh_data, self.surfaces, (1, 20, 1, 20, 1, 1), 0., 1)
+        result = surface_ensemble(self.bh_data, self.surfaces, **self.extent, sigma=0., n_realizations=6, processes=1)
+        self.assertTrue(np.allclose(result["mean"], stack))
+        self.assertTrue(np.allclose(result["std"], 0.))
+        for value in result["quantiles"].values():
+            self.assertTrue(np.allclose(value, stack))
+        self.assertTrue(np.array_equal(result["presence"], (stack[:-1] > stack[1:]).astype(float)))
+
+    def test_independent_of_processes(self):
+        kwargs = dict(sigma=0.3, n_realizations=12, quantiles=(0.1, 0.5), seed=7)
+        serial = surface_ensemble(self.bh_data, self.surfaces, **self.extent, processes=1, **kwargs)
+        parallel = surface_ensemble(self.bh_data, self.surfaces, **self.extent, processes=3, **kwargs)
+        self.assertTrue(np.array_equal(serial["mean"], parallel["mean"]))
+        self.assertTrue(np.array_equal(serial["presence"], parallel["presence"]))
+        for p in (0.1, 0.5):
+            self.assertTrue(np.array_equal(serial["quantiles"][p], parallel["quantiles"][p]))
+        # The noise reaches the contact surfaces only
+        self.assertTrue((serial["std"][1:3] > 0).any())
+        self.assertTrue((serial["std"][[0, 3]] == 0).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
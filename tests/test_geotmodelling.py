@@ -0,0 +1,189 @@
+import os
+import sys
+import unittest
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from geotmodelling import simplify_tin, sample_tin, prepare_grid_to_mesh, prepare_grid_to_mesh_arrays, interpolate_rbf_adaptive, build_stacked_volumes, enforce_conformance, rbf_loo_residuals, cross_validate
+from qualityutils import mesh_volume
+
+
+class TestPrepareGridToMeshArrays(unittest.TestCase):
+    def test_same_as_prepare_grid_to_mesh(self):
+        x, y = np.mgrid[0:5:1., 10:14:1.]
+        z = x * y
+        vertices, faces = prepare_grid_to_mesh_arrays(x, y, z)
+        expected_vertices, expected_faces = prepare_grid_to_mesh(x, y, z)
+        self.assertTrue((vertices == np.array(expected_vertices)).all())
+        self.assertTrue((faces == np.array(expected_faces)).all())
+        self.assertEqual(faces.shape, (2 * 4 * 3, 3))
+
+
+class TestSimplifyTin(unittest.TestCase):
+    def setUp(self):
+        self.x, self.y = np.mgrid[0:40:1., 0:30:1.]
+        self.z = np.sin(self.x / 6) + 0.5 * np.cos(self.y / 4)
+        self.vertices, _ = prepare_grid_to_mesh_arrays(self.x, self.y, self.z)
+
+    def test_max_error(self):
+        fixed = np.array([[10.5, 10.5, 3.]])
+        vertices, faces = simplify_tin(self.vertices, max_error=0.05, fixed_points=fixed)
+        self.assertLess(len(vertices), len(self.vertices))
+        self.assertLessEqual(np.abs(sample_tin(vertices, self.x, self.y) - self.z).max(), 0.05 + 1e-9)
+        # Fixed points keep their height, faces point upwards
+        self.assertTrue((np.abs(vertices - fixed).sum(axis=1) < 1e-12).any())
+        a, b, c = (vertices[faces[:, i], :2] for i in range(3))
+        self.assertTrue(((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) > 0).all())
+
+    def test_planar_surface(self):
+        vertices, faces = simplify_tin(prepare_grid_to_mesh_arrays(self.x, self.y, 0.1 * self.x + 2)[0], max_error=1e-6)
+        self.assertEqual(len(vertices), 4)
+        self.assertEqual(len(faces), 2)
+
+    def test_max_iterations_exceeded(self):
+        with self.assertRaises(RuntimeError):
+            simplify_tin(self.vertices, max_error=1e-6, max_iterations=1)
+
+    def test_sample_tin_outside(self):
+        vertices, _ = simplify_tin(self.vertices, max_error=0.05)
+        self.assertTrue(np.isnan(sample_tin(vertices, np.array([-5.]), np.array([0.]))).all())
+
+
+class TestInterpolateRbfAdaptive(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.xy = rng.uniform([0, 0], [200, 5], (12, 2))
+
+    def test_min_cell_on_both_sides(self):
+        data = np.column_stack([self.xy, np.sin(self.xy[:, 0] / 10)])
+        vertices, faces = interpolate_rbf_adaptive(data, xmin=0, xmax=200, ymin=0, ymax=5, min_cell=1, max_cell=32, tolerance=0.01)
+        # Long and narrow extent: no cell side is shorter than min_cell
+        for axis in (0, 1):
+            self.assertGreaterEqual(np.diff(np.unique(vertices[:, axis])).min(), 1 - 1e-9)
+        np.testing.assert_allclose(vertices[:, :2].min(axis=0), [0, 0])
+        np.testing.assert_allclose(vertices[:, :2].max(axis=0), [200, 5])
+        self.assertEqual(faces.shape[1], 3)
+
+    def test_refined_where_curved(self):
+        plane = np.column_stack([self.xy, 2 + 0.01 * self.xy[:, 0]])
+        vertices, _ = interpolate_rbf_adaptive(plane, xmin=0, xmax=200, ymin=0, ymax=5, tolerance=0.01)
+        # A plane is reproduced exactly, only the cells with data are refined
+        np.testing.assert_allclose(vertices[:, 2], 2 + 0.01 * vertices[:, 0], atol=1e-6)
+        curved = np.column_stack([self.xy, np.sin(self.xy[:, 0] / 10)])
+        self.assertGreater(len(interpolate_rbf_adaptive(curved, xmin=0, xmax=200, ymin=0, ymax=5, tolerance=0.01)[0]), len(vertices))
+
+
+class TestBuildStackedVolumes(unittest.TestCase):
+    def setUp(self):
+        self.x, self.y = np.mgrid[0:10:1., 0:8:1.]
+
+    def assert_closed(self, faces):
+        # Every edge is used once in each direction
+        edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+        self.assertEqual(sorted(map(tuple, edges)), sorted(map(tuple, edges[:, ::-1])))
+        self.assertEqual(len(set(map(tuple, edges))), len(edges))
+
+    def test_flat_layers(self):
+        stack = np.stack([np.full(self.x.shape, 10.), np.full(self.x.shape, 8.), np.full(self.x.shape, 5.)])
+        volumes = build_stacked_volumes(self.x, self.y, stack, names=["A", "G"])
+        self.assertEqual(list(volumes), ["A", "G"])
+        for name, thickness in [("A", 2.), ("G", 3.)]:
+            vertices, faces = volumes[name]
+            self.assert_closed(faces)
+            # Outward oriented, the footprint is 9 x 7
+            self.assertAlmostEqual(mesh_volume(vertices, faces), 9 * 7 * thickness)
+
+    def test_pinch_out_and_crossing(self):
+        top = np.full(self.x.shape, 10.)
+        # The contact crosses the top for x < 4 and is clipped to it there
+        contact = 12. - 0.5 * self.x
+        stack = np.stack([top, contact, np.full(self.x.shape, 5.)])
+        volumes = build_stacked_volumes(self.x, self.y, stack, names=["A", "G"])
+        a_vertices, a_faces = volumes["A"]
+        g_vertices, g_faces = volumes["G"]
+        self.assert_closed(a_faces)
+        self.assert_closed(g_faces)
+        self.assertTrue((a_vertices[:, 2] <= 10. + 1e-12).all())
+        # The layers fill the box between the top and the base
+        self.assertAlmostEqual(mesh_volume(a_vertices, a_faces) + mesh_volume(g_vertices, g_faces), 9 * 7 * 5.)
+        # Layer A is welded where it has no thickness, it has no vertices below the top for x <= 4
+        self.assertFalse(((a_vertices[:, 0] <= 4) & (a_vertices[:, 2] < 10.)).any())
+        # Thickness 0.5 x - 2 for x >= 4, integrated over x in [4, 9] and the 7 m along y
+        self.assertAlmostEqual(mesh_volume(a_vertices, a_faces), 7 * 6.25)
+
+    def test_empty_layer(self):
+        stack = np.stack([np.full(self.x.shape, 10.), np.full(self.x.shape, 10.), np.full(self.x.shape, 5.)])
+        volumes = build_stacked_volumes(self.x, self.y, stack)
+        self.assertEqual(list(volumes), [0, 1])
+        self.assertEqual(len(volumes[0][0]), 0)
+        self.assertEqual(len(volumes[0][1]), 0)
+        self.assertAlmostEqual(mesh_volume(*volumes[1]), 9 * 7 * 5.)
+
+
+class TestEnforceConformance(unittest.TestCase):
+    def setUp(self):
+        # Three columns: consistent, a contact crossing the top and a fill onlapping the relief below
+        self.stack = np.array([[10., 10., 10.], [8., 11., 6.], [7., 7., 7.], [2., 2., 2.]]).reshape(4, 1, 3)
+
+    def test_erode(self):
+        stack = self.stack.copy()
+        result = enforce_conformance(stack)
+        self.assertTrue((stack == self.stack).all())
+        self.assertTrue((np.diff(result, axis=0) <= 0).all())
+        self.assertEqual(result[:, 0, 1].tolist(), [10., 10., 7., 2.])
+        self.assertEqual(result[:, 0, 2].tolist(), [10., 6., 6., 2.])
+        self.assertTrue((result[:, 0, 0] == self.stack[:, 0, 0]).all())
+
+    def test_onlap(self):
+        result = enforce_conformance(self.stack, rules=["erode", "onlap", "erode", "erode"])
+        # The fill is raised onto the surface below where it lies beneath it
+        self.assertEqual(result[:, 0, 2].tolist(), [10., 7., 7., 2.])
+        self.assertEqual(result[:, 0, 1].tolist(), [10., 10., 7., 2.])
+
+    def test_min_thickness(self):
+        result = enforce_conformance(self.stack, min_thickness=[0.5, 1.5, 0.])
+        # Layer 1 (1 m) is removed in the first column, its bottom is raised onto its top. Layer 1 of the second
+        # column (3 m) is kept, layer 0 has no thickness there.
+        self.assertEqual(result[:, 0, 0].tolist(), [10., 8., 8., 2.])
+        self.assertEqual(result[:, 0, 1].tolist(), [10., 10., 7., 2.])
+        self.assertEqual(result[:, 0, 2].tolist(), [10., 6., 6., 2.])
+        # The top surface is never changed
+        self.assertTrue((enforce_conformance(self.stack, min_thickness=20.)[0] == self.stack[0]).all())
+        self.assertTrue((enforce_conformance(self.stack, min_thickness=20.) == 10.).all())
+
+
+class TestRbfLooResiduals(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        xy = rng.uniform(0, 50, size=(30, 2))
+        self.data = np.column_stack([xy, 100 + 0.05 * xy[:, 0] + np.sin(xy[:, 1] / 7)])
+
+    def brute_force(self, kernel="cubic", smoothing=0., epsilon=1., degree=None, neighbors=None):
+        residuals = []
+        for i in range(len(self.data)):
+            others = np.delete(self.data, i, axis=0)
+            interpolator = RBFInterpolator(others[:, :2], others[:, 2], kernel=kernel, smoothing=smoothing, epsilon=epsilon,
+                degree=degree, neighbors=neighbors)
+            residuals.append(self.data[i, 2] - interpolator(self.data[i:i + 1, :2])[0])
+        return np.array(residuals)
+
+    def test_equals_refit(self):
+        for kwargs in [{}, {"kernel": "thin_plate_spline", "smoothing": 0.1}, {"kernel": "gaussian", "epsilon": 0.2, "degree": 1},
+                {"neighbors": 8}, {"kernel": "thin_plate_spline", "neighbors": 12, "smoothing": 0.01}]:
+            with self.subTest(**kwargs):
+                self.assertLess(np.abs(rbf_loo_residuals(self.data, **kwargs) - self.brute_force(**kwargs)).max(), 1e-8)
+
+    def test_cross_validate(self):
+        bh_data = [{"Name": f"bh_{i:03d}", "x": x, "y": y, "OK": z + 1., "Layerdata": {"UKs": [1., 5.], "Hauptgruppen": ["A", "S"]}}
+            for i, (x, y, z) in enumerate(self.data)]
+        result = cross_validate(bh_data, {"A_S": ("A", ["S"]), "S_G": ("S", ["G"])})
+        self.assertEqual(list(result["by_surface"]), ["A_S"])
+        self.assertEqual(result["by_surface"]["A_S"]["n"], len(self.data))
+        errors = self.brute_force()
+        self.assertAlmostEqual(result["by_surface"]["A_S"]["rmse"], np.sqrt(np.mean(errors ** 2)))
+        self.assertAlmostEqual(result["by_borehole"]["bh_003"]["max"], abs(errors[3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+import ifcopenshell
+import ifcopenshell.api.root
+import ifcopenshell.api.aggregate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from ifcstreaming import profile_file_size, iter_statements, StreamingModel, StreamReference, StreamTypedValue, StreamEntity
+from projecttemplate import ProjectTemplate
+from ifcutils import IfcUtils
+
+resources_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+
+# The types read by the streaming checks of qualitychecks_with_unittest.py
+checked_types = ["IfcBorehole", "IfcSimpleProperty", "IfcPropertySet", "IfcUnitAssignment", "IfcNamedUnit", "IfcDerivedUnit",
+    "IfcDerivedUnitElement", "IfcMeasureWithUnit", "IfcMonetaryUnit", "IfcPropertyBoundedValue"]
+
+
+def plain(value):
+    """Comparable form of an attribute value of ifcopenshell and of the streaming model."""
+    if isinstance(value, (StreamReference, StreamEntity)):
+        return ("#", value.id if isinstance(value, StreamReference) else value.id())
+    if isinstance(value, StreamTypedValue):
+        return (value.is_a().upper(), plain(value.wrappedValue))
+    if isinstance(value, ifcopenshell.entity_instance):
+        return ("#", value.id()) if value.id() else (value.is_a().upper(), plain(value.wrappedValue))
+    if isinstance(value, (tuple, list)):
+        return tuple(plain(i) for i in value)
+    if isinstance(value, float):
+        return round(value, 9)
+    return value
+
+
+class TestProfileFileSize(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fp = os.path.join(self.tmp.name, "model.ifc")
+
+    def test_profile(self):
+        model = ifcopenshell.file(schema="IFC4X3")
+        project = ifcopenshell.api.root.create_entity(model, ifc_class="IfcProject")
+        site = ifcopenshell.api.root.create_entity(model, ifc_class="IfcSite", name="Site")
+        ifcopenshell.api.aggregate.assign_object(model, products=[site], relating_object=project)
+        model.write(self.fp)
+        profile = profile_file_size(self.fp)
+        # Only the statements are attributed, not the section keywords
+        self.assertLess(profile["total_bytes"], os.path.getsize(self.fp))
+        self.assertLessEqual(sum(i[2] for i in profile["by_type"]), profile["total_bytes"])
+        self.assertEqual({i[0]: i[1] for i in profile["by_type"]}, {"IfcProject": 1, "IfcSite": 1, "IfcRelAggregates": 1})
+
+    def test_header_without_schema(self):
+        with open(self.fp, "w") as f:
+            f.write("ISO-10303-21;\nHEADER;\nFILE_DESCRIPTION(('ViewDefinition []'),'2;1');\nENDSEC;\nDATA;\n"
+                "#1=IFCCARTESIANPOINT((0.,0.,0.));\nENDSEC;\nEND-ISO-10303-21;\n")
+        with self.assertRaisesRegex(ValueError, "FILE_SCHEMA"):
+            profile_file_size(self.fp)
+
+    def test_unknown_schema(self):
+        with open(self.fp, "w") as f:
+            f.write("ISO-10303-21;\nHEADER;\nFILE_SCHEMA(('IFC9'));\nENDSEC;\nDATA;\n#1=IFCCARTESIANPOINT((0.,0.,0.));\nENDSEC;\nEND-ISO-10303-21;\n")
+        with self.assertRaisesRegex(ValueError, "IFC9"):
+            profile_file_size(self.fp)
+
+
+class TestStreamingModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fp = os.path.join(self.tmp.name, "model.ifc")
+
+    def test_same_as_ifcopenshell(self):
+        model, handles = ProjectTemplate.from_resources(resources_path).clone()
+        bh_data = [{"Name": f"BS{i}", "x": 10. * i, "y": 0., "OK": 100., "Layerdata": {"UKs": [1., 2.5], "Hauptgruppen": ["A", "S"]}} for i in range(3)]
+        boreholes, _ = IfcUtils.add_boreholes(model, bh_data, handles["body"], handles["profile"], relating_object=handles["baugrundaufschlussmodell"])
+        IfcUtils.add_property_table(model, boreholes, "Pset_BoreholeCommon", [("BoreholeState", "IfcLabel", None), ("GroundwaterDepth", "IfcPositiveLengthMeasure", None)],
+            [["INSTALLED", 2.5], ["O'Brien; \u00e4", None], ["PLANNED", 1.]])
+        IfcUtils.add_property_table(model, boreholes, "Fachsektionstage2025", [("WichteUnterAuftrieb", "IfcMassDensityMeasure", handles["kg_per_m3"]), ("IsRelevant", "IfcBoolean", None)],
+            [[(0., 30., 19.8), True]] * 3, template=handles["pset_template"])
+        model.write(self.fp)
+
+        expected = ifcopenshell.open(self.fp)
+        streamed = StreamingModel(self.fp, checked_types)
+        for ifc_class in checked_types:
+            entities = sorted(expected.by_type(ifc_class), key=lambda i: i.id())
+            self.assertTrue(entities, ifc_class)
+            self.assertEqual([i.id() for i in sorted(streamed.by_type(ifc_class), key=lambda i: i.id())], [i.id() for i in entities])
+            for entity in entities:
+                with self.subTest(entity=entity):
+                    stream_entity = streamed.by_id(entity.id())
+                    self.assertEqual(stream_entity.is_a(), entity.is_a())
+                    self.assertEqual(plain(stream_entity._arguments), plain(tuple(entity)))
+        self.assertEqual(sorted(i.Name for i in streamed.by_type("IfcBorehole")), ["BS0", "BS1", "BS2"])
+
+    def test_statements_on_one_line(self):
+        with open(self.fp, "w") as f:
+            f.write("ISO-10303-21;\nHEADER;FILE_SCHEMA(('IFC4X3'));\nENDSEC;\nDATA;\n"
+                "#1=IFCLABEL('a;b');#2=IFCLABEL('it''s;');\n#3=IFCCARTESIANPOINT(\n(0.,0.,0.));ENDSEC;\nEND-ISO-10303-21;\n")
+        self.assertEqual(list(iter_statements(self.fp)), [("HEADER", "FILE_SCHEMA(('IFC4X3'));"), ("DATA", "#1=IFCLABEL('a;b');"),
+            ("DATA", "#2=IFCLABEL('it''s;');"), ("DATA", "#3=IFCCARTESIANPOINT(\n(0.,0.,0.));")])
+
+    def test_header_without_schema(self):
+        with open(self.fp, "w") as f:
+            f.write("ISO-10303-21;\nHEADER;\nENDSEC;\nDATA;\n#1=IFCBOREHOLE('0',$,'BS1',$,$,$,$,$);\nENDSEC;\nEND-ISO-10303-21;\n")
+        with self.assertRaisesRegex(ValueError, "FILE_SCHEMA"):
+            StreamingModel(self.fp, ["IfcBorehole"])
+
+
+if __name__ == "__main__":
+    unittest.main()
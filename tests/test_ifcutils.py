@@ -0,0 +1,186 @@
+import os
+import sys
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+import ifcopenshell
+import ifcopenshell.api.root
+import ifcopenshell.api.unit
+import ifcopenshell.api.context
+import ifcopenshell.api.material
+import ifcopenshell.util.element
+import ifcopenshell.util.placement
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from ifcutils import IfcUtils
+
+
+def borehole(ind):
+    hauptgruppen = ["A", "G", "S"][ind % 2:]
+    return {"Name": f"bh_{ind:03d}", "x": 10. * ind, "y": 5. * (ind % 3), "OK": 100. + ind,
+        "Layerdata": {"UKs": [1., 2.5, 4.][:len(hauptgruppen)], "Hauptgruppen": hauptgruppen}}
+
+
+def base_model():
+    """Project with a body context, profile, geomodel and materials. The geomodel aggregates one borehole already."""
+    model = ifcopenshell.file(schema="IFC4X3")
+    ifcopenshell.api.root.create_entity(model, ifc_class="IfcProject", name="Test")
+    ifcopenshell.api.unit.assign_unit(model)
+    context = ifcopenshell.api.context.add_context(model, context_type="Model")
+    body = ifcopenshell.api.context.add_context(model, context_type="Model", context_identifier="Body", target_view="MODEL_VIEW", parent=context)
+    geomodel = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeomodel", name="Baugrundaufschlussmodell")
+    profile = model.create_entity("IfcCircleProfileDef", ProfileName="300C", ProfileType="AREA", Radius=0.3)
+    materials = {hg: ifcopenshell.api.material.add_material(model, name=name) for hg, name in [("A", "Auffuellung"), ("G", "Kies"), ("S", "Sand")]}
+    IfcUtils.add_boreholes(model, [borehole(0)], body, profile, relating_object=geomodel, materials=materials)
+    return model, {"context": body, "profile": profile, "relating_object": geomodel, "materials": materials}
+
+
+def summary(model):
+    boreholes = {}
+    for bh in model.by_type("IfcBorehole"):
+        layers = ifcopenshell.util.element.get_parts(bh)
+        boreholes[bh.Name] = (tuple(ifcopenshell.util.placement.get_local_placement(bh.ObjectPlacement)[:3, 3].round(6)),
+            sorted((i.Name, ifcopenshell.util.element.get_material(i).Name) for i in layers))
+    geomodel = model.by_type("IfcGeomodel")[0]
+    return {"boreholes": boreholes, "aggregated": sorted(i.Name for i in ifcopenshell.util.element.get_parts(geomodel)),
+        "types": Counter(i.is_a() for i in model)}
+
+
+def _rename_geomodel(model, name):
+    model.by_type("IfcGeomodel")[0].Name = name
+
+
+class TestTemplateColumns(unittest.TestCase):
+    def test_standard_template(self):
+        model, _ = base_model()
+        columns = IfcUtils.template_columns(model, "Pset_SolidStratumCapacity", ["PoisonsRatio", "FrictionAngle"])
+        self.assertEqual(columns, [("FrictionAngle", "IfcPlaneAngleMeasure", None), ("PoisonsRatio", "IfcRatioMeasure", None)])
+        with self.assertRaisesRegex(ValueError, "FrictionAngel"):
+            IfcUtils.template_columns(model, "Pset_SolidStratumCapacity", ["FrictionAngel"])
+        with self.assertRaises(ValueError):
+            IfcUtils.template_columns(model, "Pset_Unknown", ["FrictionAngle"])
+
+
+class TestTriangulatedRepresentation(unittest.TestCase):
+    def setUp(self):
+        self.model, handles = base_model()
+        self.context = handles["context"]
+
+    def test_merge_and_round(self):
+        # Two triangles of a square, the shared corners given twice and slightly apart
+        vertices = np.array([[0, 0, 1.00004], [1, 0, 1], [1, 1, 1], [0, 0, 1], [1, 1, 1.0003], [0, 1, 1]])
+        faces = np.array([[0, 1, 2], [3, 4, 5], [0, 3, 4]])
+        representation = IfcUtils.add_triangulated_representation(self.model, self.context, vertices, faces)
+        item = representation.Items[0]
+        self.assertEqual(representation.RepresentationType, "Tessellation")
+        self.assertTrue(item.is_a("IfcTriangulatedFaceSet"))
+        coordinates = np.array(item.Coordinates.CoordList)
+        self.assertEqual(len(coordinates), 4)
+        self.assertTrue(np.allclose(coordinates, np.round(coordinates, 3)))
+        # The third face degenerated by merging its corners
+        self.assertEqual(len(item.CoordIndex), 2)
+        self.assertTrue(np.allclose(sorted(map(tuple, coordinates[np.array(item.CoordIndex) - 1].reshape(-1, 3))),
+            sorted(map(tuple, np.round(vertices[[0, 1, 2, 0, 2, 5]], 3)))))
+
+    def test_polygonal_and_unrounded(self):
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [2, 0, 0.12345]])
+        item = IfcUtils.add_triangulated_representation(self.model, self.context, vertices, [[0, 1, 2, 3], [1, 4, 2]], precision=None, closed=False).Items[0]
+        self.assertTrue(item.is_a("IfcPolygonalFaceSet"))
+        self.assertFalse(item.Closed)
+        self.assertEqual([tuple(i.CoordIndex) for i in item.Faces], [(1, 2, 3, 4), (2, 5, 3)])
+        self.assertEqual(item.Coordinates.CoordList[4], (2., 0., 0.12345))
+
+
+class TestCompactModel(unittest.TestCase):
+    def setUp(self):
+        self.model, handles = base_model()
+        boreholes, _ = IfcUtils.add_boreholes(self.model, [borehole(i) for i in range(1, 5)], handles["context"], handles["profile"],
+            relating_object=handles["relating_object"], materials=handles["materials"])
+        IfcUtils.add_property_table(self.model, boreholes, "Pset_BoreholeCommon", [("BoreholeState", "IfcLabel", None)],
+            [["INSTALLED"], ["INSTALLED"], ["PLANNED"], ["INSTALLED"]], share=False)
+        self.psets = {i.Name: ifcopenshell.util.element.get_pset(i, "Pset_BoreholeCommon", "BoreholeState") for i in boreholes}
+
+    def test_geometry_only(self):
+        before = summary(self.model)
+        removed = IfcUtils.compact_model(self.model)
+        self.assertGreater(removed["IfcCartesianPoint"], 0)
+        self.assertGreater(removed["IfcDirection"], 0)
+        after = summary(self.model)
+        self.assertEqual(after["boreholes"], before["boreholes"])
+        self.assertEqual(after["types"]["IfcCartesianPoint"], before["types"]["IfcCartesianPoint"] - removed["IfcCartesianPoint"])
+        points = [tuple(i.Coordinates) for i in self.model.by_type("IfcCartesianPoint")]
+        self.assertEqual(len(points), len(set(points)))
+        # Properties are kept separate, so single psets can still be edited
+        self.assertEqual(after["types"]["IfcPropertySingleValue"], 4)
+        self.assertEqual({i.Name: ifcopenshell.util.element.get_pset(i, "Pset_BoreholeCommon", "BoreholeState")
+            for i in self.model.by_type("IfcBorehole") if i.Name in self.psets}, self.psets)
+
+    def test_properties(self):
+        removed = IfcUtils.compact_model(self.model, properties=True)
+        self.assertEqual(removed["IfcPropertySingleValue"], 2)
+        self.assertEqual(len(self.model.by_type("IfcPropertySingleValue")), 2)
+        self.assertEqual({i.Name: ifcopenshell.util.element.get_pset(i, "Pset_BoreholeCommon", "BoreholeState")
+            for i in self.model.by_type("IfcBorehole") if i.Name in self.psets}, self.psets)
+        # The compacted model is written and read again without dangling references
+        with tempfile.TemporaryDirectory() as tmp:
+            self.model.write(os.path.join(tmp, "compact.ifc"))
+            model = ifcopenshell.open(os.path.join(tmp, "compact.ifc"))
+        self.assertEqual(summary(model)["boreholes"], summary(self.model)["boreholes"])
+
+
+class TestBuildParallel(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.bh_data = [borehole(i) for i in range(1, 9)]
+
+    def test_parallel_equals_serial(self):
+        model, arguments = base_model()
+        IfcUtils.add_boreholes(model, self.bh_data, **arguments)
+        serial = summary(model)
+
+        model, arguments = base_model()
+        batches = [self.bh_data[:3], self.bh_data[3:6], self.bh_data[6:]]
+        merged = IfcUtils.build_parallel(model, IfcUtils.add_boreholes, batches, os.path.join(self.tmp.name, "merged.ifc"),
+            processes=2, **arguments)
+        parallel = summary(merged)
+        self.assertEqual(parallel["boreholes"], serial["boreholes"])
+        # The IfcRelAggregates of the base was extended by all parts
+        self.assertEqual(len(parallel["aggregated"]), 9)
+        self.assertEqual(parallel["aggregated"], serial["aggregated"])
+        self.assertEqual(parallel["types"], serial["types"])
+
+    def test_merge_models(self):
+        model, arguments = base_model()
+        base_fp = os.path.join(self.tmp.name, "base.ifc")
+        model.write(base_fp)
+        part_fps = []
+        for ind, batch in enumerate([self.bh_data[:4], self.bh_data[4:]]):
+            part = ifcopenshell.open(base_fp)
+            part_arguments = {"context": part.by_id(arguments["context"].id()), "profile": part.by_id(arguments["profile"].id()),
+                "relating_object": part.by_id(arguments["relating_object"].id()),
+                "materials": {k: part.by_id(v.id()) for k, v in arguments["materials"].items()}}
+            IfcUtils.add_boreholes(part, batch, **part_arguments)
+            part_fps.append(os.path.join(self.tmp.name, f"part_{ind}.ifc"))
+            part.write(part_fps[-1])
+        fp = os.path.join(self.tmp.name, "merged.ifc")
+        IfcUtils.merge_models(base_fp, part_fps, fp)
+        merged = ifcopenshell.open(fp)
+        # Shared entities keep their ids
+        for i in model:
+            self.assertEqual(merged.by_id(i.id()).is_a(), i.is_a())
+        self.assertEqual(len(set(i.GlobalId for i in merged.by_type("IfcRoot"))), len(merged.by_type("IfcRoot")))
+        # One association per material: the one of the base and the fused one of the parts
+        associations = Counter(i.RelatingMaterial.Name for i in merged.by_type("IfcRelAssociatesMaterial"))
+        self.assertEqual(associations, Counter({"Auffuellung": 2, "Kies": 2, "Sand": 2}))
+        self.assertEqual(len(merged.by_type("IfcGeomodel")[0].IsDecomposedBy), 1)
+
+    def test_edited_shared_entity(self):
+        model, _ = base_model()
+        with self.assertRaises(ValueError):
+            IfcUtils.build_parallel(model, _rename_geomodel, ["Renamed"], os.path.join(self.tmp.name, "merged.ifc"), processes=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import copy
+import json
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import ifcopenshell.api.aggregate
+import ifcopenshell.api.geometry
+import ifcopenshell.api.root
+import ifcopenshell.util.element
+import ifcopenshell.util.placement
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from incremental import update_stack, changed_layers, update_model
+from tiledmodelling import interpolate_tiled
+from geotmodelling import prepare_points_from_connections, enforce_conformance, build_stacked_volumes
+from stratigraphy import layer_quantities
+from projecttemplate import ProjectTemplate
+from qualityutils import tessellated_volume
+from ifcutils import IfcUtils
+
+resources_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+with open(os.path.join(resources_path, "mapping_hg_to_materialname.json"), encoding="Latin1") as f:
+    material_names = json.load(f)
+
+names = ["A", "G", "S"]
+contacts = [("A", ["S", "G"]), ("G", ["S"], [(20., 20., 92.)])]
+
+
+def borehole(ind, x, y, uks):
+    return {"Name": f"bh_{ind:03d}", "x": x, "y": y, "OK": 100. + 0.05 * x, "Layerdata": {"UKs": uks, "Hauptgruppen": ["A", "G", "S"]}}
+
+
+def full_stack(x_arr, y_arr, bh_data, neighbors):
+    """Surfaces as interpolated for the full model: topography, contacts (neighbor limited) and base."""
+    surfaces = []
+    for contact in contacts:
+        xyz = np.column_stack(prepare_points_from_connections(bh_data, *contact[:2])).reshape(-1, 3)
+        surfaces.append(np.concatenate([xyz, np.reshape(contact[2] if len(contact) > 2 else [], (-1, 3))]))
+    with tempfile.TemporaryDirectory() as tmp:
+        tiled = interpolate_tiled(surfaces, os.path.join(tmp, "stack.npy"), xmin=0, xmax=x_arr.shape[0], ymin=0, ymax=x_arr.shape[1],
+            tile_size=16, neighbors=neighbors, processes=1)
+        z_a, z_g = np.load(tiled["path"])
+    return np.stack([100. + 0.05 * x_arr, z_a, z_g, np.full(x_arr.shape, 80.)])
+
+
+def build_model(x_arr, y_arr, stack, bh_data):
+    """The model as create_ifc_model.py builds it: boreholes with a shared Pset_BoreholeCommon and the soil layers with their qto."""
+    model, handles = ProjectTemplate.from_resources(resources_path).clone()
+    materials = {hg: [i for i in model.by_type("IfcMaterial") if i.Name == v][0] for hg, v in material_names.items()}
+    boreholes, _ = IfcUtils.add_boreholes(model, bh_data, handles["body"], handles["profile"],
+        relating_object=handles["baugrundaufschlussmodell"], materials=materials)
+    IfcUtils.add_property_table(model, boreholes, "Pset_BoreholeCommon", [("BoreholeState", "IfcLabel", None)], [["INSTALLED"]] * len(boreholes))
+    layers = []
+    for name, (vertices, faces) in build_stacked_volumes(x_arr, y_arr, stack, names=names).items():
+        if not len(faces):
+            continue
+        layer = ifcopenshell.api.root.create_entity(model, ifc_class="IfcGeotechnicalStratum", predefined_type="SOLID", name=name)
+        representation = IfcUtils.add_triangulated_representation(model, context=handles["body"], vertices=vertices, faces=faces, closed=True)
+        ifcopenshell.api.geometry.assign_representation(model, product=layer, representation=representation)
+        ifcopenshell.api.aggregate.assign_object(model, products=[layer], relating_object=handles["baugrundschichtenmodell"])
+        layers.append(layer)
+    IfcUtils.assign_materials(model, layers, [material_names[i.Name] for i in layers])
+    quantities = layer_quantities(x_arr, y_arr, stack, names=names)
+    IfcUtils.add_quantity_table(model, layers, "Qto_VolumetricStratumBaseQuantities", [("Volume", "IfcQuantityVolume"), ("PlanArea", "IfcQuantityArea")],
+        [[quantities[i.Name]["volume"], quantities[i.Name]["area"]] for i in layers], share=False)
+    return model, handles
+
+
+def summary(model):
+    """Everything the quality checks look at, independent of ids and GlobalIds."""
+    def material(element):
+        material = ifcopenshell.util.element.get_material(element)
+        return material.Name if material is not None else None
+
+    def psets(element):
+        return {k: {p: v for p, v in props.items() if p != "id"} for k, props in ifcopenshell.util.element.get_psets(element).items()}
+
+    boreholes = {}
+    for bh in model.by_type("IfcBorehole"):
+        parts = sorted(ifcopenshell.util.element.get_parts(bh) or [], key=lambda i: i.Name)
+        boreholes[bh.Name] = (np.round(ifcopenshell.util.placement.get_local_placement(bh.ObjectPlacement), 6).tolist(), psets(bh),
+            ifcopenshell.util.element.get_aggregate(bh).Name,
+            [(i.Name, material(i), np.round(ifcopenshell.util.placement.get_local_placement(i.ObjectPlacement), 6).tolist()) for i in parts])
+    layers = {}
+    for layer in model.by_type("IfcGeotechnicalStratum"):
+        if layer.PredefinedType != "SOLID":
+            continue
+        face_set = layer.Representation.Representations[0].Items[0]
+        vertices = np.array(face_set.Coordinates.CoordList)
+        qto = psets(layer)["Qto_VolumetricStratumBaseQuantities"]
+        layers[layer.Name] = (sorted(map(tuple, vertices.round(6))), round(tessellated_volume(layer), 6), round(qto["Volume"], 6),
+            round(qto["PlanArea"], 6), material(layer), ifcopenshell.util.element.get_aggregate(layer).Name)
+    return boreholes, layers
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.x, self.y = np.mgrid[0:40:1., 0:40:1.]
+        rng = np.random.default_rng(5)
+        self.old_bh_data = [borehole(ind, x, y, [1. + rng.random(), 3. + rng.random(), 12.])
+            for ind, (x, y) in enumerate(rng.uniform(0, 39, size=(16, 2)).round(1))]
+        self.new_bh_data = copy.deepcopy(self.old_bh_data)
+        self.new_bh_data[3]["Layerdata"]["UKs"] = [2.5, 3.5, 12.]
+        del self.new_bh_data[7]
+        self.new_bh_data.append(borehole(16, 33., 4., [0.5, 4.5, 12.]))
+        self.neighbors = 5
+
+    def test_update_stack_equals_full_interpolation(self):
+        old = full_stack(self.x, self.y, self.old_bh_data, self.neighbors)
+        new = full_stack(self.x, self.y, self.new_bh_data, self.neighbors)
+        surfaces = [new[0], *contacts, new[3]]
+        stack, mask = update_stack(self.x, self.y, old, self.old_bh_data, self.new_bh_data, surfaces, neighbors=self.neighbors)
+        self.assertLess(np.abs(stack - new).max(), 1e-9)
+        # Only the neighbourhood of the edited boreholes is interpolated again
+        self.assertTrue(mask[1:3].any())
+        self.assertLess(mask[1:3].mean(), 0.8)
+        self.assertFalse(mask[[0, 3]].any())
+
+    def test_update_model_equals_full_rebuild(self):
+        old_stack = enforce_conformance(full_stack(self.x, self.y, self.old_bh_data, self.neighbors), min_thickness=0.1).round(3)
+        new_stack = enforce_conformance(full_stack(self.x, self.y, self.new_bh_data, self.neighbors), min_thickness=0.1).round(3)
+        model, handles = build_model(self.x, self.y, old_stack, self.old_bh_data)
+        materials = {hg: [i for i in model.by_type("IfcMaterial") if i.Name == v][0] for hg, v in material_names.items()}
+        result = update_model(model, handles["body"], self.x, self.y, old_stack, new_stack, names, self.old_bh_data, self.new_bh_data,
+            handles["profile"], materials=materials, layer_materials=material_names)
+        self.assertEqual(result["added"], ["bh_016"])
+        self.assertEqual(result["removed"], ["bh_007"])
+        self.assertEqual(result["edited"], ["bh_003"])
+        self.assertEqual(sorted(result["layers"]), sorted(changed_layers(old_stack, new_stack, names)))
+
+        expected, _ = build_model(self.x, self.y, new_stack, self.new_bh_data)
+        boreholes, layers = summary(model)
+        expected_boreholes, expected_layers = summary(expected)
+        self.assertEqual(boreholes, expected_boreholes)
+        self.assertEqual(layers, expected_layers)
+        # The boreholes still share one Pset_BoreholeCommon
+        self.assertEqual(len(model.by_type("IfcPropertySet")), len(expected.by_type("IfcPropertySet")))
+
+    def test_layer_appears_and_vanishes(self):
+        old_stack = np.stack([np.full(self.x.shape, 100.), np.full(self.x.shape, 98.), np.full(self.x.shape, 98.), np.full(self.x.shape, 90.)])
+        new_stack = old_stack.copy()
+        new_stack[2] = 96.
+        new_stack[1] = new_stack[0]
+        model, handles = build_model(self.x, self.y, old_stack, self.old_bh_data)
+        self.assertEqual(sorted(i.Name for i in model.by_type("IfcGeotechnicalStratum") if i.PredefinedType == "SOLID"), ["A", "S"])
+        result = update_model(model, handles["body"], self.x, self.y, old_stack, new_stack, names, self.old_bh_data, self.old_bh_data,
+            handles["profile"], layer_materials=material_names)
+        self.assertEqual(result["created"], ["G"])
+        self.assertEqual(result["removed_layers"], ["A"])
+        expected, _ = build_model(self.x, self.y, new_stack, self.old_bh_data)
+        self.assertEqual(summary(model)[1], summary(expected)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
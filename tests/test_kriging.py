@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from kriging import OrdinaryKriging, experimental_variogram, fit_variogram
+
+
+def data(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 100, (n, 2))
+    return np.column_stack([xy, 10 + 0.05 * xy[:, 0] + np.sin(xy[:, 1] / 15)])
+
+
+class TestOrdinaryKriging(unittest.TestCase):
+    def test_exact_at_data_points(self):
+        xyz = data()
+        kriging = OrdinaryKriging(xyz, params=(0., 1., 50.))
+        estimate, variance = kriging.predict(xyz[:, :2])
+        np.testing.assert_allclose(estimate, xyz[:, 2], atol=1e-6)
+        np.testing.assert_allclose(variance, 0., atol=1e-6)
+
+    def test_constant_field(self):
+        xyz = data()
+        xyz[:, 2] = 5.
+        estimate, _ = OrdinaryKriging(xyz, params=(0.1, 1., 30.)).predict([[50., 50.], [-20., 130.]])
+        np.testing.assert_allclose(estimate, 5.)
+
+    def test_fitted_variogram(self):
+        kriging = OrdinaryKriging(data(200))
+        nugget, sill, range_ = kriging.params
+        self.assertTrue(0 <= nugget <= sill)
+        self.assertGreater(range_, 0)
+        x, y, z, variance = kriging.grid(xmin=0, xmax=100, ymin=0, ymax=50, grid_x=10, grid_y=10)
+        self.assertEqual(z.shape, (10, 5))
+        self.assertEqual(x.shape, z.shape)
+        self.assertTrue((variance >= 0).all())
+        # The variance grows away from the data
+        self.assertGreater(kriging.predict([[500., 500.]])[1][0], variance.max())
+
+    def test_too_little_data(self):
+        with self.assertRaises(ValueError):
+            OrdinaryKriging([[0., 0., 1.]])
+        with self.assertRaises(ValueError):
+            OrdinaryKriging([[0., 0., 1.], [100., 0., 2.]], max_lag=1.)
+        # Explicit params do not need a variogram
+        estimate, _ = OrdinaryKriging([[0., 0., 1.]], params=(0., 1., 10.)).predict([[5., 5.]])
+        np.testing.assert_allclose(estimate, 1.)
+
+    def test_not_converging(self):
+        variogram = experimental_variogram(data())
+        with mock.patch("kriging.curve_fit", side_effect=RuntimeError("Optimal parameters not found")):
+            with self.assertRaisesRegex(RuntimeError, "did not converge"):
+                fit_variogram(*variogram)
+
+
+if __name__ == "__main__":
+    unittest.main()
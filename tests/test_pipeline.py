@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from pipeline import Pipeline, content_hash
+
+
+class TestContentHash(unittest.TestCase):
+    def test_arrays_and_containers(self):
+        self.assertEqual(content_hash({"a": np.arange(3), "b": (1, "x")}), content_hash({"b": (1, "x"), "a": np.arange(3)}))
+        self.assertNotEqual(content_hash(np.arange(3)), content_hash(np.arange(3.)))
+        self.assertNotEqual(content_hash([1, 2]), content_hash((1, 2)))
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.module_fp = os.path.join(self.tmp.name, "pipeline_helper.py")
+        with open(self.module_fp, "w") as f:
+            f.write("FACTOR = 2\n")
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, **params):
+        def source(scale):
+            self.calls.append("source")
+            return np.arange(4) * scale
+
+        def total(source, version=None):
+            self.calls.append("total")
+            return float(source.sum())
+
+        pipeline = Pipeline(os.path.join(self.tmp.name, "cache"), modules=())
+        pipeline.add("source", source, scale=params.get("scale", 1))
+        pipeline.add("total", total, inputs=["source"], **({"version": params["version"]} if "version" in params else {}))
+        return pipeline
+
+    def test_cache_hits(self):
+        self.assertEqual(self.build().run()["total"], 6.)
+        pipeline = self.build()
+        self.assertEqual(pipeline.run()["total"], 6.)
+        self.assertEqual([i["hit"] for i in pipeline.stats], [True, True])
+        self.assertEqual(self.calls, ["source", "total"])
+
+    def test_parameter_invalidates_downstream(self):
+        self.build().run()
+        pipeline = self.build(scale=2)
+        self.assertEqual(pipeline.run()["total"], 12.)
+        self.assertEqual([i["hit"] for i in pipeline.stats], [False, False])
+
+    def test_version_is_hashed_but_not_passed(self):
+        self.build().run()
+        pipeline = self.build(version=2)
+        self.assertEqual(pipeline.run()["total"], 6.)
+        self.assertEqual([i["hit"] for i in pipeline.stats], [True, False])
+
+    def test_module_source_is_part_of_the_key(self):
+        sys.path.insert(0, self.tmp.name)
+        try:
+            pipeline = Pipeline(os.path.join(self.tmp.name, "cache"), modules=["pipeline_helper"])
+            pipeline.add("value", lambda: 1)
+            pipeline.run()
+            pipeline.run()
+            self.assertTrue(pipeline.stats[0]["hit"])
+            with open(self.module_fp, "w") as f:
+                f.write("FACTOR = 3\n")
+            pipeline.run()
+            self.assertFalse(pipeline.stats[0]["hit"])
+        finally:
+            sys.path.remove(self.tmp.name)
+
+    def test_update_with_previous_result(self):
+        def total(source):
+            self.calls.append("total")
+            return {"source": source, "total": float(source.sum())}
+
+        def update_total(previous, source):
+            self.calls.append("update")
+            # Only the changed entries are added again
+            changed = source != previous["source"]
+            return {"source": source, "total": previous["total"] + float((source[changed] - previous["source"][changed]).sum())}
+
+        def build(scale):
+            pipeline = Pipeline(os.path.join(self.tmp.name, "cache"), modules=())
+            pipeline.add("source", lambda scale: np.arange(4) * scale, scale=scale)
+            pipeline.add("total", total, inputs=["source"], update=update_total)
+            return pipeline
+
+        build(1).run()
+        pipeline = build(2)
+        self.assertEqual(pipeline.run()["total"]["total"], 12.)
+        self.assertEqual([i["updated"] for i in pipeline.stats], [False, True])
+        self.assertIn("update", pipeline.report())
+        # The updated result is cached as the one of a full run
+        pipeline.run()
+        self.assertEqual([i["hit"] for i in pipeline.stats], [True, True])
+        self.assertEqual(self.calls, ["total", "update"])
+        # Cached results are loaded, later updates start from the last result used
+        self.assertEqual(build(1).run()["total"]["total"], 6.)
+        self.assertEqual(self.calls, ["total", "update"])
+        self.assertEqual(build(3).run()["total"]["total"], 18.)
+        self.assertEqual(self.calls, ["total", "update", "update"])
+
+
+if __name__ == "__main__":
+    unittest.main()
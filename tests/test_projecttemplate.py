@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+import ifcopenshell.api.root
+import ifcopenshell.util.element
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from projecttemplate import ProjectTemplate
+
+resources_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+
+
+class TestProjectTemplate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.template = ProjectTemplate.from_resources(resources_path)
+
+    def test_handles(self):
+        model, handles = self.template.clone()
+        self.assertEqual(handles["project"], model.by_type("IfcProject")[0])
+        self.assertEqual(handles["site"].is_a(), "IfcSite")
+        self.assertEqual({handles["baugrundschichtenmodell"].Name, handles["baugrundaufschlussmodell"].Name},
+            {"Baugrundschichtenmodell", "Baugrundaufschlussmodell"})
+        self.assertEqual(ifcopenshell.util.element.get_container(handles["baugrundaufschlussmodell"]), handles["site"])
+        self.assertEqual(handles["body"].ContextIdentifier, "Body")
+        self.assertEqual(handles["pset_template"].Name, "Fachsektionstage2025_template")
+        self.assertEqual(sorted(i.Name for i in model.by_type("IfcMaterial")), ["Auffuellung", "Kies", "Sand"])
+        self.assertIn("DEGREE", [i.Name for i in model.by_type("IfcConversionBasedUnit")])
+
+    def test_clones_are_independent(self):
+        first, first_handles = self.template.clone(name="Erstes Projekt", description="Test")
+        second, second_handles = self.template.clone()
+        self.assertEqual(first_handles["project"].Name, "Erstes Projekt")
+        self.assertEqual(first_handles["project"].Description, "Test")
+        self.assertEqual(second_handles["project"].Name, "Projekt_Fachsektionstage2025")
+        ifcopenshell.api.root.create_entity(first, ifc_class="IfcBorehole", name="bh_001")
+        self.assertEqual(len(second.by_type("IfcBorehole")), 0)
+        # Entities keep the ids of the template, the GlobalIds are new for each clone
+        self.assertEqual(first_handles["site"].id(), second_handles["site"].id())
+        self.assertNotEqual(first_handles["site"].GlobalId, second_handles["site"].GlobalId)
+        guids = [i.GlobalId for i in first.by_type("IfcRoot")]
+        self.assertEqual(len(guids), len(set(guids)))
+        _, kept = self.template.clone(new_guids=False)
+        _, kept_again = self.template.clone(new_guids=False)
+        self.assertEqual(kept["site"].GlobalId, kept_again["site"].GlobalId)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, "template.ifc")
+            self.template.save(fp)
+            loaded = ProjectTemplate.load(fp)
+        self.assertEqual(loaded.ids, self.template.ids)
+        model, handles = loaded.clone()
+        self.assertEqual(handles["profile"].is_a(), self.template.clone()[1]["profile"].is_a())
+        self.assertEqual(len(list(model)), len(list(self.template.clone()[0])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+import numpy as np
+import ifcopenshell
+import ifcopenshell.api.root
+import ifcopenshell.api.context
+import ifcopenshell.api.geometry
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from qualityutils import delaunay_edges, analyse_borehole_spacing, mesh_volume, tessellated_volume
+from ifcutils import IfcUtils
+
+
+def box(dx=1., dy=1., dz=1.):
+    """Closed box with outward oriented faces."""
+    vertices = np.array([[0, 0, 0], [dx, 0, 0], [dx, dy, 0], [0, dy, 0], [0, 0, dz], [dx, 0, dz], [dx, dy, dz], [0, dy, dz]], dtype=float)
+    faces = np.array([[0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7], [0, 1, 5], [0, 5, 4],
+        [1, 2, 6], [1, 6, 5], [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]])
+    return vertices, faces
+
+
+class TestDelaunayEdges(unittest.TestCase):
+    def test_square(self):
+        edges, lengths = delaunay_edges([[0, 0], [10, 0], [10, 10], [0, 10]])
+        # Four sides and one diagonal
+        self.assertEqual(len(edges), 5)
+        self.assertTrue((edges[:, 0] < edges[:, 1]).all())
+        self.assertEqual(len(np.unique(edges, axis=0)), 5)
+        self.assertEqual(sorted(np.round(lengths, 6))[-1], round(np.sqrt(200), 6))
+
+    def test_collinear(self):
+        edges, lengths = delaunay_edges([[30, 0], [0, 0], [10, 0], [25, 0]])
+        self.assertEqual(edges.tolist(), [[0, 3], [1, 2], [2, 3]])
+        np.testing.assert_allclose(lengths, [5, 10, 15])
+        # Also along an inclined line
+        edges, lengths = delaunay_edges([[0, 0], [3, 4], [6, 8]])
+        self.assertEqual(edges.tolist(), [[0, 1], [1, 2]])
+        np.testing.assert_allclose(lengths, [5, 5])
+
+    def test_few_points(self):
+        self.assertEqual(delaunay_edges([[0, 0], [3, 4]])[0].tolist(), [[0, 1]])
+        self.assertEqual(delaunay_edges([[0, 0]])[0].shape, (0, 2))
+        self.assertEqual(delaunay_edges(np.zeros((0, 2)))[0].shape, (0, 2))
+
+    def test_spacing(self):
+        points = [[0, 0], [60, 0], [100, 0]]
+        result = analyse_borehole_spacing(points)
+        # The limit itself is not allowed
+        self.assertEqual(result["ok"].tolist(), [False, True])
+        self.assertEqual(result["ok_borehole"].tolist(), [False, False, True])
+        result = analyse_borehole_spacing(points, zones=[([[50, -1], [100, -1], [100, 1], [50, 1]], "hoch_und_industriebauten")])
+        self.assertEqual(result["max_spacing"].tolist(), [60, 40])
+        self.assertEqual(result["ok"].tolist(), [False, False])
+
+
+class TestMeshVolume(unittest.TestCase):
+    def test_box(self):
+        vertices, faces = box(2., 3., 4.)
+        self.assertAlmostEqual(mesh_volume(vertices, faces), 24.)
+        # Independent of the position
+        self.assertAlmostEqual(mesh_volume(vertices + [100., -50., 20.], faces), 24.)
+
+    def test_inward_orientation_is_negative(self):
+        vertices, faces = box()
+        self.assertAlmostEqual(mesh_volume(vertices, faces[:, ::-1]), -1.)
+
+
+class TestTessellatedVolume(unittest.TestCase):
+    def setUp(self):
+        self.model = ifcopenshell.file(schema="IFC4X3")
+        ifcopenshell.api.root.create_entity(self.model, ifc_class="IfcProject")
+        context = ifcopenshell.api.context.add_context(self.model, context_type="Model")
+        self.body = ifcopenshell.api.context.add_context(self.model, context_type="Model", context_identifier="Body", target_view="MODEL_VIEW", parent=context)
+
+    def element(self, vertices, faces, closed):
+        element = ifcopenshell.api.root.create_entity(self.model, ifc_class="IfcGeotechnicalStratum")
+        representation = IfcUtils.add_triangulated_representation(self.model, context=self.body, vertices=vertices, faces=faces, closed=closed)
+        ifcopenshell.api.geometry.assign_representation(self.model, product=element, representation=representation)
+        return element
+
+    def test_closed(self):
+        vertices, faces = box(2., 3., 4.)
+        self.assertAlmostEqual(tessellated_volume(self.element(vertices, faces, closed=True)), 24.)
+        self.assertAlmostEqual(tessellated_volume(self.element(vertices, faces, closed=True), length_factor=0.1), 0.024)
+
+    def test_not_trusted(self):
+        vertices, faces = box()
+        # Unknown closure, open face set and faces oriented inwards are left to the geometry kernel
+        self.assertIsNone(tessellated_volume(self.element(vertices, faces, closed=None)))
+        self.assertIsNone(tessellated_volume(self.element(vertices, faces[:-2], closed=False)))
+        self.assertIsNone(tessellated_volume(self.element(vertices, faces[:, ::-1], closed=True)))
+        self.assertIsNone(tessellated_volume(ifcopenshell.api.root.create_entity(self.model, ifc_class="IfcGeotechnicalStratum")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from stratigraphy import StratumQuery, project_to_polyline, cross_section, cross_sections
+
+
+class TestStratumQuery(unittest.TestCase):
+    def setUp(self):
+        self.x, self.y = np.mgrid[10:20:0.5, -5:5:1.]
+        # Planar surfaces are reproduced exactly by the bilinear interpolation
+        self.stack = np.stack([100. + 0.1 * self.x - 0.2 * self.y, np.full(self.x.shape, 98.), 95. + 0.3 * self.y, np.full(self.x.shape, 80.)])
+        self.query = StratumQuery(self.x, self.y, self.stack, names=["A", "G", "S"], materials={"A": "Auffuellung", "S": "Sand"})
+
+    def test_surfaces_at(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(10, 19.5, 50), rng.uniform(-5, 4, 50)
+        surfaces = self.query.surfaces_at(x, y)
+        self.assertTrue(np.allclose(surfaces[0], 100. + 0.1 * x - 0.2 * y))
+        self.assertTrue(np.allclose(surfaces[2], 95. + 0.3 * y))
+        self.assertTrue(np.isnan(self.query.surfaces_at([9.9, 15., 19.6], [0., 4.1, 0.])).all())
+
+    def test_query(self):
+        x, y = np.array([12., 12., 12., 12., 12., 30.]), np.zeros(6)
+        z = np.array([101.5, 99., 97., 85., 70., 90.])
+        result = self.query.query(x, y, z)
+        self.assertEqual(result["label"].tolist(), [-1, 0, 1, 2, -1, -1])
+        self.assertEqual(result["name"].tolist(), ["", "A", "G", "S", "", ""])
+        self.assertEqual(result["material"].tolist(), ["", "Auffuellung", "", "Sand", "", ""])
+        self.assertTrue(np.allclose(result["depth"][:5], 101.2 - z[:5]))
+        self.assertTrue(np.allclose(result["to_top"][1:4], [101.2 - 99., 98. - 97., 95. - 85.]))
+        self.assertTrue(np.allclose(result["to_bottom"][1:4], [99. - 98., 97. - 95., 85. - 80.]))
+        self.assertTrue(np.isnan(result["to_top"][[0, 4, 5]]).all())
+        self.assertTrue(np.isnan(result["depth"][5]))
+
+    def test_chunks(self):
+        rng = np.random.default_rng(1)
+        x, y, z = rng.uniform(9, 21, 1000), rng.uniform(-6, 5, 1000), rng.uniform(75, 105, 1000)
+        expected, result = self.query.query(x, y, z), self.query.query(x, y, z, chunk_size=37)
+        for key in expected:
+            self.assertTrue(np.array_equal(expected[key], result[key], equal_nan=expected[key].dtype.kind == "f"), key)
+
+
+def polygon_area(polygon):
+    x, z = polygon.T
+    return 0.5 * abs(np.dot(x, np.roll(z, -1)) - np.dot(z, np.roll(x, -1)))
+
+
+class TestCrossSections(unittest.TestCase):
+    def setUp(self):
+        self.x, self.y = np.mgrid[0:50:1., 0:30:1.]
+        # Layer G pinches out for 20 < x < 30
+        contact = np.where(np.abs(self.x - 25.) < 5., 97., 98.)
+        self.stack = np.stack([np.full(self.x.shape, 100.), np.minimum(contact, 98.), np.full(self.x.shape, 97.), np.full(self.x.shape, 90.)])
+        self.query = StratumQuery(self.x, self.y, self.stack, names=["A", "G", "S"])
+        self.bh_data = [{"Name": name, "x": x, "y": y, "OK": 100., "Layerdata": {"UKs": [2., 3., 10.], "Hauptgruppen": ["A", "G", "S"]}}
+            for name, x, y in [("bh_001", 5., 12.), ("bh_002", 40., 7.), ("bh_003", 30., 25.)]]
+
+    def test_project_to_polyline(self):
+        chainage, offset, distance = project_to_polyline([[5., 12.], [40., 7.], [50., 15.]], [[0., 10.], [45., 10.], [45., 20.]])
+        self.assertTrue(np.allclose(chainage, [5., 40., 50.]))
+        # Positive left of the polyline
+        self.assertTrue(np.allclose(offset, [2., -3., -5.]))
+        self.assertTrue(np.allclose(distance, [2., 3., 5.]))
+
+    def test_section(self):
+        polyline = [[0., 10.], [45., 10.], [45., 20.]]
+        section = cross_section(self.query, polyline, spacing=2., bh_data=self.bh_data, corridor=4.)
+        # Every vertex of the polyline is a sample point
+        self.assertTrue(np.isin([0., 45., 55.], section["chainage"]).all())
+        self.assertTrue(np.allclose(section["x"][section["chainage"] == 55.], 45.))
+        self.assertEqual(len(section["polygons"]["A"]), 1)
+        # Layer G is split where it pinches out, the polygons cover its thickness along the section
+        self.assertEqual(len(section["polygons"]["G"]), 2)
+        chainage, surfaces = section["chainage"], section["surfaces"]
+        for ind, name in enumerate(["A", "G", "S"]):
+            self.assertAlmostEqual(sum(polygon_area(i) for i in section["polygons"][name]), np.trapezoid(surfaces[ind] - surfaces[ind + 1], chainage))
+        self.assertAlmostEqual(polygon_area(section["polygons"]["S"][0]), 7 * 55.)
+        # Only the boreholes within the corridor, ordered by chainage
+        self.assertEqual([i["name"] for i in section["boreholes"]], ["bh_001", "bh_002"])
+        self.assertEqual(section["boreholes"][1]["layers"], [("A", 100., 98.), ("G", 98., 97.), ("S", 97., 90.)])
+        self.assertAlmostEqual(section["boreholes"][1]["offset"], -3.)
+
+    def test_parallel_equals_serial(self):
+        polylines = [[[0., 10.], [45., 10.]], [[5., 0.], [5., 29.]], [[0., 0.], [49., 29.]]]
+        serial = [cross_section(self.query, i, bh_data=self.bh_data) for i in polylines]
+        for processes in (1, 2):
+            with self.subTest(processes=processes):
+                sections = cross_sections(self.query, polylines, bh_data=self.bh_data, processes=processes)
+                for section, expected in zip(sections, serial):
+                    self.assertTrue(np.array_equal(section["surfaces"], expected["surfaces"]))
+                    self.assertEqual([i["name"] for i in section["boreholes"]], [i["name"] for i in expected["boreholes"]])
+                    self.assertEqual({k: len(v) for k, v in section["polygons"].items()}, {k: len(v) for k, v in expected["polygons"].items()})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+from tiledmodelling import make_tiles, interpolate_tiled, read_tile, read_tile_volumes
+from geotmodelling import enforce_conformance, build_stacked_volumes
+from qualityutils import mesh_volume
+
+
+class TestInterpolateTiled(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        xy = rng.uniform(0, 30, size=(40, 2))
+        self.surfaces = [
+            np.column_stack([xy, 10 + np.sin(xy[:, 0] / 5)]),
+            np.column_stack([xy[:25], 8 + 0.1 * xy[:25, 1]]),
+            np.column_stack([xy, np.full(len(xy), 5.)]),
+        ]
+        self.extent = dict(xmin=0, xmax=31, ymin=0, ymax=27)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_tiled(self, name, **kwargs):
+        return interpolate_tiled(self.surfaces, os.path.join(self.tmp.name, name), **self.extent, neighbors=20,
+            names=["A", "B"], rules=["erode", "onlap", "erode"], min_thickness=0.5, **kwargs)
+
+    def test_make_tiles(self):
+        tiles = make_tiles((10, 7), 4, overlap=1)
+        self.assertEqual(tiles[0], (0, 5, 0, 5))
+        self.assertEqual(tiles[-1], (8, 10, 4, 7))
+        # The cores cover every grid point once
+        cover = np.zeros((10, 7), dtype=int)
+        for i0, i1, j0, j1 in tiles:
+            cover[i0:min(i0 + 4, 10), j0:min(j0 + 4, 7)] += 1
+        self.assertTrue((cover == 1).all())
+
+    def test_tiled_equals_single_tile(self):
+        single = self.run_tiled("single.npy", tile_size=1000, processes=1)
+        tiled = self.run_tiled("tiled.npy", tile_size=8, processes=2)
+        self.assertEqual(len(single["tiles"]), 1)
+        self.assertEqual(len(tiled["tiles"]), 16)
+        self.assertLess(np.abs(np.load(tiled["path"]) - np.load(single["path"])).max(), 1e-9)
+
+        # Overlapping tiles read back agree with the stack, the volumes of all tiles add up to the single tile volumes
+        for tile in tiled["tiles"]:
+            i0, i1, j0, j1 = tile
+            x, y, stack = read_tile(tiled, tile)
+            self.assertEqual(stack.shape, (3, i1 - i0, j1 - j0))
+            self.assertTrue((x == np.mgrid[0:31:1, 0:27:1][0][i0:i1, j0:j1]).all())
+        single_volumes = read_tile_volumes(single, single["tiles"][0])
+        for name in ("A", "B"):
+            tiled_volume = sum(mesh_volume(*read_tile_volumes(tiled, tile)[name]) for tile in tiled["tiles"])
+            self.assertAlmostEqual(tiled_volume, mesh_volume(*single_volumes[name]), places=6)
+
+        # The single tile equals conforming and building the volumes of the whole stack
+        x, y = np.mgrid[0:31:1, 0:27:1]
+        conformed = enforce_conformance(np.load(single["path"]), rules=["erode", "onlap", "erode"], min_thickness=0.5)
+        expected = build_stacked_volumes(x, y, conformed, names=["A", "B"])
+        for name in ("A", "B"):
+            self.assertTrue(np.allclose(single_volumes[name][0], expected[name][0]))
+            self.assertTrue((single_volumes[name][1] == expected[name][1]).all())
+
+    def test_without_volumes(self):
+        tiled = interpolate_tiled(self.surfaces, os.path.join(self.tmp.name, "surfaces.npy"), **self.extent, tile_size=10, processes=1)
+        self.assertEqual(tiled["volumes"], {})
+        self.assertEqual(np.load(tiled["path"]).shape, (3, 31, 27))
+        self.assertFalse(np.isnan(np.load(tiled["path"])).any())
+
+
+if __name__ == "__main__":
+    unittest.main()